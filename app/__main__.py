@@ -0,0 +1,168 @@
+"""
+Command line interface for one-shot use, e.g. from cron or a sidecar container.
+
+    python -m app get [ipv4|ipv6]       Prints the stored IPs
+    python -m app fetch [ipv4|ipv6]     Fetches the IPs from IP_SOURCE, stores and prints them
+    python -m app stats [--human]       Prints the WAN statistics of the FritzBox
+    python -m app refresh [ipv4|ipv6]   Forces a new public IP and prints the IPs after the reconnect
+
+The IPs are printed as JSON, or as the bare address if ipv4 or ipv6 is given. With --no-db the database
+is not used: `get` reads the warm start file of the service, `fetch` and `refresh` only print the IPs.
+Every command imports only the modules it needs (never FastAPI or uvicorn, and SQLAlchemy only for the
+database), so it starts in a fraction of the time of the API server (see benchmarks/bench_cli_startup.py).
+Logs go to stderr, only warnings and errors unless --verbose is given. The API server is started with
+`python -m app.main`.
+"""
+import sys
+import json
+import logging
+import argparse
+from app.utils.logger import logger, handler
+
+def print_ips(ipv4, ipv6, version=None):
+    """
+    Prints the IPs as JSON, or only the address of `version` ("ipv4" or "ipv6").
+
+    Returns:
+        int: The exit code, 1 if there is no address to print.
+    """
+    if version is None:
+        print(json.dumps({"ipv4": ipv4, "ipv6": ipv6}))
+        return 0 if ipv4 or ipv6 else 1
+    address = ipv4 if version == "ipv4" else ipv6
+    if not address:
+        logger.error("No %s address known.", version)
+        return 1
+    print(address)
+    return 0
+
+def run(coroutine_function):
+    """
+    Runs a coroutine function on a new event loop and closes the HTTP clients afterwards.
+    """
+    import asyncio
+
+    async def main():
+        from app.fritzbox.client import fritzbox_client
+        from app.utils.http_client import close_http_client
+        try:
+            return await coroutine_function()
+        finally:
+            await close_http_client()
+            await fritzbox_client.aclose()
+
+    return asyncio.run(main())
+
+def store(ipv4, ipv6):
+    """
+    Stores fetched IPs like the fetch loop does, a running service serves them after its next fetch.
+    """
+    from app.database.write_behind import write_behind
+    from app.ip_fetcher.service_scoreboard import scoreboard
+    from app.utils.ip_fetch_and_store import store_ips
+
+    store_ips(ipv4, ipv6)
+    scoreboard.persist(True)
+    write_behind.stop()
+
+def prepare_fetch(args):
+    if args.no_db:
+        from app.ip_fetcher.service_scoreboard import restore_scoreboard
+        restore_scoreboard({})  # Rank the public IP services without their persisted scores
+    else:
+        from app.database.database import init_db
+        init_db()  # The scores of the public IP services are loaded before the fetch
+
+def command_get(args):
+    if args.no_db:
+        from app.utils.warm_start import read_warm_start
+        state = read_warm_start()
+        if state is None:
+            logger.error("No warm start file, is the service running in this directory?")
+            return 1
+        snapshot = state["snapshot"]
+        return print_ips(snapshot["ipv4"], snapshot["ipv6"], args.version)
+
+    from app.utils.ip_snapshot import read_db_snapshot
+    snapshot = read_db_snapshot()
+    if snapshot is None:
+        return 1  # Logged by read_db_snapshot
+    return print_ips(snapshot.ipv4, snapshot.ipv6, args.version)
+
+def command_fetch(args):
+    from app.ip_fetcher.ip_fetcher import fetch_ips
+
+    prepare_fetch(args)
+    ipv4, ipv6 = run(fetch_ips)
+    if not args.no_db:
+        store(ipv4, ipv6)
+    return print_ips(ipv4, ipv6, args.version)
+
+def command_stats(args):
+    from app.fritzbox.get_wan_statistics import fetch_wan_sample, format_wan_statistics
+
+    sample = run(fetch_wan_sample)
+    print(json.dumps(format_wan_statistics(sample, args.human)))
+    return 0
+
+def command_refresh(args):
+    from app.fritzbox.get_wan_statistics import get_connection_status
+    from app.fritzbox.ip_renewer import refresh_public_ip, wait_for_reconnect
+    from app.ip_fetcher.ip_fetcher import fetch_ips
+
+    async def refresh():
+        try:
+            _, previous_uptime = await get_connection_status()
+        except Exception as e:
+            logger.warning("Could not read the connection status before the refresh: %s", e)
+            previous_uptime = None
+        if not await refresh_public_ip():
+            raise RuntimeError("Failed to force public IP refresh")
+        if not await wait_for_reconnect(previous_uptime):
+            logger.warning("Reconnect not detected in time, fetching the IPs anyway.")
+        return await fetch_ips()
+
+    prepare_fetch(args)
+    ipv4, ipv6 = run(refresh)
+    if not args.no_db:
+        store(ipv4, ipv6)
+    return print_ips(ipv4, ipv6, args.version)
+
+COMMANDS = {
+    "get": command_get,
+    "fetch": command_fetch,
+    "stats": command_stats,
+    "refresh": command_refresh,
+}
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m app", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log at LOG_LEVEL instead of warnings only")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, description in (
+        ("get", "Print the stored IPs"),
+        ("fetch", "Fetch the IPs from IP_SOURCE, store and print them"),
+        ("refresh", "Force a new public IP (FritzBox only) and print the IPs after the reconnect"),
+    ):
+        command = commands.add_parser(name, help=description)
+        command.add_argument("version", nargs="?", choices=("ipv4", "ipv6"), help="Print only this address")
+        command.add_argument("--no-db", action="store_true", help="Don't use the database")
+    stats = commands.add_parser("stats", help="Print the WAN statistics of the FritzBox")
+    stats.add_argument("--human", action="store_true", help="Human-readable values")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    handler.setStream(sys.stderr)  # Keep stdout for the output
+    if not args.verbose:
+        logger.setLevel(max(logger.level, logging.WARNING))
+    try:
+        return COMMANDS[args.command](args)
+    except Exception as e:
+        logger.error("%s failed: %s", args.command, e)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,90 @@
-import os
+import io
+import csv
+import json
 import time
-from fastapi import FastAPI, Depends, HTTPException, Query
+import asyncio
+from datetime import datetime
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, Depends, HTTPException, Query, Header, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from sqlalchemy.orm import Session
-from app.utils.env_vars import ENABLE_REFRESH_IP_ENDPOINT, RATE_LIMIT_IP_RENEWAL
-from app.database.database import SessionLocal, init_db, IPAddress
-from app.fritzbox.ip_renewer import refresh_public_ip
-from app.utils.ip_fetch_and_store import fetch_and_store_ips
+from app.utils.env_vars import ENABLE_REFRESH_IP_ENDPOINT, RATE_LIMIT_IP_RENEWAL, IP_SOURCE, WAN_SAMPLE_INTERVAL, SSE_KEEPALIVE_INTERVAL, TARGETS_FILE, WORKERS, UPSTREAM_URL
+from app.database.database import SessionLocal
+from app.database.write_behind import write_behind
+from app.database.ip_history import get_history_page, iter_history, history_to_dict
+from app.api.conditional import conditional_json_response
+from app.api.middleware import MetricsMiddleware, UpstreamProxyMiddleware
+from app.fritzbox.refresh_jobs import start_refresh_job, get_refresh_job, get_last_refresh_time
+from app.utils.ip_snapshot import get_snapshot, load_snapshot
+from app.utils.ip_events import wait_for_ip_change
+from app.utils.leader import lead_or_follow, is_leader
+from app.utils.health import get_liveness, get_readiness
+from app.utils.warm_start import load_warm_start, save_warm_start
+from app.utils.replica import sync_from_upstream
 from app.fritzbox.get_wan_statistics import get_wan_statistics
+from app.fritzbox.wan_sampler import wan_history, sample_wan_periodically
+from app.utils.http_client import close_http_client
+from app.ip_fetcher.service_scoreboard import scoreboard
+from app.fritzbox.client import fritzbox_client
+from app.utils.webhooks import webhook_dispatcher
+from app.utils.scheduler import fetch_ips_periodically, fetch_targets_periodically
+from app.fritzbox.targets import targets, init_targets, get_target, fetch_target
+from app.utils.metrics import REGISTRY
 
-last_refresh_time = 0
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Runs the periodic IP fetch loop (and the WAN sampler and the target fetch loop, if enabled) on the server's event loop for the lifetime of the app.
+    With several workers only the fetch leader runs them, the other workers serve the leader's results.
+    In replica mode (UPSTREAM_URL) the IPs are synced from the upstream instance instead.
+    The state of the last run is restored from the warm start file first, before the server accepts connections.
+    Without one, the stored IPs are loaded from the database, so the endpoints never query it.
+    """
+    await asyncio.to_thread(load_warm_start)
+    await asyncio.to_thread(load_snapshot)
+    if TARGETS_FILE and not UPSTREAM_URL:
+        await asyncio.to_thread(init_targets, TARGETS_FILE)  # An invalid targets file stops the startup
+
+    tasks = []
 
-app = FastAPI()
+    def start_fetching():
+        if UPSTREAM_URL:
+            # Replica mode: the upstream fetches, the requests that need the FritzBox are forwarded to it
+            tasks.append(asyncio.create_task(sync_from_upstream()))
+            return
+        tasks.append(asyncio.create_task(fetch_ips_periodically()))
+        if IP_SOURCE == "fritzbox" and WAN_SAMPLE_INTERVAL > 0:
+            tasks.append(asyncio.create_task(sample_wan_periodically()))
+        if targets:
+            tasks.append(asyncio.create_task(fetch_targets_periodically(list(targets.values()), fetch_target)))
+
+    if WORKERS > 1:
+        tasks.append(asyncio.create_task(lead_or_follow(start_fetching)))
+    else:
+        start_fetching()
+    webhook_dispatcher.start()
+    try:
+        yield
+    finally:
+        await webhook_dispatcher.stop()
+        for task in tasks:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        await close_http_client()
+        await fritzbox_client.aclose()
+        scoreboard.persist(True)
+        if is_leader():
+            await asyncio.to_thread(save_warm_start)
+        await asyncio.to_thread(write_behind.stop)
+
+# Endpoints a replica forwards to its upstream, because they need the FritzBox
+UPSTREAM_PATHS = ("/refresh-public-ip", "/wan-stats", "/fritzbox", "/targets")
+
+app = FastAPI(lifespan=lifespan)
+if UPSTREAM_URL:
+    app.add_middleware(UpstreamProxyMiddleware, upstream_url=UPSTREAM_URL, paths=UPSTREAM_PATHS, routes=app.routes)
+app.add_middleware(MetricsMiddleware)
 
 # Dependency for DB session
 def get_db():
@@ -20,57 +94,179 @@ def get_db():
     finally:
         db.close()
 
+def ips_content(snapshot):
+    if not snapshot.ipv4:  # Handle the case when there are no IPs stored yet
+        return {"message": "No IP addresses found", "data": []}
+
+    # Handle the case where the IPv6 might be missing
+    return [{"ipv4": snapshot.ipv4, "ipv6": snapshot.ipv6 if snapshot.ipv6 else "N/A"}]
+
+def ipv4_content(snapshot):
+    if snapshot.ipv4:
+        return {"ipv4": snapshot.ipv4}
+    return {"error": "IPv4 address not found"}
+
+def ipv6_content(snapshot):
+    if snapshot.ipv6:
+        return {"ipv6": snapshot.ipv6}
+    return {"error": "IPv6 address not found"}
+
 # Endpoint to get all IPs
 @app.get("/ips")
-def get_ips(db: Session = Depends(get_db)):
+async def get_ips(request: Request):
     """
     Returns all stored IP addresses (IPv4 and IPv6 only) as a list.
     If no entries are found, returns an empty list.
+    Served from the in-memory IP snapshot, no database access. Supports conditional requests (ETag/Last-Modified).
     """
-    ips = db.query(IPAddress.ipv4, IPAddress.ipv6).all()
-
-    if not ips:  # Handle the case when there are no IPs in the database
-        return {"message": "No IP addresses found", "data": []}
-
-    # Handle the case where some entries might have missing fields
-    return [{"ipv4": ipv4, "ipv6": ipv6 if ipv6 else "N/A"} for ipv4, ipv6 in ips]
+    return conditional_json_response(request, "ips", ips_content)
 
 # Endpoint to get the current IPv4
 @app.get("/ipv4")
-def get_ipv4(db: Session = Depends(get_db)):
+async def get_ipv4(request: Request):
     """
     Returns the current IPv4 address.
     """
-    entry = db.query(IPAddress).first()
-    if entry and entry.ipv4:
-        return {"ipv4": entry.ipv4}
-    return {"error": "IPv4 address not found"}
+    return conditional_json_response(request, "ipv4", ipv4_content)
 
 # Endpoint to get the current IPv6
 @app.get("/ipv6")
-def get_ipv6(db: Session = Depends(get_db)):
+async def get_ipv6(request: Request):
     """
     Returns the current IPv6 address.
     """
-    entry = db.query(IPAddress).first()
-    if entry and entry.ipv6:
-        return {"ipv6": entry.ipv6}
-    return {"error": "IPv6 address not found"}
+    return conditional_json_response(request, "ipv6", ipv6_content)
+
+# Endpoint to get the IP history
+@app.get("/ips/history")
+def get_ip_history(
+    since: datetime = Query(None),
+    until: datetime = Query(None),
+    cursor: str = Query(None),
+    limit: int = Query(100, gt=0, le=1000),
+    db: Session = Depends(get_db),
+):
+    """
+    Returns the IP changes, newest first, optionally limited to `since <= changed_at < until`.
+    Pass the returned `next_cursor` as `cursor` to get the next page.
+    """
+    try:
+        entries, next_cursor = get_history_page(db, since, until, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # The rows are plain JSON types already, serialize directly instead of through FastAPI's generic encoder
+    content = {"data": [history_to_dict(entry) for entry in entries], "next_cursor": next_cursor}
+    return Response(content=json.dumps(content), media_type="application/json")
+
+# Endpoint to export the IP history
+@app.get("/ips/history/export")
+def export_ip_history(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    since: datetime = Query(None),
+    until: datetime = Query(None),
+):
+    """
+    Streams the IP history, oldest first, as NDJSON or CSV. The rows are read and sent in batches,
+    so the export never holds the full table in memory.
+    """
+    if format == "csv":
+        return StreamingResponse(
+            export_history_csv(since, until),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="ip-history.csv"'},
+        )
+    return StreamingResponse(export_history_ndjson(since, until), media_type="application/x-ndjson")
+
+def export_history_ndjson(since, until, chunk_size=1000):
+    lines = []
+    for entry in iter_history(since, until, chunk_size):
+        lines.append(json.dumps(history_to_dict(entry)) + "\n")
+        if len(lines) >= chunk_size:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+def export_history_csv(since, until, chunk_size=1000):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["id", "changed_at", "ipv4", "ipv6"])
+    rows = 0
+    for entry in iter_history(since, until, chunk_size):
+        row = history_to_dict(entry)
+        writer.writerow([row["id"], row["changed_at"], row["ipv4"] or "", row["ipv6"] or ""])
+        rows += 1
+        if rows % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+# Push IP changes to clients
+@app.get("/ips/watch")
+async def watch_ips(
+    since: int = Query(None, ge=0),
+    timeout: float = Query(30, gt=0, le=300),
+    last_event_id: str = Header(None),
+):
+    """
+    Streams IP changes as Server-Sent Events. Each event carries the snapshot version as its id.
+
+    With `?since=<version>` the endpoint long-polls instead: it answers as soon as the IPs differ from
+    the given version, or after `timeout` seconds with `changed: false`.
+    """
+    if since is not None:
+        snapshot = await wait_for_ip_change(since, timeout)
+        return {"changed": snapshot.version != since, **ip_event_data(snapshot)}
+
+    return StreamingResponse(
+        stream_ip_changes(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def ip_event_data(snapshot):
+    return {
+        "version": snapshot.version,
+        "ipv4": snapshot.ipv4,
+        "ipv6": snapshot.ipv6 if snapshot.ipv6 else "N/A",
+        "updated_at": snapshot.updated_at,
+    }
+
+async def stream_ip_changes(last_event_id=None):
+    """
+    Yields the current IPs and then every change as SSE messages, with keep-alive comments in between.
+
+    Every send waits for the client, and each message carries the latest snapshot only, so a slow client
+    skips intermediate versions instead of piling up a backlog.
+    """
+    snapshot = get_snapshot()
+    if last_event_id != str(snapshot.version):  # Reconnecting clients that are up to date get no duplicate
+        yield f"id: {snapshot.version}\nevent: ips\ndata: {json.dumps(ip_event_data(snapshot))}\n\n"
+    version = snapshot.version
+
+    while True:
+        snapshot = await wait_for_ip_change(version, SSE_KEEPALIVE_INTERVAL)
+        if snapshot.version == version:
+            yield ": keep-alive\n\n"
+            continue
+        version = snapshot.version
+        yield f"id: {snapshot.version}\nevent: ips\ndata: {json.dumps(ip_event_data(snapshot))}\n\n"
 
 # Force new external IP (FritzBox only)
 @app.get("/refresh-public-ip")
-async def trigger_refresh_public_ip(db: Session = Depends(get_db)):
+async def trigger_refresh_public_ip():
     """
     Forces a new public IP if enabled via environment variable.
     Only allows one call every RATE_LIMIT_IP_RENEWAL seconds globally.
+    Returns 202 with a job id right away, the refresh itself runs in the background.
     """
-    global last_refresh_time
-
     if not ENABLE_REFRESH_IP_ENDPOINT:
         raise HTTPException(status_code=403, detail="This endpoint is disabled by configuration.")
 
-    # Check the rate limit
+    # Check the rate limit, the time of the last refresh is shared by all workers
     current_time = time.time()
+    last_refresh_time = await get_last_refresh_time()
     if current_time - last_refresh_time < RATE_LIMIT_IP_RENEWAL:
         remaining_time = RATE_LIMIT_IP_RENEWAL - (current_time - last_refresh_time)
         raise HTTPException(
@@ -78,28 +274,139 @@ async def trigger_refresh_public_ip(db: Session = Depends(get_db)):
             detail=f"Rate limit exceeded. Please wait {int(remaining_time)} seconds before retrying.",
         )
 
-    # Update the last refresh time
-    last_refresh_time = current_time
-
-    response = refresh_public_ip()
-    if response:
-        time.sleep(20) # Give the Router some time to get a new public IP
-        fetch_and_store_ips()
-        ips = db.query(IPAddress.ipv4, IPAddress.ipv6).all()
-        return {
-            "message": "Refreshed public IP successfully",
-            "data": [{"ipv4": ipv4, "ipv6": ipv6 if ipv6 else "N/A"} for ipv4, ipv6 in ips],
-        }
-    else:
-        return {"message": "Failed to force public IP refresh"}
-    
+    # Run the refresh in the background, the client polls the job status
+    job = await start_refresh_job()
+    return JSONResponse(
+        status_code=202,
+        content={**job.to_dict(), "status_url": f"/refresh-public-ip/{job.id}"},
+        headers={"Location": f"/refresh-public-ip/{job.id}"},
+    )
+
+# Status of a public IP refresh (FritzBox only)
+@app.get("/refresh-public-ip/{job_id}")
+async def get_refresh_public_ip_status(job_id: str):
+    """
+    Returns the status of a public IP refresh started via /refresh-public-ip.
+    Once the job is finished, `data` contains the new IPs.
+    """
+    job = await get_refresh_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Refresh job not found.")
+    return job.to_dict()
+
 # Endpoint to get the current IPv6
 @app.get("/wan-stats")
-def get_wan_stats(format: str = Query(None)):
+async def get_wan_stats(format: str = Query(None)):
     """
     Returns WAN related Statistics from the FritzBox
     """
     if format is not None:
-        return get_wan_statistics(True)
+        return await get_wan_statistics(True)
     
-    return get_wan_statistics()
\ No newline at end of file
+    return await get_wan_statistics()
+
+# Endpoint to get the WAN throughput history
+@app.get("/wan-stats/history")
+async def get_wan_stats_history(window: int = Query(None, gt=0), buckets: int = Query(60, gt=0, le=1000)):
+    """
+    Returns the upload and download rates of the FritzBox over time, aggregated into buckets (min/avg/max per bucket).
+    The rates are calculated from the byte counters sampled every WAN_SAMPLE_INTERVAL seconds.
+
+    Args:
+        window (int): Only include the last `window` seconds. Defaults to the whole history.
+        buckets (int): The number of buckets to aggregate the rates into.
+    """
+    return {
+        "sample_interval_seconds": WAN_SAMPLE_INTERVAL,
+        "samples": len(wan_history),
+        "buckets": wan_history.downsample(window, buckets),
+    }
+
+# Endpoint to get the FritzBox request latencies
+@app.get("/fritzbox/latency")
+async def get_fritzbox_latency():
+    """
+    Returns request count, error count and latency (in seconds) per FritzBox SOAP action.
+    """
+    return fritzbox_client.get_latency_stats()
+
+# Endpoint to get the state of the FritzBox circuit breaker
+@app.get("/fritzbox/breaker")
+async def get_fritzbox_breaker():
+    """
+    Returns the state of the FritzBox circuit breaker (closed, open or half_open) and its last transitions.
+    """
+    return fritzbox_client.breaker.to_dict()
+
+# Liveness probe
+@app.get("/healthz")
+async def get_healthz():
+    """
+    Returns 200 while the background loop of this worker (IP fetch, replica sync or following the leader)
+    keeps cycling, 503 if it is overdue by more than LIVENESS_GRACE seconds.
+    """
+    alive, details = get_liveness()
+    return JSONResponse(status_code=200 if alive else 503, content=details)
+
+# Readiness probe
+@app.get("/readyz")
+async def get_readyz():
+    """
+    Returns 200 if an IPv4 address is known and was confirmed within MAX_STALENESS seconds, 503 otherwise.
+    After a restart this is the case right away if the warm start file is recent enough.
+    """
+    ready, details = get_readiness(get_snapshot())
+    return JSONResponse(status_code=200 if ready else 503, content=details)
+
+# Endpoint to list the monitored targets
+@app.get("/targets")
+async def get_targets():
+    """
+    Returns all targets of the TARGETS_FILE with their current IPs and the time of the last change and fetch.
+    """
+    return [target.to_dict() for target in targets.values()]
+
+def get_target_or_404(target_id):
+    target = get_target(target_id)
+    if target is None:
+        raise HTTPException(status_code=404, detail="Target not found.")
+    return target
+
+# Endpoint to get the current IPv4 of a target
+@app.get("/targets/{target_id}/ipv4")
+async def get_target_ipv4(target_id: str):
+    """
+    Returns the current IPv4 address of a target.
+    """
+    target = get_target_or_404(target_id)
+    if target.ipv4:
+        return {"ipv4": target.ipv4}
+    return {"error": "IPv4 address not found"}
+
+# Endpoint to get the current IPv6 of a target
+@app.get("/targets/{target_id}/ipv6")
+async def get_target_ipv6(target_id: str):
+    """
+    Returns the current IPv6 address of a target.
+    """
+    target = get_target_or_404(target_id)
+    if target.ipv6:
+        return {"ipv6": target.ipv6}
+    return {"error": "IPv6 address not found"}
+
+# Endpoint to get the WAN statistics of a target
+@app.get("/targets/{target_id}/wan-stats")
+async def get_target_wan_stats(target_id: str, format: str = Query(None)):
+    """
+    Returns WAN related statistics of a target, cached for WAN_STATS_TTL seconds like /wan-stats.
+    """
+    target = get_target_or_404(target_id)
+    return await get_wan_statistics(format is not None, target.wan_stats)
+
+# Endpoint for Prometheus
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Returns the latency histograms, counters and gauges of the fetch paths and the API in the Prometheus text format.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,81 @@
+import json
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import Request, Response
+from app.utils.env_vars import UPDATE_INTERVAL, MAX_STALENESS
+from app.utils.health import get_data_age
+from app.utils.ip_snapshot import get_snapshot
+
+# The IPs can't change between two fetches, so clients and proxies may reuse a response for one interval
+CACHE_CONTROL = f"public, max-age={UPDATE_INTERVAL}"
+
+# Rendered body and ETag per endpoint, reused until a new snapshot is published
+_rendered = {}
+
+def render(key, build):
+    """
+    Returns the JSON body and strong ETag of an endpoint for the current snapshot.
+    The body is only serialized once per snapshot.
+
+    Args:
+        key (str): Cache key of the endpoint.
+        build (callable): Builds the JSON content from an IPSnapshot.
+
+    Returns:
+        tuple: The snapshot, the encoded body and the ETag.
+    """
+    snapshot = get_snapshot()
+    cached = _rendered.get(key)
+    if cached is None or cached[0] is not snapshot:
+        body = json.dumps(build(snapshot), separators=(",", ":")).encode("utf-8")
+        # A content hash stays the same across restarts and processes, unlike the snapshot version
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        cached = _rendered[key] = (snapshot, body, etag)
+    return cached
+
+def is_not_modified(request, etag, last_modified):
+    """
+    Evaluates If-None-Match (preferred) and If-Modified-Since against the current representation.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return etag in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def conditional_json_response(request: Request, key, build):
+    """
+    Builds a JSON response for the current IP snapshot with ETag, Last-Modified and Cache-Control headers.
+    Returns a body-less 304 if the client already has the current representation.
+    X-Data-Age tells the seconds since the IPs were last confirmed, X-Data-Stale whether that is longer
+    than MAX_STALENESS. They are headers, so the body and its ETag stay the same while the IPs do.
+
+    Args:
+        request (Request): The incoming request.
+        key (str): Cache key of the endpoint.
+        build (callable): Builds the JSON content from an IPSnapshot.
+
+    Returns:
+        Response: 200 with the JSON body, or 304 without body.
+    """
+    snapshot, body, etag = render(key, build)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if snapshot.updated_at:
+        headers["Last-Modified"] = formatdate(snapshot.updated_at, usegmt=True)
+    age = get_data_age()
+    if age is not None:
+        headers["X-Data-Age"] = str(int(age))
+    headers["X-Data-Stale"] = "true" if age is None or age > MAX_STALENESS else "false"
+
+    if is_not_modified(request, etag, snapshot.updated_at):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,96 @@
+import json
+import time
+import httpx
+from starlette.routing import Match
+from app.utils.env_vars import UPSTREAM_TIMEOUT
+from app.utils.http_client import get_http_client
+from app.utils.metrics import Histogram
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "wan_ip_http_request_seconds", "Latency of API requests until the response starts.", ["method", "route", "status"]
+)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that records the latency of every HTTP request.
+
+    Requests are labeled with the route template (e.g. "/refresh-public-ip/{job_id}") instead of the raw path,
+    so the number of label combinations stays bounded. The time is taken when the response starts, which keeps
+    long-lived streams (SSE, exports) from distorting the histogram.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                HTTP_REQUEST_SECONDS.observe(
+                    time.perf_counter() - start,
+                    scope["method"],
+                    route.path if route is not None else "unmatched",
+                    message["status"],
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+class UpstreamProxyMiddleware:
+    """
+    ASGI middleware of the replica mode that forwards the requests needing the FritzBox to the upstream instance.
+
+    Only the upstream talks to the router, the replica serves the IPs and the history from its own copy.
+    A forwarded request is matched against the routes of the app first, so the metrics label it with
+    its route template like a local request.
+    """
+
+    # Request headers passed to the upstream, and response headers passed back to the client
+    REQUEST_HEADERS = ("accept", "if-none-match", "if-modified-since")
+    RESPONSE_HEADERS = ("content-type", "location", "etag", "last-modified", "cache-control", "retry-after")
+
+    def __init__(self, app, upstream_url, paths, routes):
+        self.app = app
+        self.upstream_url = upstream_url.rstrip("/")
+        self.paths = tuple(paths)
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            return await self.app(scope, receive, send)
+
+        for route in self.routes:
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                scope.update(child_scope)
+                break
+
+        headers = {}
+        for name, value in scope["headers"]:
+            name = name.decode("latin-1")
+            if name in self.REQUEST_HEADERS:
+                headers[name] = value.decode("latin-1")
+        url = self.upstream_url + scope["path"]
+        if scope["query_string"]:
+            url += "?" + scope["query_string"].decode("latin-1")
+
+        try:
+            response = await get_http_client().request(scope["method"], url, headers=headers, timeout=UPSTREAM_TIMEOUT)
+            status, body = response.status_code, response.content
+            response_headers = [
+                (name.encode("latin-1"), response.headers[name].encode("latin-1"))
+                for name in self.RESPONSE_HEADERS if name in response.headers
+            ]
+        except httpx.HTTPError as e:
+            status = 502
+            body = json.dumps({"detail": f"Upstream not reachable: {str(e) or type(e).__name__}"}).encode("utf-8")
+            response_headers = [(b"content-type", b"application/json")]
+
+        response_headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        await send({"type": "http.response.start", "status": status, "headers": response_headers})
+        await send({"type": "http.response.body", "body": body})
@@ -1,9 +1,11 @@
-from sqlalchemy import create_engine, Column, String, Integer, DateTime, Index
+from sqlalchemy import create_engine, event, Column, String, Integer, Float, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from sqlalchemy import func
 from datetime import datetime
 from app.utils.logger import logger
+from app.utils.env_vars import DB_POOL_SIZE, DB_MMAP_SIZE, DB_CACHE_SIZE
 
 Base = declarative_base()
 
@@ -16,15 +18,73 @@ class IPAddress(Base):
     # Index on ipv6 if you will frequently query by it
     __table_args__ = (Index('ix_ip_addresses_ipv6', 'ipv6'),)
 
-class FailedService(Base):
-    __tablename__ = "failed_services"
+class IPHistory(Base):
+    __tablename__ = "ip_history"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    service_name = Column(String, nullable=False, index=True)
-    timestamp = Column(DateTime, default=func.now())
+    changed_at = Column(DateTime, nullable=False)  # UTC
+    ipv4 = Column(String, nullable=True)
+    ipv6 = Column(String, nullable=True)
+
+    # Covering index for time range queries, pages are served from the index alone
+    __table_args__ = (Index('ix_ip_history_changed_at', 'changed_at', 'id', 'ipv4', 'ipv6'),)
+
+class ServiceScore(Base):
+    __tablename__ = "service_scores"
+    service_name = Column(String, primary_key=True)
+    latency = Column(Float, nullable=True)  # EWMA of the response time in seconds
+    success_rate = Column(Float, nullable=False, default=1.0)  # EWMA of successful requests
+    consecutive_failures = Column(Integer, nullable=False, default=0)
+    cooldown_until = Column(Float, nullable=False, default=0.0)  # Unix timestamp
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+class TargetIP(Base):
+    __tablename__ = "target_ips"
+    target_id = Column(String, primary_key=True)  # Id of the target in the targets file
+    ipv4 = Column(String, nullable=True)
+    ipv6 = Column(String, nullable=True)
+    changed_at = Column(DateTime, nullable=True)  # UTC
+
+class RefreshJobRecord(Base):
+    __tablename__ = "refresh_jobs"
+    id = Column(String, primary_key=True)
+    status = Column(String, nullable=False)
+    message = Column(String, nullable=False)
+    created_at = Column(Float, nullable=False, index=True)  # Unix timestamp
+    finished_at = Column(Float, nullable=True)  # Unix timestamp
+    data = Column(String, nullable=True)  # The new IPs as JSON
 
 # Database configuration
 DATABASE_URL = "sqlite:///./data/wan-ip-provider.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+# Connections are shared between the event loop, the API thread pool and the background writer.
+# The overflow covers bursts of sync API handlers beyond the pool size.
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_POOL_SIZE * 2,
+    pool_timeout=10,
+)
+
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Tunes every new SQLite connection.
+
+    WAL lets readers continue while a write is in progress, and synchronous=NORMAL only syncs on
+    checkpoints in WAL mode, which keeps the database consistent but may lose the last commits on a
+    power loss. The IPs are fetched again on the next start, so that is acceptable here.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE}")  # Negative values are KiB instead of pages
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def init_db():
@@ -32,4 +92,4 @@ def init_db():
         Base.metadata.create_all(bind=engine)
         logger.info("Database initialized successfully.")
     except Exception as e:
-        logger.error(f"Error initializing the database: {e}")
+        logger.error("Error initializing the database: %s", e)
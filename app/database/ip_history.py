@@ -0,0 +1,113 @@
+import json
+import base64
+from datetime import datetime, timezone
+from sqlalchemy import tuple_
+from app.database.database import SessionLocal, IPHistory
+
+# Plain column rows instead of ORM entities, all of them are served from the covering index
+HISTORY_COLUMNS = (IPHistory.id, IPHistory.changed_at, IPHistory.ipv4, IPHistory.ipv6)
+
+def utcnow():
+    """
+    Returns the current UTC time as naive datetime, the way it is stored in SQLite.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def to_utc(value):
+    """
+    Converts an aware datetime to a naive UTC datetime, naive datetimes are taken as UTC.
+    """
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def encode_cursor(entry):
+    """
+    Encodes the position after a history entry as an opaque cursor string.
+    """
+    raw = json.dumps([entry.changed_at.isoformat(), entry.id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor created by `encode_cursor`.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        changed_at, entry_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(changed_at), int(entry_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def history_to_dict(entry):
+    return {
+        "id": entry.id,
+        "changed_at": entry.changed_at.isoformat() + "Z",
+        "ipv4": entry.ipv4,
+        "ipv6": entry.ipv6,
+    }
+
+def filter_history(query, since=None, until=None):
+    """
+    Restricts a history query to `since <= changed_at < until`.
+    """
+    if since is not None:
+        query = query.filter(IPHistory.changed_at >= to_utc(since))
+    if until is not None:
+        query = query.filter(IPHistory.changed_at < to_utc(until))
+    return query
+
+def get_history_page(db, since=None, until=None, cursor=None, limit=100):
+    """
+    Returns one page of the IP history, newest first.
+
+    Uses keyset pagination on (changed_at, id), so every page costs the same, no matter how deep it is.
+
+    Args:
+        db (Session): The database session.
+        since (datetime): Only include changes at or after this time.
+        until (datetime): Only include changes before this time.
+        cursor (str): The `next_cursor` of the previous page.
+        limit (int): The maximum number of entries.
+
+    Returns:
+        tuple: The entries (rows with id, changed_at, ipv4 and ipv6) of the page and the cursor of the next page (None on the last page).
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    query = filter_history(db.query(*HISTORY_COLUMNS), since, until)
+    if cursor:
+        query = query.filter(tuple_(IPHistory.changed_at, IPHistory.id) < decode_cursor(cursor))
+
+    # Fetch one more row than requested to find out if there is a next page
+    entries = query.order_by(IPHistory.changed_at.desc(), IPHistory.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(entries[limit - 1]) if len(entries) > limit else None
+    return entries[:limit], next_cursor
+
+def iter_history(since=None, until=None, batch_size=1000):
+    """
+    Iterates over the IP history, oldest first, in batches of `batch_size` rows.
+    Each batch is a separate keyset query, so the full table is never held in memory.
+
+    Yields:
+        Row: The history entries with id, changed_at, ipv4 and ipv6.
+    """
+    last = None
+    while True:
+        db = SessionLocal()
+        try:
+            query = filter_history(db.query(*HISTORY_COLUMNS), since, until)
+            if last is not None:
+                query = query.filter(tuple_(IPHistory.changed_at, IPHistory.id) > last)
+            batch = query.order_by(IPHistory.changed_at, IPHistory.id).limit(batch_size).all()
+        finally:
+            db.close()
+
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        last = (batch[-1].changed_at, batch[-1].id)
@@ -0,0 +1,119 @@
+import atexit
+import threading
+from app.database.database import SessionLocal
+from app.utils.env_vars import DB_WRITE_INTERVAL
+from app.utils.logger import logger
+
+class WriteBehind:
+    """
+    Batches small database writes and commits them from a single background thread.
+
+    Callers hand over a write function and return immediately. The pending writes are committed together
+    in one transaction at most `interval` seconds later, so the API never waits for them and SQLite
+    sees one writer instead of many small competing transactions. Writes submitted under the same key
+    replace each other, only the latest one is committed.
+    """
+
+    def __init__(self, interval=DB_WRITE_INTERVAL):
+        self.interval = interval
+        self._pending = {}  # key -> write(session), in submit order
+        self._condition = threading.Condition()
+        self._submitted = 0  # Number of submits so far
+        self._committed = 0  # Number of submits whose writes are committed (or replaced)
+        self._thread = None
+        self._stopping = False
+        self._flush_requested = False
+
+    def submit(self, key, write):
+        """
+        Queues a write for the next batch.
+
+        Args:
+            key (hashable): Identifies the written record. A pending write with the same key is replaced.
+            write (callable): Called with a Session inside the batch transaction, must not commit.
+        """
+        with self._condition:
+            self._pending.pop(key, None)  # Move the key to the end, so the batch keeps the submit order
+            self._pending[key] = write
+            self._submitted += 1
+            if self._thread is None:
+                self._start()
+            self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Commits the pending writes right away and waits until all writes submitted so far are committed.
+
+        Returns:
+            bool: False if the writes were not committed within `timeout` seconds.
+        """
+        with self._condition:
+            target = self._submitted
+            if self._committed < target:
+                self._flush_requested = True
+                self._condition.notify_all()
+            return self._condition.wait_for(lambda: self._committed >= target or self._thread is None, timeout)
+
+    def stop(self, timeout=10):
+        """
+        Commits the pending writes and stops the background thread.
+        """
+        with self._condition:
+            thread = self._thread
+            if thread is None:
+                return
+            self._stopping = True
+            self._condition.notify_all()
+        thread.join(timeout)
+
+    def _start(self):
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # Sleep until there is something to write, then collect writes for one interval (cut short by flush or stop)
+                self._condition.wait_for(lambda: self._pending or self._stopping)
+                self._condition.wait_for(lambda: self._stopping or self._flush_requested, self.interval)
+                self._flush_requested = False
+                batch, self._pending = self._pending, {}
+                submitted = self._submitted
+                stopping = self._stopping
+
+            if batch and not self._commit(batch):
+                with self._condition:
+                    # Retry with the next batch, unless the record was written again in the meantime
+                    self._pending = {**{key: write for key, write in batch.items() if key not in self._pending}, **self._pending}
+                    if stopping:
+                        logger.error("Discarding %s database writes on shutdown.", len(self._pending))
+                        self._pending = {}
+                    else:
+                        continue
+
+            with self._condition:
+                self._committed = submitted
+                self._condition.notify_all()
+                if stopping and not self._pending:
+                    self._thread = None
+                    return
+
+    def _commit(self, batch):
+        session = SessionLocal()
+        try:
+            for write in batch.values():
+                write(session)
+            session.commit()
+            logger.debug("Committed a batch of %s database writes.", len(batch))
+            return True
+        except Exception as e:
+            session.rollback()
+            logger.error("Error committing a batch of %s database writes: %s", len(batch), e)
+            return False
+        finally:
+            session.close()
+
+# The process wide writer, started with the first write
+write_behind = WriteBehind()
+atexit.register(write_behind.stop)
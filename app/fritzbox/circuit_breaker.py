@@ -0,0 +1,117 @@
+import time
+from collections import deque
+import httpx
+from app.utils.env_vars import FRITZBOX_BREAKER_THRESHOLD, FRITZBOX_BREAKER_RESET
+from app.utils.logger import logger
+from app.utils.metrics import Counter
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Number of state transitions kept for the /fritzbox/breaker endpoint
+TRANSITION_HISTORY_SIZE = 20
+
+BREAKER_TRANSITIONS = Counter(
+    "wan_ip_fritzbox_breaker_transitions_total", "State transitions of the FritzBox circuit breakers by new state.", ["state"]
+)
+BREAKER_REJECTED = Counter(
+    "wan_ip_fritzbox_breaker_rejected_total", "FritzBox SOAP requests rejected by an open circuit breaker.", ["action"]
+)
+
+class CircuitOpenError(httpx.HTTPError):
+    """
+    Raised instead of sending a request while the circuit breaker is open.
+
+    It is an httpx.HTTPError, so callers handle it like a failed request to the FritzBox.
+    """
+
+class CircuitBreaker:
+    """
+    Circuit breaker for the requests to one FritzBox.
+
+    Closed: all requests are sent. After `failure_threshold` failed requests in a row the breaker opens.
+    Open: requests fail right away with CircuitOpenError, without touching the network.
+    Half open: `reset_timeout` seconds after opening, a single request is let through as a probe.
+    If it succeeds the breaker closes, otherwise it opens again for another `reset_timeout` seconds.
+
+    Only timeouts and connection errors count as failures. An error status (e.g. a SOAP fault)
+    means the FritzBox is reachable.
+    """
+    __slots__ = (
+        "name", "failure_threshold", "reset_timeout", "state", "failures", "rejected", "opened_at", "transitions",
+        "_retry_at", "_probing",
+    )
+
+    def __init__(self, name, failure_threshold=FRITZBOX_BREAKER_THRESHOLD, reset_timeout=FRITZBOX_BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0  # Failed requests in a row
+        self.rejected = 0
+        self.opened_at = 0.0  # Unix timestamp of the last opening
+        self.transitions = deque(maxlen=TRANSITION_HISTORY_SIZE)
+        self._retry_at = 0.0  # Monotonic time after which a probe is let through
+        self._probing = False
+
+    def before_call(self, action):
+        """
+        Checks whether a request may be sent.
+
+        Raises:
+            CircuitOpenError: If the breaker is open, or half open with the probe already in flight.
+        """
+        if self.state == CLOSED:
+            return
+        if self.state == OPEN and time.monotonic() >= self._retry_at:
+            self._transition(HALF_OPEN, "reset timeout elapsed")
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return
+        self.rejected += 1
+        BREAKER_REJECTED.inc(action)
+        raise CircuitOpenError(f"FritzBox {self.name} is unreachable, circuit breaker is {self.state}")
+
+    def record_success(self):
+        self.failures = 0
+        if self.state != CLOSED:
+            self._probing = False
+            self._transition(CLOSED, "probe succeeded")
+
+    def record_failure(self, error):
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            self._probing = False
+            self._open(f"probe failed: {error!r}")
+        elif self.state == CLOSED and self.failures >= self.failure_threshold:
+            self._open(f"{self.failures} failures in a row, last: {error!r}")
+
+    def release_probe(self):
+        """
+        Lets the next request probe again, if the probe was cancelled before it got a result.
+        """
+        self._probing = False
+
+    def _open(self, reason):
+        self.opened_at = time.time()
+        self._retry_at = time.monotonic() + self.reset_timeout
+        self._transition(OPEN, reason)
+
+    def _transition(self, state, reason):
+        logger.warning("Circuit breaker of FritzBox %s: %s -> %s (%s)", self.name, self.state, state, reason)
+        self.transitions.append({"from": self.state, "to": state, "at": time.time(), "reason": reason})
+        self.state = state
+        BREAKER_TRANSITIONS.inc(state)
+
+    def to_dict(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+            "rejected": self.rejected,
+            "opened_at": self.opened_at or None,
+            "retry_at": self.opened_at + self.reset_timeout if self.state == OPEN else None,
+            "transitions": list(self.transitions),
+        }
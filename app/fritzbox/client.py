@@ -0,0 +1,122 @@
+import time
+import asyncio
+import httpx
+from app.fritzbox.circuit_breaker import CircuitBreaker
+from app.fritzbox.soap import SOAP_ACTIONS, ENCODED_REQUESTS, fault_from_response
+from app.utils.env_vars import FRITZBOX_HOST, FRITZBOX_TIMEOUT
+from app.utils.logger import logger
+from app.utils.metrics import Counter, Histogram
+
+SOAP_REQUEST_SECONDS = Histogram("wan_ip_fritzbox_request_seconds", "Latency of FritzBox SOAP requests.", ["action"])
+SOAP_REQUEST_ERRORS = Counter("wan_ip_fritzbox_request_errors_total", "Failed FritzBox SOAP requests.", ["action"])
+
+class FritzBoxClient:
+    """
+    Client for the SOAP actions of a FritzBox.
+
+    Keeps one pooled keep-alive HTTP connection set to the router and builds the request
+    envelopes and headers only once per action. Latency counters are kept per action.
+    A circuit breaker stops sending requests while the router is unreachable, see `CircuitBreaker`.
+
+    Clients of many routers can share one connection pool instead: `http_client` is then a callable
+    returning the httpx.AsyncClient to use, so the memory per router stays small.
+    """
+
+    def __init__(self, host=FRITZBOX_HOST, timeout=FRITZBOX_TIMEOUT, http_client=None):
+        self.host = host
+        self.timeout = timeout
+        self.base_url = f"http://{host}:49000/igdupnp/control/"
+        self._http_client = http_client
+
+        # Request (URL, headers, body) per action, the headers and bodies are shared by all clients
+        self._requests = {
+            name: (f"{self.base_url}{path}", headers, body) for name, (path, headers, body) in ENCODED_REQUESTS.items()
+        }
+
+        self.breaker = CircuitBreaker(host)
+        self._latency = {name: {"count": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0} for name in SOAP_ACTIONS}
+        self._client = None
+        self._client_loop = None
+
+    def _get_client(self):
+        if self._http_client is not None:
+            return self._http_client()
+        # httpx connection pools are bound to their event loop, recreate the client if the loop changed
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=4, keepalive_expiry=30),
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def call(self, action: str) -> str:
+        """
+        Sends the given SOAP action to the FritzBox and returns the response body.
+
+        Args:
+            action (str): The name of the action, one of the keys of SOAP_ACTIONS (e.g. "ipv4" or "status_info").
+
+        Returns:
+            bytes: The XML response from the FritzBox, see `app.fritzbox.soap.extract` to read it.
+
+        Raises:
+            SoapFault: If the FritzBox answers with a SOAP fault.
+            httpx.HTTPError: If the HTTP request fails or the FritzBox answers with an error status.
+            CircuitOpenError: Right away, without sending the request, while the circuit breaker is open.
+        """
+        self.breaker.before_call(action)
+        url, headers, body = self._requests[action]
+        counters = self._latency[action]
+        start = time.perf_counter()
+        try:
+            logger.debug("Sending SOAP request to %s with action %s", url, action)
+            response = await self._get_client().post(url, content=body, headers=headers, timeout=self.timeout)
+            self.breaker.record_success()  # The FritzBox answered, even if with an error status
+            if response.status_code == 500:
+                fault = fault_from_response(action, response)
+                if fault is not None:
+                    raise fault
+            response.raise_for_status()
+            return response.content
+        except httpx.HTTPError as e:
+            if isinstance(e, httpx.TransportError):
+                self.breaker.record_failure(e)
+            else:
+                # An undecodable response or the like, the FritzBox answered (ends a half-open probe)
+                self.breaker.record_success()
+            counters["errors"] += 1
+            SOAP_REQUEST_ERRORS.inc(action)
+            logger.error("SOAP request failed for action %s to %s: %s", action, url, e)
+            raise
+        except BaseException:
+            self.breaker.release_probe()  # Cancelled or unexpected error, the next request probes again
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            counters["count"] += 1
+            counters["total_seconds"] += elapsed
+            counters["max_seconds"] = max(counters["max_seconds"], elapsed)
+            SOAP_REQUEST_SECONDS.observe(elapsed, action)
+
+    def get_latency_stats(self):
+        """
+        Returns the latency counters per action, including the average latency in seconds.
+        """
+        return {
+            name: {**counters, "avg_seconds": counters["total_seconds"] / counters["count"] if counters["count"] else 0.0}
+            for name, counters in self._latency.items()
+        }
+
+    async def aclose(self):
+        """
+        Closes the pooled connections, if they were opened on the running event loop.
+        """
+        if self._client is not None and self._client_loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
+
+# The client for the configured FritzBox, shared by all modules
+fritzbox_client = FritzBoxClient()
@@ -1,59 +1,42 @@
-import requests
-import xml.etree.ElementTree as ET
+import time
+import asyncio
+from app.fritzbox.client import fritzbox_client
+from app.fritzbox.soap import extract
+from app.utils.env_vars import WAN_STATS_TTL
 from app.utils.logger import logger
-from app.utils.env_vars import FRITZBOX_HOST
 
-# Define the FritzBox URL to access WANIPConn1
-FRITZBOX_URL = f"http://{FRITZBOX_HOST}:49000/igdupnp/control/"
-
-# Define common SOAP headers
-SOAP_HEADERS = {
-    "Content-Type": "text/xml; charset=utf-8"
-}
-
-# Define the actions for various SOAP requests
-SOAP_ACTIONS = {
-    "link_properties": "urn:schemas-upnp-org:service:WANCommonInterfaceConfig:1#GetCommonLinkProperties",
-    "status_info": "urn:schemas-upnp-org:service:WANIPConnection:1#GetStatusInfo",
-    "total_bytes_sent": "urn:schemas-upnp-org:service:WANCommonInterfaceConfig:1#GetTotalBytesSent",
-    "total_bytes_received": "urn:schemas-upnp-org:service:WANCommonInterfaceConfig:1#GetTotalBytesReceived",
-}
-
-def send_soap_request(action, payload, service):
+async def send_soap_request(action, fields, client=fritzbox_client):
     """
-    Sends a SOAP request to the specified FritzBox service and returns the parsed XML response.
+    Sends a SOAP request to the FritzBox and returns the requested output arguments of the response.
 
     Args:
-        action (str): The SOAPAction header value.
-        payload (str): The SOAP request body in XML format.
-        service (str): The FritzBox service URL endpoint.
+        action (str): The name of the SOAP action, one of the keys of `app.fritzbox.soap.SOAP_ACTIONS`.
+        fields (tuple): The names of the output arguments to return, e.g. ("NewUptime",).
+        client (FritzBoxClient): The client of the FritzBox to query. Defaults to the configured FritzBox.
 
     Returns:
-        xml.etree.ElementTree.Element: The root element of the parsed XML response.
+        dict: The text of each requested output argument.
 
     Raises:
-        requests.exceptions.RequestException: If the HTTP request fails.
+        httpx.HTTPError: If the HTTP request fails or the FritzBox answers with a SOAP fault.
         ValueError: If the response XML is not valid or expected data is missing.
     """
-    url = f"{FRITZBOX_URL}{service}"
-    headers = SOAP_HEADERS.copy()
-    headers["SOAPAction"] = action
+    response = await client.call(action)
+    logger.debug("SOAP response received: %s", response)
     try:
-        logger.info(f"Sending SOAP request to {url} with action {action}")
-        response = requests.post(url, headers=headers, data=payload, timeout=10)
-        response.raise_for_status()
-
-        # Parse the response XML
-        response_xml = ET.fromstring(response.text)
-        logger.debug(f"SOAP response received: {ET.tostring(response_xml, 'unicode')}")
-        return response_xml
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Request failed for action {action} to {url}: {e}")
-        raise
+        return extract(response, fields)
     except ValueError as e:
-        logger.error(f"Failed to parse SOAP response for action {action}: {e}")
+        logger.error("Failed to parse SOAP response for action %s: %s", action, e)
         raise
 
+async def get_connection_status(client=fritzbox_client):
+    """
+    Returns the connection status (e.g. "Connected") and uptime in seconds of the FritzBox WAN connection.
+    A single SOAP request, cheap enough to poll.
+    """
+    response = await send_soap_request("status_info", ("NewConnectionStatus", "NewUptime"), client)
+    return response["NewConnectionStatus"], int(response["NewUptime"])
+
 def format_bytes(size):
     """
     Converts bytes to a human-readable format (e.g., KB, MB, GB, TB).
@@ -94,79 +77,138 @@ def format_duration(seconds):
             result.append(f"{value}{name}")
     return " ".join(result)
 
-def get_wan_statistics(human_readable=False):
+async def fetch_wan_sample(client=fritzbox_client):
     """
-    Retrieves WAN statistics from the FritzBox device, including link properties, status info, 
-    and total bytes sent/received.
+    Requests link properties, status info and total bytes sent/received from the FritzBox.
+    The four SOAP requests are sent concurrently.
+
+    Args:
+        client (FritzBoxClient): The client of the FritzBox to query. Defaults to the configured FritzBox.
+
+    Returns:
+        dict: The raw WAN statistics in bytes/seconds.
+
+    Raises:
+        httpx.HTTPError: If one of the requests fails.
+        ValueError: If a response is not valid XML or an expected value is missing.
+    """
+    link_response, status_response, bytes_sent_response, bytes_received_response = await asyncio.gather(
+        send_soap_request("link_properties", ("NewLayer1DownstreamMaxBitRate", "NewLayer1UpstreamMaxBitRate"), client),
+        send_soap_request("status_info", ("NewUptime",), client),
+        send_soap_request("total_bytes_sent", ("NewTotalBytesSent",), client),
+        send_soap_request("total_bytes_received", ("NewTotalBytesReceived",), client),
+    )
+
+    return {
+        "max_downstream_speed_bytes": int(link_response["NewLayer1DownstreamMaxBitRate"]),
+        "max_upstream_speed_bytes": int(link_response["NewLayer1UpstreamMaxBitRate"]),
+        "uptime_seconds": int(status_response["NewUptime"]),
+        "bytes_sent": int(bytes_sent_response["NewTotalBytesSent"]),
+        "bytes_received": int(bytes_received_response["NewTotalBytesReceived"]),
+    }
+
+def format_wan_statistics(sample, human_readable=False):
+    """
+    Renders a raw WAN statistics sample.
 
     Args:
+        sample (dict): The raw sample as returned by `fetch_wan_sample`.
         human_readable (bool): Whether to format the returned values in a human-readable format.
 
     Returns:
-        dict: A dictionary with WAN statistics, formatted according to the `human_readable` flag.
-        If an error occurs, an error message will be returned instead.
+        dict: The WAN statistics, formatted according to the `human_readable` flag.
     """
-    try:
-        # Get Link Properties
-        payload = """<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/"
-                                   s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">
-                        <s:Body>
-                            <u:GetCommonLinkProperties xmlns:u="urn:schemas-upnp-org:service:WANCommonInterfaceConfig:1"/>
-                        </s:Body>
-                     </s:Envelope>"""
-        link_response = send_soap_request(SOAP_ACTIONS["link_properties"], payload, "WANCommonIFC1")
-        max_down = int(link_response.find(".//NewLayer1DownstreamMaxBitRate").text)
-        max_up = int(link_response.find(".//NewLayer1UpstreamMaxBitRate").text)
-
-        # Get Status Info
-        payload = """<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/"
-                                   s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">
-                        <s:Body>
-                            <u:GetStatusInfo xmlns:u="urn:schemas-upnp-org:service:WANIPConnection:1"/>
-                        </s:Body>
-                     </s:Envelope>"""
-        status_response = send_soap_request(SOAP_ACTIONS["status_info"], payload, "WANIPConn1")
-        uptime = int(status_response.find(".//NewUptime").text)
-
-        # Get Total Bytes Sent
-        payload = """<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/"
-                                   s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">
-                        <s:Body>
-                            <u:GetTotalBytesSent xmlns:u="urn:schemas-upnp-org:service:WANCommonInterfaceConfig:1"/>
-                        </s:Body>
-                     </s:Envelope>"""
-        bytes_sent_response = send_soap_request(SOAP_ACTIONS["total_bytes_sent"], payload, "WANCommonIFC1")
-        bytes_sent = int(bytes_sent_response.find(".//NewTotalBytesSent").text)
-
-        # Get Total Bytes Received
-        payload = """<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/"
-                                   s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">
-                        <s:Body>
-                            <u:GetTotalBytesReceived xmlns:u="urn:schemas-upnp-org:service:WANCommonInterfaceConfig:1"/>
-                        </s:Body>
-                     </s:Envelope>"""
-        bytes_received_response = send_soap_request(SOAP_ACTIONS["total_bytes_received"], payload, "WANCommonIFC1")
-        bytes_received = int(bytes_received_response.find(".//NewTotalBytesReceived").text)
-
-        # Return data in human-readable format if requested
-        if human_readable:
-            return {
-                "max_downstream_speed": format_bytes(max_down) + "ps",
-                "max_upstream_speed": format_bytes(max_up) + "ps",
-                "uptime": format_duration(uptime),
-                "bytes_sent": format_bytes(bytes_sent),
-                "bytes_received": format_bytes(bytes_received),
-            }
-
-        # Return raw data in bytes/seconds format
+    # Return data in human-readable format if requested
+    if human_readable:
         return {
-            "max_downstream_speed_bytes": max_down,
-            "max_upstream_speed_bytes": max_up,
-            "uptime_seconds": uptime,
-            "bytes_sent": bytes_sent,
-            "bytes_received": bytes_received,
+            "max_downstream_speed": format_bytes(sample["max_downstream_speed_bytes"]) + "ps",
+            "max_upstream_speed": format_bytes(sample["max_upstream_speed_bytes"]) + "ps",
+            "uptime": format_duration(sample["uptime_seconds"]),
+            "bytes_sent": format_bytes(sample["bytes_sent"]),
+            "bytes_received": format_bytes(sample["bytes_received"]),
         }
 
+    # Return raw data in bytes/seconds format
+    return dict(sample)
+
+class WanStatsCache:
+    """
+    Caches the WAN statistics sample of a FritzBox for WAN_STATS_TTL seconds.
+
+    Concurrent requests while the sample is refreshed wait for the same in-flight fetch,
+    so the FritzBox sees at most one set of requests per TTL, regardless of the number of clients.
+    """
+
+    def __init__(self, client=fritzbox_client, ttl=WAN_STATS_TTL):
+        self.client = client
+        self.ttl = ttl
+        self.sample = None
+        self.sampled_at = 0.0  # Unix timestamp of the cached sample
+        self._expires = 0.0  # Monotonic time after which the sample is refreshed
+        self._inflight = None
+
+    def store(self, sample):
+        """
+        Stores a freshly fetched sample in the cache.
+        """
+        self.sample = sample
+        self.sampled_at = time.time()
+        self._expires = time.monotonic() + self.ttl
+
+    def restore(self, sample, sampled_at):
+        """
+        Restores a sample of a previous run. It is refreshed on the next request,
+        but served as the last known sample while the FritzBox can't be reached.
+        """
+        self.sample = sample
+        self.sampled_at = sampled_at
+        self._expires = 0.0
+
+    async def get_sample(self):
+        """
+        Returns the cached sample, or fetches a new one if it expired.
+
+        Raises:
+            Exception: Any error raised by `fetch_wan_sample`, passed on to all waiting callers.
+        """
+        if self.sample is not None and time.monotonic() < self._expires:
+            return self.sample
+
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._refresh())
+        # Shield the shared fetch, so one cancelled request does not cancel it for everybody else
+        return await asyncio.shield(self._inflight)
+
+    async def _refresh(self):
+        try:
+            sample = await fetch_wan_sample(self.client)
+            self.store(sample)
+            return sample
+        finally:
+            self._inflight = None
+
+# The cache for the configured FritzBox
+wan_stats_cache = WanStatsCache()
+
+async def get_wan_statistics(human_readable=False, cache=wan_stats_cache):
+    """
+    Retrieves WAN statistics from the FritzBox device, including link properties, status info, 
+    and total bytes sent/received. Raw and human-readable results are rendered from the same cached sample.
+
+    Args:
+        human_readable (bool): Whether to format the returned values in a human-readable format.
+        cache (WanStatsCache): The cache of the FritzBox to query. Defaults to the configured FritzBox.
+
+    Returns:
+        dict: A dictionary with WAN statistics, formatted according to the `human_readable` flag.
+        If the FritzBox can't be reached, the last known sample is returned with `stale` set to True
+        and the Unix timestamp `sampled_at`. If there is none, an error message is returned instead.
+    """
+    try:
+        sample = await cache.get_sample()
+        return format_wan_statistics(sample, human_readable)
     except Exception as e:
-        logger.error(f"Failed to retrieve WAN statistics: {e}")
+        logger.error("Failed to retrieve WAN statistics: %s", e)
+        if cache.sample is not None:
+            return {**format_wan_statistics(cache.sample, human_readable), "stale": True, "sampled_at": cache.sampled_at}
         return {"error": str(e)}
@@ -1,70 +1,71 @@
-import requests
-import xml.etree.ElementTree as ET
-import os
-from app.utils.env_vars import FRITZBOX_HOST
+import time
+import asyncio
+import httpx
+from app.fritzbox.client import fritzbox_client
+from app.fritzbox.get_wan_statistics import get_connection_status
+from app.utils.env_vars import REFRESH_TIMEOUT, REFRESH_POLL_INTERVAL
 from app.utils.logger import logger
 
-# Define the FritzBox URL to access WANIPConn1
-fritzbox_url = f"http://{FRITZBOX_HOST}:49000/igdupnp/control/WANIPConn1"
-
-# SOAP Payload for ForceTermination (to refresh external IP)
-SOAP_FORCE_TERMINATION_PAYLOAD = """
-<?xml version="1.0" encoding="utf-8"?>
-<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/"
-            s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">
-    <s:Body>
-        <u:ForceTermination xmlns:u="urn:schemas-upnp-org:service:WANIPConnection:1"/>
-    </s:Body>
-</s:Envelope>
-"""
-
-def refresh_public_ip(fritzbox_url=fritzbox_url):
+async def refresh_public_ip():
     """
     Refreshes the public IP address by sending a ForceTermination request to the FritzBox device.
 
-    Args:
-        fritzbox_url (str): The URL of the FritzBox device. Default is the configured URL in the module.
-
     Returns:
         str or None: The response text from the FritzBox device if successful, or None if there was an error.
-
-    Raises:
-        requests.exceptions.RequestException: If the HTTP request fails for any reason.
     """
-    # Define the SOAP action to force termination and refresh the public IP
-    soap_action = "urn:schemas-upnp-org:service:WANIPConnection:1#ForceTermination"
-    
-    headers = {
-        "Content-Type": "text/xml; charset=utf-8",
-        "SOAPAction": soap_action
-    }
-
     try:
         # Log the request details for debugging
-        logger.info(f"Sending ForceTermination request to FritzBox at {fritzbox_url}")
+        logger.info("Sending ForceTermination request to FritzBox at %s", fritzbox_client.host)
 
         # Send the request to FritzBox to refresh the public IP
-        response = requests.post(
-            fritzbox_url,
-            data=SOAP_FORCE_TERMINATION_PAYLOAD,
-            headers=headers,
-            timeout=10  # Add a timeout to prevent hanging indefinitely
-        )
-
-        # Raise an error if the response status code is not successful
-        response.raise_for_status()
+        response = await fritzbox_client.call("force_termination")
 
         # Log the successful request response for debugging
         logger.info("Public IP refresh successful.")
-        
+
         # Return the response text from FritzBox (optional to parse)
-        return response.text
+        return response
 
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         # Handle the case where the request times out
-        logger.error(f"Timeout occurred while trying to refresh public IP at {fritzbox_url}")
+        logger.error("Timeout occurred while trying to refresh public IP at %s", fritzbox_client.host)
         return None
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         # Log any other request-related error (e.g., network issues, bad responses)
-        logger.error(f"Error during public IP refresh request: {e}")
+        logger.error("Error during public IP refresh request: %s", e)
         return None
+
+async def wait_for_reconnect(previous_uptime):
+    """
+    Polls the FritzBox connection status until the connection is up again after a ForceTermination.
+    A reconnect is detected by the uptime being reset. Without the previous uptime, the connection must
+    have been seen down, or be up for less time than this function is waiting, as the first polls may
+    still see the old connection.
+
+    Args:
+        previous_uptime (int or None): The uptime before the refresh, None if it could not be read.
+
+    Returns:
+        bool: True if the reconnect was detected, False if REFRESH_TIMEOUT passed first.
+    """
+    started = time.monotonic()
+    deadline = started + REFRESH_TIMEOUT
+    disconnected = False
+    while time.monotonic() < deadline:
+        await asyncio.sleep(REFRESH_POLL_INTERVAL)
+        try:
+            status, uptime = await get_connection_status()
+        except Exception as e:
+            # The FritzBox might not answer while it reconnects
+            logger.debug("Connection status not available yet: %s", e)
+            continue
+
+        logger.debug("Connection status after refresh: %s, uptime %ss", status, uptime)
+        if status != "Connected":
+            disconnected = True
+        elif previous_uptime is not None:
+            if uptime < previous_uptime:
+                return True
+        elif disconnected or uptime < time.monotonic() - started:
+            return True
+    return False
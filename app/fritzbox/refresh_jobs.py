@@ -0,0 +1,169 @@
+import json
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from sqlalchemy import select
+from app.database.database import SessionLocal, RefreshJobRecord
+from app.fritzbox.ip_renewer import refresh_public_ip, wait_for_reconnect
+from app.fritzbox.get_wan_statistics import get_connection_status
+from app.utils.env_vars import REFRESH_TIMEOUT
+from app.utils.ip_fetch_and_store import fetch_and_store_ips
+from app.utils.ip_snapshot import get_snapshot
+from app.utils.leader import is_leader, fetch_via_leader
+from app.utils.logger import logger
+from app.utils.shared_state import shared_state
+
+# Number of finished jobs kept for status requests
+MAX_JOBS = 20
+
+class RefreshJob:
+    """
+    A public IP refresh running in the background.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "running"  # running, succeeded, timeout or failed
+        self.message = "Public IP refresh started"
+        self.created_at = time.time()
+        self.finished_at = None
+        self.data = None
+        self.task = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "message": self.message,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "data": self.data,
+        }
+
+# The jobs started by this worker. In multi-worker mode the jobs are also stored in the database,
+# so the status can be requested from any worker.
+jobs = OrderedDict()
+
+async def start_refresh_job():
+    """
+    Starts a public IP refresh in the background.
+
+    Returns:
+        RefreshJob: The started job, its status can be looked up with `get_refresh_job`.
+    """
+    job = RefreshJob()
+    jobs[job.id] = job
+    while len(jobs) > MAX_JOBS:
+        jobs.popitem(last=False)
+    if shared_state:
+        await asyncio.to_thread(save_job, job)
+    job.task = asyncio.create_task(run_refresh_job(job))
+    return job
+
+async def get_refresh_job(job_id):
+    """
+    Returns the job with the given id, or None if it is unknown.
+    """
+    job = jobs.get(job_id)
+    if job is None and shared_state:
+        job = await asyncio.to_thread(load_job, job_id)
+    return job
+
+async def get_last_refresh_time():
+    """
+    Returns the Unix timestamp of the latest refresh, of all workers in multi-worker mode, 0 if there was none.
+    """
+    if shared_state:
+        return await asyncio.to_thread(load_last_refresh_time)
+    return next(reversed(jobs.values())).created_at if jobs else 0
+
+def save_job(job):
+    """
+    Stores the job in the database and removes all but the latest MAX_JOBS jobs.
+    """
+    db = SessionLocal()
+    try:
+        db.merge(RefreshJobRecord(
+            id=job.id,
+            status=job.status,
+            message=job.message,
+            created_at=job.created_at,
+            finished_at=job.finished_at,
+            data=json.dumps(job.data) if job.data is not None else None,
+        ))
+        stale = select(RefreshJobRecord.id).order_by(RefreshJobRecord.created_at.desc()).offset(MAX_JOBS)
+        db.query(RefreshJobRecord).filter(RefreshJobRecord.id.in_(stale)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def load_job(job_id):
+    """
+    Reads a job started by another worker from the database.
+    """
+    db = SessionLocal()
+    try:
+        row = db.get(RefreshJobRecord, job_id)
+    finally:
+        db.close()
+    if row is None:
+        return None
+
+    job = RefreshJob()
+    job.id, job.status, job.message = row.id, row.status, row.message
+    job.created_at, job.finished_at = row.created_at, row.finished_at
+    job.data = json.loads(row.data) if row.data is not None else None
+    return job
+
+def load_last_refresh_time():
+    db = SessionLocal()
+    try:
+        return db.query(RefreshJobRecord.created_at).order_by(RefreshJobRecord.created_at.desc()).limit(1).scalar() or 0
+    finally:
+        db.close()
+
+async def run_refresh_job(job):
+    """
+    Forces a new public IP, waits until the FritzBox is reconnected and stores the new IPs.
+    """
+    try:
+        try:
+            _, previous_uptime = await get_connection_status()
+        except Exception as e:
+            logger.warning("Could not read the connection status before the refresh: %s", e)
+            previous_uptime = None
+
+        if not await refresh_public_ip():
+            job.status = "failed"
+            job.message = "Failed to force public IP refresh"
+            return
+
+        start = time.monotonic()
+        if await wait_for_reconnect(previous_uptime):
+            logger.info("FritzBox reconnected %.1f seconds after the refresh.", time.monotonic() - start)
+            job.status = "succeeded"
+            job.message = "Refreshed public IP successfully"
+        else:
+            logger.warning("FritzBox reconnect not detected within %s seconds.", REFRESH_TIMEOUT)
+            job.status = "timeout"
+            job.message = f"Reconnect not detected within {REFRESH_TIMEOUT} seconds, returning the latest known IPs"
+
+        if is_leader():
+            await fetch_and_store_ips()
+        elif not await fetch_via_leader(REFRESH_TIMEOUT):
+            # Only the leader fetches, the job serves the IPs it knows
+            logger.warning("The fetch leader did not fetch the IPs within %s seconds.", REFRESH_TIMEOUT)
+        snapshot = get_snapshot()
+        job.data = [{"ipv4": snapshot.ipv4, "ipv6": snapshot.ipv6 if snapshot.ipv6 else "N/A"}]
+    except Exception as e:
+        logger.error("Public IP refresh job %s failed: %s", job.id, e)
+        job.status = "failed"
+        job.message = str(e)
+    finally:
+        job.finished_at = time.time()
+        if shared_state:
+            try:
+                await asyncio.to_thread(save_job, job)
+            except Exception as e:
+                logger.error("Error storing public IP refresh job %s: %s", job.id, e)
@@ -0,0 +1,148 @@
+import ipaddress
+from xml.parsers import expat
+import httpx
+
+# Service types used by the FritzBox TR-064/UPnP actions
+WAN_IP_CONNECTION = "urn:schemas-upnp-org:service:WANIPConnection:1"
+WAN_COMMON_INTERFACE_CONFIG = "urn:schemas-upnp-org:service:WANCommonInterfaceConfig:1"
+
+# All SOAP actions used against the FritzBox: name -> (control URL path, service type, action)
+SOAP_ACTIONS = {
+    "ipv4": ("WANIPConn1", WAN_IP_CONNECTION, "GetExternalIPAddress"),
+    "ipv6": ("WANIPConn1", WAN_IP_CONNECTION, "X_AVM_DE_GetExternalIPv6Address"),
+    "status_info": ("WANIPConn1", WAN_IP_CONNECTION, "GetStatusInfo"),
+    "force_termination": ("WANIPConn1", WAN_IP_CONNECTION, "ForceTermination"),
+    "link_properties": ("WANCommonIFC1", WAN_COMMON_INTERFACE_CONFIG, "GetCommonLinkProperties"),
+    "total_bytes_sent": ("WANCommonIFC1", WAN_COMMON_INTERFACE_CONFIG, "GetTotalBytesSent"),
+    "total_bytes_received": ("WANCommonIFC1", WAN_COMMON_INTERFACE_CONFIG, "GetTotalBytesReceived"),
+}
+
+SOAP_ENVELOPE = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">'
+    '<s:Body><u:{action} xmlns:u="{service_type}"/></s:Body>'
+    '</s:Envelope>'
+)
+
+# The canonical request per action, encoded once: name -> (control URL path, headers, body)
+ENCODED_REQUESTS = {
+    name: (
+        path,
+        {"Content-Type": "text/xml; charset=utf-8", "SOAPAction": f"{service_type}#{action}"},
+        SOAP_ENVELOPE.format(action=action, service_type=service_type).encode("utf-8"),
+    )
+    for name, (path, service_type, action) in SOAP_ACTIONS.items()
+}
+
+FAULT_FIELDS = ("faultstring", "errorCode", "errorDescription")
+
+class SoapFault(httpx.HTTPStatusError):
+    """
+    Raised when the FritzBox answers a request with a SOAP fault, e.g. for an action it does not support.
+
+    It is an httpx.HTTPStatusError, so callers handle it like any other error status.
+    """
+
+    def __init__(self, action, code, description, request, response):
+        super().__init__(f"SOAP fault for action {action}: {code} {description}", request=request, response=response)
+        self.action = action
+        self.code = code
+        self.description = description
+
+class _AllFound(Exception):
+    """
+    Stops the parser once all fields were found.
+    """
+
+def extract(body, fields, required=True):
+    """
+    Extracts output arguments from a SOAP response.
+
+    The response is read by an event-based expat parser that only collects the text of the requested
+    elements, and parsing stops as soon as all of them were found. No element tree is built.
+    The FritzBox sends the output arguments without a namespace prefix, so they are matched by name.
+
+    Args:
+        body (bytes or str): The SOAP response.
+        fields (tuple): The names of the output arguments, e.g. ("NewUptime",).
+        required (bool): Whether a missing or empty field is an error.
+
+    Returns:
+        dict: The text of each field, None if it is missing or empty.
+
+    Raises:
+        ValueError: If the response is not valid XML, or if a required field is missing.
+    """
+    values = dict.fromkeys(fields)
+    found = set()  # A repeated element keeps its first value, like ElementTree's find
+    text = None  # Text parts of the field being read
+
+    def start(name, attributes):
+        nonlocal text
+        if name in values and name not in found:
+            text = []
+
+    def end(name):
+        nonlocal text
+        if text is not None and name in values:
+            values[name] = "".join(text) or None
+            text = None
+            found.add(name)
+            if len(found) == len(values):
+                raise _AllFound
+
+    def character_data(data):
+        if text is not None:
+            text.append(data)
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = character_data
+    try:
+        parser.Parse(body, True)
+    except _AllFound:
+        pass
+    except expat.ExpatError as e:
+        raise ValueError(f"Invalid SOAP response: {e}")
+
+    if required:
+        missing = [name for name, value in values.items() if value is None]
+        if missing:
+            raise ValueError(f"Missing {', '.join(missing)} in the SOAP response")
+    return values
+
+def fault_from_response(action, response):
+    """
+    Returns a SoapFault for an error response with a SOAP fault body, None if the body is no SOAP fault.
+    """
+    try:
+        fault = extract(response.content, FAULT_FIELDS, required=False)
+    except ValueError:
+        return None
+    if fault["faultstring"] is None:
+        return None
+    return SoapFault(
+        action, fault["errorCode"], fault["errorDescription"] or fault["faultstring"], response.request, response
+    )
+
+def parse_ip_address(value, version):
+    """
+    Validates an IP address returned by the FritzBox.
+
+    Args:
+        value (str or None): The address as returned by `extract`.
+        version (int): The expected IP version, 4 or 6.
+
+    Returns:
+        str or None: The address as sent by the FritzBox, None if there is none.
+
+    Raises:
+        ValueError: If the value is not an IP address of the given version.
+    """
+    if not value:
+        return None
+    address = ipaddress.ip_address(value.strip())
+    if address.version != version:
+        raise ValueError(f"Expected an IPv{version} address, got {value}")
+    return value.strip()
@@ -0,0 +1,162 @@
+import re
+import json
+import time
+import asyncio
+from app.database.database import SessionLocal, TargetIP
+from app.database.ip_history import utcnow
+from app.database.write_behind import write_behind
+from app.fritzbox.client import FritzBoxClient
+from app.fritzbox.get_wan_statistics import WanStatsCache
+from app.ip_fetcher.ip_fetcher_fritzbox import parse_ip
+from app.utils.env_vars import UPDATE_INTERVAL, FRITZBOX_TIMEOUT, WAN_STATS_TTL
+from app.utils.http_client import get_http_client
+from app.utils.logger import logger
+from app.utils.metrics import Counter, Gauge
+
+# Target ids are used in URLs, so only allow URL-safe characters
+TARGET_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+class Target:
+    """
+    A monitored FritzBox and its current IPs.
+
+    All targets send their requests through the shared HTTP client, so a target only costs
+    its own state (a few hundred bytes), not a connection pool.
+    """
+    __slots__ = ("id", "host", "interval", "client", "wan_stats", "ipv4", "ipv6", "changed_at", "fetched_at", "last_error")
+
+    def __init__(self, id, host, interval=UPDATE_INTERVAL, timeout=FRITZBOX_TIMEOUT):
+        self.id = id
+        self.host = host
+        self.interval = interval  # Seconds between two fetches
+        self.client = FritzBoxClient(host, timeout, http_client=get_http_client)
+        self.wan_stats = WanStatsCache(self.client, WAN_STATS_TTL)
+        self.ipv4 = None
+        self.ipv6 = None
+        self.changed_at = None  # UTC datetime of the last IP change
+        self.fetched_at = 0.0  # Unix timestamp of the last successful fetch
+        self.last_error = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "host": self.host,
+            "interval": self.interval,
+            "ipv4": self.ipv4,
+            "ipv6": self.ipv6,
+            "changed_at": self.changed_at.isoformat() + "Z" if self.changed_at else None,
+            "fetched_at": self.fetched_at or None,
+            "last_error": self.last_error,
+            "breaker": self.client.breaker.state,
+        }
+
+# The configured targets by id
+targets = {}
+
+TARGET_FETCHES = Counter("wan_ip_target_fetches_total", "IP fetches of the targets by result.", ["result"])
+TARGET_COUNT = Gauge("wan_ip_targets", "Number of configured targets.", function=lambda: len(targets))
+
+def load_targets(path):
+    """
+    Reads the targets from a JSON file.
+
+    The file contains a list of objects with an `id` and a `host`, and optionally the fetch
+    `interval` and the request `timeout` in seconds, e.g.:
+    [{"id": "berlin", "host": "192.168.10.1", "interval": 60}]
+
+    Args:
+        path (str): Path of the JSON file.
+
+    Returns:
+        dict: The targets by id.
+
+    Raises:
+        ValueError: If the file can't be read or contains an invalid target.
+    """
+    try:
+        with open(path) as file:
+            entries = json.load(file)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Can't read targets file {path}: {e}")
+    if not isinstance(entries, list):
+        raise ValueError(f"Targets file {path} must contain a list of targets")
+
+    loaded = {}
+    for entry in entries:
+        target_id = entry.get("id") if isinstance(entry, dict) else None
+        if not isinstance(target_id, str) or not TARGET_ID_PATTERN.match(target_id):
+            raise ValueError(f"Invalid target id {target_id!r}, allowed are up to 64 letters, digits, '_', '.' and '-'")
+        if target_id in loaded:
+            raise ValueError(f"Duplicate target id {target_id!r}")
+        if not entry.get("host"):
+            raise ValueError(f"Target {target_id!r} has no host")
+
+        interval = entry.get("interval", UPDATE_INTERVAL)
+        timeout = entry.get("timeout", FRITZBOX_TIMEOUT)
+        if not isinstance(interval, (int, float)) or interval <= 0 or not isinstance(timeout, (int, float)) or timeout <= 0:
+            raise ValueError(f"Target {target_id!r} needs a positive interval and timeout")
+        loaded[target_id] = Target(target_id, entry["host"], interval, timeout)
+    return loaded
+
+def init_targets(path):
+    """
+    Loads the targets from the given file into the registry and restores their last IPs from the database.
+
+    Raises:
+        ValueError: If the targets file is invalid.
+    """
+    targets.clear()
+    targets.update(load_targets(path))
+    restore_targets()
+    logger.info("Loaded %s targets from %s.", len(targets), path)
+
+def restore_targets():
+    """
+    Sets the IPs of the targets to the ones stored in the database.
+    Workers that don't fetch the targets themselves call this to pick up the changes of the fetch leader.
+    """
+    db = SessionLocal()
+    try:
+        for row in db.query(TargetIP).filter(TargetIP.target_id.in_(list(targets))):
+            target = targets[row.target_id]
+            target.ipv4, target.ipv6, target.changed_at = row.ipv4, row.ipv6, row.changed_at
+    finally:
+        db.close()
+
+def get_target(target_id):
+    return targets.get(target_id)
+
+async def fetch_target(target):
+    """
+    Fetches the external IPv4 and IPv6 address of a target, both requests in parallel.
+    A change is written to the database through the write-behind batcher, so hundreds of targets
+    are committed in a few transactions instead of one per target.
+
+    Returns:
+        bool: True if the IPs changed.
+    """
+    responses = await asyncio.gather(target.client.call("ipv4"), target.client.call("ipv6"), return_exceptions=True)
+    try:
+        for response in responses:
+            if isinstance(response, BaseException):
+                raise response
+        ipv4 = parse_ip(responses[0], "NewExternalIPAddress")
+        ipv6 = parse_ip(responses[1], "NewExternalIPv6Address")
+    except Exception as e:
+        target.last_error = str(e) or type(e).__name__
+        TARGET_FETCHES.inc("error")
+        logger.error("Error fetching IPs of target %s: %s", target.id, target.last_error)
+        return False
+
+    target.fetched_at = time.time()
+    target.last_error = None
+    if ipv4 == target.ipv4 and ipv6 == target.ipv6:
+        TARGET_FETCHES.inc("unchanged")
+        return False
+
+    target.ipv4, target.ipv6, target.changed_at = ipv4, ipv6, utcnow()
+    row = TargetIP(target_id=target.id, ipv4=ipv4, ipv6=ipv6, changed_at=target.changed_at)
+    write_behind.submit(("target_ip", target.id), lambda session: session.merge(row))
+    TARGET_FETCHES.inc("changed")
+    logger.info("IPs of target %s changed: IPv4=%s, IPv6=%s", target.id, ipv4, ipv6)
+    return True
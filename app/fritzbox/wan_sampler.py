@@ -0,0 +1,170 @@
+import time
+import asyncio
+from app.fritzbox.circuit_breaker import CircuitOpenError
+from app.fritzbox.get_wan_statistics import fetch_wan_sample, wan_stats_cache
+from app.utils.env_vars import WAN_SAMPLE_INTERVAL, WAN_HISTORY_SIZE
+from app.utils.logger import logger, SAMPLED
+from app.utils.shared_state import shared_state, READ_TIMEOUT
+
+# The UPnP byte counters of the FritzBox are 32 bit and wrap around at this value
+COUNTER_WRAP = 2 ** 32
+
+class WanHistory:
+    """
+    Fixed-size ring buffer of WAN byte counter samples.
+
+    The samples are stored as 8 byte values in one flat buffer, so the memory usage is constant
+    and known upfront: 32 bytes per sample. The buffer can be shared memory (see
+    app.utils.shared_state), then the sampling worker appends and all other workers read. Appends
+    bump a sequence number before and after writing, readers retry if it changed while they copied.
+    """
+
+    def __init__(self, size=WAN_HISTORY_SIZE, buffer=None):
+        self.size = size
+        if buffer is None:
+            buffer = bytearray(self.nbytes(size))
+        buffer = memoryview(buffer)
+        self._header = buffer[:24].cast("Q")  # Sequence number, index the next sample is written to, number of samples
+        columns = [buffer[24 + i * 8 * size:24 + (i + 1) * 8 * size] for i in range(4)]
+        self._timestamps = columns[0].cast("d")
+        self._uptimes = columns[1].cast("d")
+        self._sent = columns[2].cast("Q")
+        self._received = columns[3].cast("Q")
+
+    @staticmethod
+    def nbytes(size):
+        """
+        Returns the size of the buffer for `size` samples.
+        """
+        return 24 + 32 * size
+
+    def __len__(self):
+        return min(self._header[2], self.size)
+
+    def append(self, timestamp, uptime, bytes_sent, bytes_received):
+        """
+        Adds a sample, overwriting the oldest one once the buffer is full.
+        """
+        seq, i, count = self._header
+        self._header[0] = seq + 1
+        self._timestamps[i] = timestamp
+        self._uptimes[i] = uptime
+        self._sent[i] = bytes_sent
+        self._received[i] = bytes_received
+        self._header[1] = (i + 1) % self.size
+        self._header[2] = min(count + 1, self.size)
+        self._header[0] = seq + 2
+
+    def _read(self):
+        # Copies the samples, ordered from the oldest to the newest, as four lists (empty if they can't be read)
+        deadline = time.monotonic() + READ_TIMEOUT
+        while True:
+            seq, next_index, count = self._header
+            if not seq & 1:
+                next_index, count = next_index % self.size, min(count, self.size)
+                columns = [
+                    values[:count].tolist() if count < self.size else values[next_index:].tolist() + values[:next_index].tolist()
+                    for values in (self._timestamps, self._uptimes, self._sent, self._received)
+                ]
+                if self._header[0] == seq:
+                    return columns
+            if time.monotonic() >= deadline:
+                logger.warning("The WAN history is still being written, the sampler may have died while writing.")
+                return [], [], [], []
+            time.sleep(0)  # A sample is being written, let the sampler finish
+
+    def get_rates(self, since=0.0):
+        """
+        Calculates the upload and download rates between consecutive samples.
+
+        Counter wraparounds are corrected, and a counter reset (e.g. after a router reboot,
+        detected by a lower uptime) counts the new value from zero.
+
+        Args:
+            since (float): Only return rates of samples taken after this Unix timestamp.
+
+        Returns:
+            tuple: Three lists (timestamps, upload rates, download rates), rates in bytes per second.
+        """
+        timestamps, uptimes, sent, received = self._read()
+
+        def deltas(counters):
+            return [
+                (cur - prev) if cur >= prev else (cur if up < prev_up else cur - prev + COUNTER_WRAP)
+                for prev, cur, prev_up, up in zip(counters, counters[1:], uptimes, uptimes[1:])
+            ]
+
+        intervals = [cur - prev for prev, cur in zip(timestamps, timestamps[1:])]
+        upload = [delta / dt if dt > 0 else 0.0 for delta, dt in zip(deltas(sent), intervals)]
+        download = [delta / dt if dt > 0 else 0.0 for delta, dt in zip(deltas(received), intervals)]
+        times = timestamps[1:]
+
+        # The timestamps are ordered, so the window is a slice
+        start = next((i for i, t in enumerate(times) if t > since), len(times))
+        return times[start:], upload[start:], download[start:]
+
+    def downsample(self, window=None, buckets=60):
+        """
+        Returns the rates of the given window, aggregated into time buckets with min/avg/max per bucket.
+
+        Args:
+            window (float or None): Only include the last `window` seconds. None includes the whole buffer.
+            buckets (int): The number of time buckets to aggregate into.
+
+        Returns:
+            list: One dict per non-empty bucket with its start/end timestamps and upload/download statistics.
+        """
+        since = time.time() - window if window else 0.0
+        times, upload, download = self.get_rates(since)
+        if not times:
+            return []
+
+        start = times[0]
+        width = max((times[-1] - start) / buckets, 1e-9)
+        aggregated = {}
+        for t, up, down in zip(times, upload, download):
+            index = min(int((t - start) / width), buckets - 1)
+            bucket = aggregated.get(index)
+            if bucket is None:
+                aggregated[index] = [up, up, up, down, down, down, 1]
+            else:
+                bucket[0] = min(bucket[0], up)
+                bucket[1] = max(bucket[1], up)
+                bucket[2] += up
+                bucket[3] = min(bucket[3], down)
+                bucket[4] = max(bucket[4], down)
+                bucket[5] += down
+                bucket[6] += 1
+
+        return [
+            {
+                "start": start + index * width,
+                "end": start + (index + 1) * width,
+                "samples": count,
+                "upload_bytes_per_second": {"min": up_min, "avg": up_sum / count, "max": up_max},
+                "download_bytes_per_second": {"min": down_min, "avg": down_sum / count, "max": down_max},
+            }
+            for index, (up_min, up_max, up_sum, down_min, down_max, down_sum, count) in sorted(aggregated.items())
+        ]
+
+# The throughput history of the configured FritzBox, shared by all workers in multi-worker mode
+wan_history = WanHistory(buffer=shared_state.wan_history_buffer() if shared_state else None)
+
+async def sample_wan_periodically():
+    """
+    Samples the WAN statistics every WAN_SAMPLE_INTERVAL seconds into the history.
+    Every sample also refreshes the /wan-stats cache, so the router is not queried twice.
+    """
+    logger.info("Starting WAN statistics sampler with an interval of %s seconds.", WAN_SAMPLE_INTERVAL)
+    while True:
+        try:
+            sample = await fetch_wan_sample()
+            wan_stats_cache.store(sample)
+            wan_history.append(
+                wan_stats_cache.sampled_at, sample["uptime_seconds"], sample["bytes_sent"], sample["bytes_received"]
+            )
+        except CircuitOpenError as e:
+            logger.debug("Skipping the WAN statistics sample: %s", e)  # The breaker logs its transitions
+        except Exception as e:
+            logger.error("Failed to sample WAN statistics: %s", e, extra=SAMPLED)
+        await asyncio.sleep(WAN_SAMPLE_INTERVAL)
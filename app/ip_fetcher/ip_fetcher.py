@@ -0,0 +1,92 @@
+import asyncio
+from app.utils.env_vars import USE_FALLBACK, IP_SOURCE
+from app.utils.logger import logger, SAMPLED
+from .ip_fetcher_fritzbox import get_external_ip, parse_ip
+from .ip_fetcher_public import get_public_ip, get_dns_ips
+
+async def fetch_ips(source=IP_SOURCE, use_fallback=USE_FALLBACK):
+    """
+    Fetches the current external IPv4 and IPv6 addresses from the configured source, without storing them.
+
+    The FritzBox IPv4 and IPv6 requests run concurrently, so this takes as long as the slowest call.
+    If the FritzBox fails and the fallback is enabled, the IPv4 address is fetched from the public IP services.
+    Every failure is logged before it is raised.
+
+    Args:
+        source (str): "fritzbox", "public" or "dns".
+        use_fallback (bool): Whether to fall back to the public IP services if the FritzBox fails.
+
+    Returns:
+        tuple: The IPv4 and the IPv6 address, the IPv6 address is None for the public IP services.
+        The DNS lookups also report the IPv6 address, if the host has an IPv6 route.
+
+    Raises:
+        Exception: If the IPs can't be fetched.
+        ValueError: If the source is unknown.
+    """
+    # Log the IP source being used
+    logger.info("Fetching IPs from source: %s", source, extra=SAMPLED)
+
+    if source == "fritzbox":
+        try:
+            logger.info("Fetching IPs from FritzBox...", extra=SAMPLED)
+
+            # Fetch current IPs from FritzBox, both requests in parallel
+            ipv4_response, ipv6_response = await asyncio.gather(
+                get_external_ip("ipv4"),
+                get_external_ip("ipv6"),
+                return_exceptions=True,
+            )
+            for response in (ipv4_response, ipv6_response):
+                if isinstance(response, BaseException):
+                    raise response
+
+            # Parse the responses for IPv4 and IPv6
+            ipv4 = parse_ip(ipv4_response, "NewExternalIPAddress")
+            ipv6 = parse_ip(ipv6_response, "NewExternalIPv6Address")
+
+            logger.info("Fetched IPs from FritzBox: IPv4=%s, IPv6=%s", ipv4, ipv6, extra=SAMPLED)
+            return ipv4, ipv6
+        except Exception as e:
+            logger.error("Error fetching IPs from FritzBox: %s", e)
+            if not use_fallback:
+                logger.error("FritzBox fetch failed, and no fallback is enabled.")
+                raise
+
+        # If FritzBox fetch fails and fallback is enabled, try fetching public IP
+        logger.info("FritzBox fetch failed, falling back to public IP fetch.")
+        try:
+            ipv4, _ = await get_public_ip()
+            if ipv4 is None:
+                raise RuntimeError("No public IP service returned a valid IPv4 address")
+        except Exception as e:
+            logger.error("Public IP fallback failed: %s", e)
+            raise
+        return ipv4, None  # The public IP services don't provide IPv6
+
+    if source == "public":
+        try:
+            logger.info("Fetching public IP...", extra=SAMPLED)
+            ipv4, _ = await get_public_ip()
+            if ipv4 is None:
+                raise RuntimeError("No public IP service returned a valid IPv4 address")
+            logger.info("Fetched public IP: IPv4=%s", ipv4, extra=SAMPLED)
+        except Exception as e:
+            logger.error("Public IP fetch failed: %s", e)
+            raise
+        return ipv4, None  # The public IP services don't provide IPv6
+
+    if source == "dns":
+        try:
+            logger.info("Fetching IPs via DNS...", extra=SAMPLED)
+            ipv4, ipv6 = await get_dns_ips()
+            if ipv4 is None:
+                raise RuntimeError("No DNS lookup returned a valid IPv4 address")
+            logger.info("Fetched IPs via DNS: IPv4=%s, IPv6=%s", ipv4, ipv6, extra=SAMPLED)
+        except Exception as e:
+            logger.error("DNS IP fetch failed: %s", e)
+            raise
+        return ipv4, ipv6
+
+    logger.error("Invalid IP source configuration: %s", source)
+    raise ValueError(f"Invalid IP source: {source}")
@@ -0,0 +1,202 @@
+import random
+import socket
+import struct
+import asyncio
+import ipaddress
+
+# Record types and classes of the queries
+RECORD_TYPES = {"A": 1, "AAAA": 28, "TXT": 16}
+RECORD_CLASSES = {"IN": 1, "CH": 3}
+
+# Seconds after which an unanswered query is sent again, as UDP datagrams may get lost
+RETRY_INTERVAL = 1
+
+HEADER = struct.Struct("!HHHHHH")  # id, flags, questions, answers, authority and additional records
+RECORD = struct.Struct("!HHIH")  # type, class, TTL and data length of a resource record
+
+# Flags of the response header
+FLAG_RESPONSE = 0x8000
+FLAG_TRUNCATED = 0x0200
+RCODE_MASK = 0x000F
+
+# Name servers that answer with the address the query came from, queried directly by IP address.
+# Each lookup is a single UDP round trip, no TCP or TLS handshake as with the HTTPS services.
+DNS_SERVICES = [
+    {"name": "myip.opendns.com", "dns": {"query": "myip.opendns.com", "type": "A", "server": "208.67.222.222"}},
+    {"name": "o-o.myaddr.l.google.com", "dns": {"query": "o-o.myaddr.l.google.com", "type": "TXT", "server": "216.239.32.10"}},
+    {"name": "whoami.cloudflare", "dns": {"query": "whoami.cloudflare", "type": "TXT", "class": "CH", "server": "1.1.1.1"}},
+    {"name": "whoami.akamai.net", "dns": {"query": "whoami.akamai.net", "type": "A", "server": "193.108.88.1"}},
+]
+
+# The same over IPv6, which reports the IPv6 address
+DNS6_SERVICES = [
+    {"name": "myip.opendns.com (IPv6)", "dns": {"query": "myip.opendns.com", "type": "AAAA", "server": "2620:119:35::35"}},
+    {"name": "o-o.myaddr.l.google.com (IPv6)", "dns": {"query": "o-o.myaddr.l.google.com", "type": "TXT", "server": "2001:4860:4802:32::a"}},
+    {"name": "whoami.cloudflare (IPv6)", "dns": {"query": "whoami.cloudflare", "type": "TXT", "class": "CH", "server": "2606:4700:4700::1111"}},
+]
+
+def build_query(query_id, name, record_type, record_class):
+    """
+    Encodes a DNS query for a single question, without recursion (the servers answer for their own zone).
+    """
+    labels = b"".join(len(label).to_bytes(1, "big") + label for label in name.encode("ascii").split(b".") if label)
+    return HEADER.pack(query_id, 0, 1, 0, 0, 0) + labels + b"\0" + struct.pack("!HH", record_type, record_class)
+
+def _skip_name(data, offset):
+    """
+    Returns the offset after the (possibly compressed) domain name at `offset`.
+    """
+    while True:
+        length = data[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:  # Pointer to a name earlier in the message, ends the name
+            return offset + 2
+        offset += 1 + length
+
+def parse_response(data, query_id, record_type):
+    """
+    Decodes the answers of the requested type from a DNS response.
+
+    Args:
+        data (bytes): The response datagram.
+        query_id (int): The id of the query, the response must carry the same.
+        record_type (int): The requested record type, answers of other types (e.g. CNAME) are skipped.
+
+    Returns:
+        list: The answers as text, addresses for A and AAAA, the joined strings for TXT records.
+
+    Raises:
+        ValueError: If the response is malformed, truncated or reports an error.
+    """
+    try:
+        response_id, flags, questions, answers, _, _ = HEADER.unpack_from(data)
+        if response_id != query_id or not flags & FLAG_RESPONSE:
+            raise ValueError("Not a response to the query")
+        if flags & FLAG_TRUNCATED:
+            raise ValueError("Truncated DNS response")
+        if flags & RCODE_MASK:
+            raise ValueError(f"DNS error code {flags & RCODE_MASK}")
+
+        offset = HEADER.size
+        for _ in range(questions):
+            offset = _skip_name(data, offset) + 4  # Type and class
+        results = []
+        for _ in range(answers):
+            offset = _skip_name(data, offset)
+            answer_type, _, _, length = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            rdata = data[offset:offset + length]
+            offset += length
+            if len(rdata) != length:
+                raise ValueError("Truncated resource record")
+            if answer_type != record_type:
+                continue
+            if answer_type == RECORD_TYPES["A"]:
+                results.append(socket.inet_ntop(socket.AF_INET, rdata))
+            elif answer_type == RECORD_TYPES["AAAA"]:
+                results.append(socket.inet_ntop(socket.AF_INET6, rdata))
+            else:
+                # TXT: one or more strings, each prefixed by its length
+                strings, position = [], 0
+                while position < len(rdata):
+                    strings.append(rdata[position + 1:position + 1 + rdata[position]])
+                    position += 1 + rdata[position]
+                results.append(b"".join(strings).decode("ascii", "replace"))
+        return results
+    except (IndexError, struct.error) as e:
+        raise ValueError(f"Malformed DNS response: {e}")
+
+class _QueryProtocol(asyncio.DatagramProtocol):
+    """
+    Receives the datagrams of one query and hands the first one with the query's id to the waiting lookup.
+    """
+
+    def __init__(self, query_id, answer):
+        self.query_id = query_id.to_bytes(2, "big")
+        self.answer = answer
+
+    def datagram_received(self, data, addr):
+        if data[:2] == self.query_id and not self.answer.done():
+            self.answer.set_result(data)
+
+    def error_received(self, exc):
+        if not self.answer.done():
+            self.answer.set_exception(exc)
+
+async def query(name, record_type, server, port=53, record_class="IN", timeout=5):
+    """
+    Sends a DNS query over UDP to a server and returns the answers.
+
+    The socket is connected to the server, so the kernel drops datagrams from other addresses,
+    and responses need to carry the random query id. Unanswered queries are sent again every
+    RETRY_INTERVAL seconds until `timeout`.
+
+    Args:
+        name (str): The queried domain name, e.g. "myip.opendns.com".
+        record_type (str): "A", "AAAA" or "TXT".
+        server (str): IPv4 or IPv6 address of the name server.
+        port (int): The port of the name server.
+        record_class (str): "IN", or "CH" for the server information queries of some servers.
+        timeout (float): Seconds to wait for the answer.
+
+    Returns:
+        list: The answers as text, see `parse_response`.
+
+    Raises:
+        TimeoutError: If there is no answer within `timeout` seconds.
+        OSError: If the server can't be reached, e.g. without an IPv6 route.
+        ValueError: If the response is malformed or reports an error.
+    """
+    query_id = random.getrandbits(16)
+    message = build_query(query_id, name, RECORD_TYPES[record_type], RECORD_CLASSES[record_class])
+    loop = asyncio.get_running_loop()
+    answer = loop.create_future()
+    transport, _ = await loop.create_datagram_endpoint(lambda: _QueryProtocol(query_id, answer), remote_addr=(server, port))
+    try:
+        async with asyncio.timeout(timeout):
+            while not answer.done():
+                transport.sendto(message)
+                await asyncio.wait((answer,), timeout=RETRY_INTERVAL)
+            data = answer.result()
+    except TimeoutError:
+        raise TimeoutError(f"No answer from {server} within {timeout} seconds") from None
+    finally:
+        transport.close()
+    return parse_response(data, query_id, RECORD_TYPES[record_type])
+
+async def lookup_ip(lookup, timeout):
+    """
+    Looks up the public IP address with one of the DNS_SERVICES.
+
+    Args:
+        lookup (dict): The "dns" entry of the service: "query", "type", "server" and optionally "class" and "port".
+        timeout (float): Seconds to wait for the answer.
+
+    Returns:
+        str or None: The first answer that is an IP address, else the first answer, None if there is none.
+    """
+    answers = await query(
+        lookup["query"], lookup["type"], lookup["server"], lookup.get("port", 53), lookup.get("class", "IN"), timeout
+    )
+    # A TXT record may carry more than the address, e.g. the client subnet a resolver forwarded
+    for answer in answers:
+        try:
+            ipaddress.ip_address(answer)
+            return answer
+        except ValueError:
+            continue
+    return answers[0] if answers else None
+
+def has_route(server):
+    """
+    Checks whether there is a route to the address of a name server, e.g. to skip IPv6 lookups on IPv4-only hosts.
+    Connecting a UDP socket sends nothing, it fails right away without a route.
+    """
+    family = socket.AF_INET6 if ":" in server else socket.AF_INET
+    try:
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            sock.connect((server, 53))
+        return True
+    except OSError:
+        return False
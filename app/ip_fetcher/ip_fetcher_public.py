@@ -1,10 +1,13 @@
-import random
 import socket
-import requests
-from datetime import datetime, timedelta
-import subprocess
-from app.utils.logger import logger
-from app.database.database import SessionLocal, FailedService, init_db
+import time
+import asyncio
+from collections import Counter, deque
+from app.utils.env_vars import PUBLIC_IP_PARALLEL, PUBLIC_IP_QUORUM, PUBLIC_IP_TIMEOUT, PUBLIC_IP_HEDGE_PERCENTILE, PUBLIC_IP_DNS
+from app.utils.http_client import get_http_client
+from app.utils.logger import logger, SAMPLED
+from app.utils import metrics
+from .service_scoreboard import get_scoreboard
+from .ip_fetcher_dns import DNS_SERVICES, DNS6_SERVICES, lookup_ip, has_route
 
 # List of services to get public IP from
 IP_SERVICES = [
@@ -20,101 +23,174 @@ IP_SERVICES = [
     {"name": "myexternalip.com", "url": "https://myexternalip.com/raw"},
     {"name": "whatismyip.akamai.com", "url": "https://whatismyip.akamai.com/"}
 ]
+if PUBLIC_IP_DNS:
+    # Raced and ranked like the HTTPS services, the scoreboard learns which answer fastest
+    IP_SERVICES += DNS_SERVICES
 
-def record_failed_service(service_name):
-    """
-    Record a failed service into the database.
-    """
-    session = SessionLocal()
-    try:
-        failed_service = FailedService(service_name=service_name)
-        session.add(failed_service)
-        session.commit()
-    except Exception as e:
-        logger.error(f"Error recording failed service {service_name}: {e}")
-    finally:
-        session.close()
+# Response times of the last successful requests, used to decide when to hedge
+_latencies = deque(maxlen=100)
 
+SERVICE_REQUEST_SECONDS = metrics.Histogram("wan_ip_public_service_request_seconds", "Latency of public IP service requests.", ["service"])
+SERVICE_REQUESTS = metrics.Counter("wan_ip_public_service_requests_total", "Public IP service requests by result.", ["service", "result"])
 
-def clean_old_failures():
+async def get_public_ip(services=None, version=4):
     """
-    Remove entries from the database that are older than 24 hours.
-    """
-    session = SessionLocal()
-    try:
-        cutoff_time = datetime.utcnow() - timedelta(hours=24)
-        session.query(FailedService).filter(FailedService.timestamp < cutoff_time).delete()
-        session.commit()
-    except Exception as e:
-        logger.error(f"Error cleaning old failures: {e}")
-    finally:
-        session.close()
+    Attempts to fetch the public IPv4 (or IPv6) address by racing multiple services.
 
+    The services are ranked by the scoreboard (fastest healthy services first, services in cooldown are skipped).
+    PUBLIC_IP_PARALLEL services are queried at the same time, each with a deadline of PUBLIC_IP_TIMEOUT seconds.
+    Failed or invalid answers are replaced by the next service. If no answer arrives within the
+    PUBLIC_IP_HEDGE_PERCENTILE of recent response times, an additional (hedged) request is started.
+    As soon as PUBLIC_IP_QUORUM services agree on an address it is returned and the remaining requests are cancelled.
 
-def get_failed_services():
-    """
-    Retrieve the names of services that failed in the last 24 hours.
-    """
-    session = SessionLocal()
-    try:
-        cutoff_time = datetime.utcnow() - timedelta(hours=24)
-        failed_services = session.query(FailedService.service_name).filter(FailedService.timestamp >= cutoff_time).all()
-        return {service.service_name for service in failed_services}
-    except Exception as e:
-        logger.error(f"Error fetching failed services: {e}")
-        return set()
-    finally:
-        session.close()
-
+    Args:
+        services (list): The services to race, IP_SERVICES by default.
+        version (int): The IP version the services report, 4 or 6.
 
-def get_public_ip():
-    """
-    Attempts to fetch the public IPv4 address by trying multiple services.
+    Returns:
+        tuple: The public IP address and the name of the service that completed the quorum, or (None, None).
     """
-    clean_old_failures()
-    failed_services = get_failed_services()
-    available_services = [service for service in IP_SERVICES if service["name"] not in failed_services]
+    scoreboard = await get_scoreboard()
+    available_services = scoreboard.rank(IP_SERVICES if services is None else services)
 
     if not available_services:
-        logger.error("No available services to fetch public IP after checking database.")
+        logger.error("No available services to fetch public IP, all services are cooling down.")
         return None, None
 
-    random.shuffle(available_services)
+    queued_services = iter(available_services)
+    quorum = max(1, min(PUBLIC_IP_QUORUM, len(available_services)))
 
-    for service in available_services:
-        try:
-            ip = fetch_ip_from_service(service)
-            if ip and is_valid_ip(ip):
-                return ip, service["name"]
-            logger.warning(f"Received an invalid or IPv6 address from {service['name']}: {ip}, trying the next service.")
-        except Exception as e:
-            logger.warning(f"Error fetching public IP from {service['name']}: {e}")
-            record_failed_service(service["name"])
+    running = {}  # Maps the request task to its service and start time
+    votes = Counter()
+    answers = {}  # Valid IP reported per service name
 
-    logger.error("All attempts to fetch a valid public IPv4 address failed.")
+    def start_next_request():
+        service = next(queued_services, None)
+        if service is None:
+            return False
+        running[asyncio.create_task(fetch_ip_from_service(service))] = (service, time.perf_counter())
+        return True
+
+    for _ in range(PUBLIC_IP_PARALLEL):
+        start_next_request()
+
+    hedge_delay = get_hedge_delay()
+    try:
+        while running:
+            done, _ = await asyncio.wait(running, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+
+            if not done:
+                # Slower than usual, hedge with one more service
+                logger.debug("No public IP answer within %.3fs, sending a hedged request.", hedge_delay)
+                if not start_next_request():
+                    hedge_delay = None
+                continue
+
+            for task in done:
+                service, start = running.pop(task)
+                latency = time.perf_counter() - start
+                try:
+                    ip = task.result()
+                except Exception as e:
+                    logger.warning("Error fetching public IP from %s: %s", service['name'], e)
+                    SERVICE_REQUESTS.inc(service["name"], "error")
+                    scoreboard.record_failure(service["name"])
+                    start_next_request()
+                    continue
+
+                SERVICE_REQUEST_SECONDS.observe(latency, service["name"])
+                if ip and is_valid_ip(ip, version):
+                    SERVICE_REQUESTS.inc(service["name"], "success")
+                    _latencies.append(latency)
+                    scoreboard.record_success(service["name"], latency)
+                    answers[service["name"]] = ip
+                    votes[ip] += 1
+                    if votes[ip] >= quorum:
+                        logger.debug("Public IP %s confirmed by %s service(s).", ip, votes[ip])
+                        # Services that disagreed with the quorum reported a wrong address
+                        for name, answer in answers.items():
+                            if answer != ip:
+                                logger.warning("Service %s reported %s, but the quorum agreed on %s.", name, answer, ip)
+                                scoreboard.record_failure(name)
+                        return ip, service["name"]
+                else:
+                    logger.warning("Received an invalid or no IPv%s address from %s: %s, trying the next service.", version, service['name'], ip)
+                    SERVICE_REQUESTS.inc(service["name"], "invalid")
+                    scoreboard.record_failure(service["name"])
+                    start_next_request()
+    finally:
+        # Cancel the stragglers
+        for task in running:
+            task.cancel()
+        # Write the scoreboard to the database once in a while, never on every request
+        if scoreboard.is_persist_due():
+            scoreboard.persist()
+
+    if votes:
+        ip, count = votes.most_common(1)[0]
+        logger.warning("Public IP quorum of %s not reached, using %s reported by %s service(s).", quorum, ip, count)
+        return ip, None
+
+    logger.error("All attempts to fetch a valid public IPv%s address failed.", version)
     return None, None
 
 
-def fetch_ip_from_service(service):
+def get_hedge_delay():
     """
-    Fetches the public IP address from a given service.
+    Returns the delay after which a hedged request is sent, based on the recent response times.
+    Returns None if hedging is disabled or there are not enough samples yet.
     """
-    response = requests.get(service["url"])
+    if not PUBLIC_IP_HEDGE_PERCENTILE or len(_latencies) < 10:
+        return None
+    ordered = sorted(_latencies)
+    index = min(len(ordered) - 1, int(len(ordered) * PUBLIC_IP_HEDGE_PERCENTILE / 100))
+    return ordered[index]
+
+
+async def get_dns_ips():
+    """
+    Fetches the public IPv4 and IPv6 address from the DNS services only, both at the same time.
+    The IPv6 lookups are skipped on hosts without an IPv6 route.
+
+    Returns:
+        tuple: The public IPv4 and IPv6 address, each None if it could not be fetched.
+    """
+    lookups = [get_public_ip(DNS_SERVICES)]
+    if DNS6_SERVICES and has_route(DNS6_SERVICES[0]["dns"]["server"]):
+        lookups.append(get_public_ip(DNS6_SERVICES, 6))
+    else:
+        logger.debug("No route to the IPv6 name servers, skipping the IPv6 lookup.")
+    results = await asyncio.gather(*lookups)
+    ipv4 = results[0][0]
+    ipv6 = results[1][0] if len(results) > 1 else None
+    return ipv4, ipv6
+
+
+async def fetch_ip_from_service(service):
+    """
+    Fetches the public IP address from a given service, over HTTPS or with a DNS lookup.
+    """
+    if "dns" in service:
+        ip = await lookup_ip(service["dns"], PUBLIC_IP_TIMEOUT)
+        logger.info("Fetching IP from: %s", service['name'], extra=SAMPLED)
+        return ip
+
+    response = await get_http_client().get(service["url"], timeout=PUBLIC_IP_TIMEOUT)
     response.raise_for_status()
 
-    logger.info(f"Fetching IP from: {service['name']}")
+    logger.info("Fetching IP from: %s", service['name'], extra=SAMPLED)
 
     if service["name"] == "ipinfo.io":
         return response.json().get("ip")
     return response.text.strip()
 
 
-def is_valid_ip(ip):
+def is_valid_ip(ip, version=4):
     """
-    Checks if the given IP address is a valid IPv4 address.
+    Checks if the given IP address is a valid IPv4 (or IPv6) address.
     """
     try:
-        socket.inet_pton(socket.AF_INET, ip)
+        socket.inet_pton(socket.AF_INET if version == 4 else socket.AF_INET6, ip)
         return True
     except socket.error:
         return False
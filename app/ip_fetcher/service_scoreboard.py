@@ -0,0 +1,188 @@
+import time
+import asyncio
+import threading
+from app.utils.env_vars import SCOREBOARD_PERSIST_INTERVAL
+from app.utils.logger import logger
+
+# Weight of the newest sample in the moving averages
+EWMA_ALPHA = 0.3
+# Cooldown after the first failure, doubled with every consecutive failure up to MAX_COOLDOWN
+BASE_COOLDOWN = 60
+MAX_COOLDOWN = 24 * 60 * 60
+# Lower bound for the success rate when ranking, so a flaky service is penalized but not divided by zero
+MIN_SUCCESS_RATE = 0.05
+
+class ServiceStats:
+    """
+    Health and speed statistics of a single public IP service.
+    """
+    __slots__ = ("latency", "success_rate", "consecutive_failures", "cooldown_until")
+
+    def __init__(self, latency=None, success_rate=1.0, consecutive_failures=0, cooldown_until=0.0):
+        self.latency = latency  # EWMA of the response time in seconds, None if never measured
+        self.success_rate = success_rate  # EWMA of successful requests (1.0 = always successful)
+        self.consecutive_failures = consecutive_failures
+        self.cooldown_until = cooldown_until  # Unix timestamp until which the service is skipped
+
+class ServiceScoreboard:
+    """
+    In-memory scoreboard of the public IP services.
+
+    Tracks an EWMA of the latency and success rate per service and puts failing services into a cooldown
+    with exponential backoff. The state is written to SQLite in a single batch every
+    SCOREBOARD_PERSIST_INTERVAL seconds instead of on every request, through the write-behind batcher.
+    """
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_persist = time.monotonic()
+
+    def _get(self, service_name):
+        stats = self._stats.get(service_name)
+        if stats is None:
+            stats = self._stats[service_name] = ServiceStats()
+        return stats
+
+    def record_success(self, service_name, latency):
+        """
+        Records a successful request and its response time in seconds.
+        """
+        with self._lock:
+            stats = self._get(service_name)
+            stats.latency = latency if stats.latency is None else EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * stats.latency
+            stats.success_rate = EWMA_ALPHA + (1 - EWMA_ALPHA) * stats.success_rate
+            stats.consecutive_failures = 0
+            stats.cooldown_until = 0.0
+            self._dirty = True
+
+    def record_failure(self, service_name):
+        """
+        Records a failed request and puts the service into a cooldown that doubles with every consecutive failure.
+        """
+        with self._lock:
+            stats = self._get(service_name)
+            stats.success_rate = (1 - EWMA_ALPHA) * stats.success_rate
+            stats.consecutive_failures += 1
+            cooldown = min(BASE_COOLDOWN * 2 ** (stats.consecutive_failures - 1), MAX_COOLDOWN)
+            stats.cooldown_until = time.time() + cooldown
+            self._dirty = True
+            logger.debug("Service %s is cooling down for %s seconds.", service_name, cooldown)
+
+    def rank(self, services):
+        """
+        Returns the services that are not cooling down, best first.
+
+        Services are ranked by their expected cost (latency divided by success rate). Services that
+        have never been measured are tried first, so every service gets a chance to be scored.
+
+        Args:
+            services (list): Service dicts with at least a "name" key.
+
+        Returns:
+            list: The available services, ordered from best to worst.
+        """
+        now = time.time()
+        with self._lock:
+            available = []
+            for service in services:
+                stats = self._stats.get(service["name"])
+                if stats is None:
+                    available.append((0.0, service))
+                elif stats.cooldown_until <= now:
+                    cost = (stats.latency or 0.0) / max(stats.success_rate, MIN_SUCCESS_RATE)
+                    available.append((cost, service))
+        available.sort(key=lambda entry: entry[0])
+        return [service for _, service in available]
+
+    def get_stats(self):
+        """
+        Returns a copy of the statistics per service name as plain dicts.
+        """
+        with self._lock:
+            return self._copy_stats()
+
+    def _copy_stats(self):
+        return {name: {slot: getattr(stats, slot) for slot in ServiceStats.__slots__} for name, stats in self._stats.items()}
+
+    def load(self):
+        """
+        Loads the last persisted scoreboard from the database.
+        """
+        # Imported here, so fetching the public IP doesn't need SQLAlchemy (e.g. `python -m app fetch --no-db`)
+        from app.database.database import SessionLocal, ServiceScore
+        session = SessionLocal()
+        try:
+            rows = session.query(ServiceScore).all()
+            with self._lock:
+                for row in rows:
+                    self._stats[row.service_name] = ServiceStats(
+                        row.latency, row.success_rate, row.consecutive_failures, row.cooldown_until
+                    )
+            logger.debug("Loaded scores of %s public IP services.", len(rows))
+        except Exception as e:
+            logger.error("Error loading service scoreboard: %s", e)
+        finally:
+            session.close()
+
+    def restore(self, stats):
+        """
+        Restores the statistics per service name, as returned by `get_stats`.
+        """
+        with self._lock:
+            for name, values in stats.items():
+                self._stats[name] = ServiceStats(**values)
+
+    def is_persist_due(self):
+        """
+        Returns True if the scoreboard changed and was last written more than SCOREBOARD_PERSIST_INTERVAL seconds ago.
+        """
+        return self._dirty and time.monotonic() - self._last_persist >= SCOREBOARD_PERSIST_INTERVAL
+
+    def persist(self, force=False):
+        """
+        Hands all service statistics to the write-behind batcher, which commits them in one transaction.
+        Does nothing if nothing changed, or if the last write is less than SCOREBOARD_PERSIST_INTERVAL seconds ago.
+
+        Args:
+            force (bool): Write even if the persist interval has not passed yet (e.g. on shutdown).
+        """
+        if not (self.is_persist_due() or (force and self._dirty)):
+            return
+        from app.database.database import ServiceScore
+        from app.database.write_behind import write_behind
+
+        with self._lock:
+            snapshot = self._copy_stats()
+            self._dirty = False
+            self._last_persist = time.monotonic()
+
+        # A newer score of the same service replaces a pending one, failed batches are retried by the batcher
+        for name, stats in snapshot.items():
+            row = ServiceScore(service_name=name, **stats)
+            write_behind.submit(("service_score", name), lambda session, row=row: session.merge(row))
+        logger.debug("Queued scores of %s public IP services for persisting.", len(snapshot))
+
+# The process wide scoreboard, loaded from the database on first use
+scoreboard = ServiceScoreboard()
+_loaded = False
+
+async def get_scoreboard():
+    """
+    Returns the process wide scoreboard, loading the persisted state on the first call.
+    """
+    global _loaded
+    if not _loaded:
+        _loaded = True
+        await asyncio.to_thread(scoreboard.load)
+    return scoreboard
+
+def restore_scoreboard(stats):
+    """
+    Restores the scoreboard from the warm start file, which is newer than the state persisted in the database.
+    Restoring an empty dict starts without scores and never touches the database.
+    """
+    global _loaded
+    _loaded = True
+    scoreboard.restore(stats)
@@ -1,28 +1,99 @@
 import os
+import logging
 from .logger import logger
 
 # Load environment variables with defaults
 API_HOST = os.getenv("API_HOST", "0.0.0.0")
 API_PORT = int(os.getenv("API_PORT", 9090))
+WORKERS = int(os.getenv("WORKERS", 1))  # API worker processes, one of them fetches the IPs for all
+SNAPSHOT_POLL_INTERVAL = float(os.getenv("SNAPSHOT_POLL_INTERVAL", 0.5))  # Seconds between checks for a new snapshot of the fetch leader
 UPDATE_INTERVAL = int(os.getenv("UPDATE_INTERVAL", 60))
+MIN_UPDATE_INTERVAL = float(os.getenv("MIN_UPDATE_INTERVAL", 5))  # Seconds between checks while the FritzBox reconnects
+MAX_UPDATE_INTERVAL = float(os.getenv("MAX_UPDATE_INTERVAL", 600))  # Max seconds between attempts when backing off after errors
+MAX_STALENESS = float(os.getenv("MAX_STALENESS", 3600))  # The IPs are fetched at least this often, even without a connection change
 USE_FALLBACK = os.getenv("USE_FALLBACK", "True") == "True"
 IP_SOURCE = os.getenv("IP_SOURCE", "fritzbox")
 FRITZBOX_HOST = os.getenv("FRITZBOX_HOST", "fritz.box")
+FRITZBOX_TIMEOUT = float(os.getenv("FRITZBOX_TIMEOUT", 10))  # Timeout in seconds for a single SOAP request
+FRITZBOX_BREAKER_THRESHOLD = int(os.getenv("FRITZBOX_BREAKER_THRESHOLD", 3))  # Failed requests in a row that open the circuit breaker
+FRITZBOX_BREAKER_RESET = float(os.getenv("FRITZBOX_BREAKER_RESET", 30))  # Seconds the breaker stays open before a probe request
+UPSTREAM_URL = os.getenv("UPSTREAM_URL", "")  # wan-ip-provider to replicate the IPs from instead of fetching them, empty to disable
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", 10))  # Timeout in seconds for requests to the upstream instance
+TARGETS_FILE = os.getenv("TARGETS_FILE", "")  # JSON file with additional FritzBoxes to monitor, empty to disable
+TARGET_CONCURRENCY = int(os.getenv("TARGET_CONCURRENCY", 16))  # Max targets fetched at the same time
+WAN_STATS_TTL = float(os.getenv("WAN_STATS_TTL", 5))  # Seconds a WAN statistics sample is served from cache
+WAN_SAMPLE_INTERVAL = int(os.getenv("WAN_SAMPLE_INTERVAL", 30))  # Seconds between WAN throughput samples, 0 disables
+WAN_HISTORY_SIZE = int(os.getenv("WAN_HISTORY_SIZE", 2880))  # Number of WAN samples kept (default: 24h at 30s)
+PUBLIC_IP_PARALLEL = int(os.getenv("PUBLIC_IP_PARALLEL", 3))  # Number of public IP services queried at once
+PUBLIC_IP_QUORUM = int(os.getenv("PUBLIC_IP_QUORUM", 2))  # Number of services that have to agree on the IP
+PUBLIC_IP_TIMEOUT = float(os.getenv("PUBLIC_IP_TIMEOUT", 5))  # Deadline in seconds per public IP request
+PUBLIC_IP_HEDGE_PERCENTILE = int(os.getenv("PUBLIC_IP_HEDGE_PERCENTILE", 90))  # 0 disables hedged requests
+PUBLIC_IP_DNS = os.getenv("PUBLIC_IP_DNS", "True") == "True"  # Race DNS lookups (UDP) against the HTTPS IP services
+SCOREBOARD_PERSIST_INTERVAL = int(os.getenv("SCOREBOARD_PERSIST_INTERVAL", 300))  # Seconds between scoreboard writes
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))  # SQLite connections kept open for the API and the background tasks
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", 64 * 1024 * 1024))  # Bytes of the database file read via mmap, 0 disables
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", 8192))  # Page cache per connection in KiB
+DB_WRITE_INTERVAL = float(os.getenv("DB_WRITE_INTERVAL", 1))  # Max seconds small writes wait to be committed in a batch
 ENABLE_REFRESH_IP_ENDPOINT = os.getenv("ENABLE_REFRESH_IP_ENDPOINT", "True") == "True"
 RATE_LIMIT_IP_RENEWAL = int(os.getenv("RATE_LIMIT_IP_RENEWAL", 300))  # Default to 300 seconds (5 minutes)
+SSE_KEEPALIVE_INTERVAL = int(os.getenv("SSE_KEEPALIVE_INTERVAL", 15))  # Seconds between keep-alive comments on /ips/watch
+WEBHOOK_URLS = [url.strip() for url in os.getenv("WEBHOOK_URLS", "").split(",") if url.strip()]  # Notified on IP changes
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", 4))  # Max webhook requests in flight
+WEBHOOK_MAX_RETRIES = int(os.getenv("WEBHOOK_MAX_RETRIES", 5))  # Retries per webhook delivery
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", 10))  # Timeout in seconds per webhook request
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 100))  # Max IP changes waiting for dispatch
+REFRESH_TIMEOUT = int(os.getenv("REFRESH_TIMEOUT", 60))  # Max seconds to wait for the reconnect after an IP refresh
+REFRESH_POLL_INTERVAL = float(os.getenv("REFRESH_POLL_INTERVAL", 1))  # Seconds between connection checks during a refresh
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # "text" or "json" (one JSON object per line)
+LOG_SAMPLE_INTERVAL = float(os.getenv("LOG_SAMPLE_INTERVAL", 300))  # Seconds between two logs of a repetitive message, 0 disables sampling
 
 # Dictionary to store the default values for comparison
 DEFAULTS = {
     "API_HOST": "0.0.0.0",
     "API_PORT": 9090,
+    "WORKERS": 1,
+    "SNAPSHOT_POLL_INTERVAL": 0.5,
     "UPDATE_INTERVAL": 60,
+    "MIN_UPDATE_INTERVAL": 5,
+    "MAX_UPDATE_INTERVAL": 600,
+    "MAX_STALENESS": 3600,
     "USE_FALLBACK": True,
     "IP_SOURCE": "fritzbox",
     "FRITZBOX_HOST": "fritz.box",
+    "FRITZBOX_TIMEOUT": 10,
+    "FRITZBOX_BREAKER_THRESHOLD": 3,
+    "FRITZBOX_BREAKER_RESET": 30,
+    "UPSTREAM_URL": "",
+    "UPSTREAM_TIMEOUT": 10,
+    "TARGETS_FILE": "",
+    "TARGET_CONCURRENCY": 16,
+    "WAN_STATS_TTL": 5,
+    "WAN_SAMPLE_INTERVAL": 30,
+    "WAN_HISTORY_SIZE": 2880,
+    "PUBLIC_IP_PARALLEL": 3,
+    "PUBLIC_IP_QUORUM": 2,
+    "PUBLIC_IP_TIMEOUT": 5,
+    "PUBLIC_IP_HEDGE_PERCENTILE": 90,
+    "PUBLIC_IP_DNS": True,
+    "SCOREBOARD_PERSIST_INTERVAL": 300,
+    "DB_POOL_SIZE": 10,
+    "DB_MMAP_SIZE": 64 * 1024 * 1024,
+    "DB_CACHE_SIZE": 8192,
+    "DB_WRITE_INTERVAL": 1,
     "ENABLE_REFRESH_IP_ENDPOINT": True,
     "RATE_LIMIT_IP_RENEWAL": 300,
-    "LOG_LEVEL": "INFO"
+    "SSE_KEEPALIVE_INTERVAL": 15,
+    "WEBHOOK_URLS": [],
+    "WEBHOOK_CONCURRENCY": 4,
+    "WEBHOOK_MAX_RETRIES": 5,
+    "WEBHOOK_TIMEOUT": 10,
+    "WEBHOOK_QUEUE_SIZE": 100,
+    "REFRESH_TIMEOUT": 60,
+    "REFRESH_POLL_INTERVAL": 1,
+    "LOG_LEVEL": "INFO",
+    "LOG_FORMAT": "text",
+    "LOG_SAMPLE_INTERVAL": 300
 }
 
 # Function to print out environment variables with info on whether they're set by user or default
@@ -30,6 +101,8 @@ def print_environment_variables():
     """
     Print out the environment variables with an indication of whether they were set by the user or defaulted.
     """
+    if not logger.isEnabledFor(logging.INFO):
+        return
     logger.info("Container initiated with the following Environment Variables:")
     
     # Helper function to check if it's using default
@@ -41,7 +114,4 @@ def print_environment_variables():
     
     for var, default in DEFAULTS.items():
         value = globals().get(var)
-        logger.info(f"{var}: {check_var(value, default)}")
-
-# Call the function to print out the environment variables on startup
-print_environment_variables()
+        logger.info("%s: %s", var, check_var(value, default))
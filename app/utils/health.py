@@ -0,0 +1,69 @@
+import time
+from .env_vars import MAX_STALENESS
+from . import ip_fetch_and_store
+from .metrics import Gauge
+from .shared_state import shared_state
+
+# Seconds a background loop may be late for its next cycle before it counts as stalled, covers slow cycles
+LIVENESS_GRACE = 120
+
+# Monotonic time by which the background loop of this process starts its next cycle, None before the first
+_next_cycle = None
+
+def expect_next_cycle(delay):
+    """
+    Records that the background loop of this process (the fetch loop, the replica sync or the follower
+    loop in multi-worker mode) starts its next cycle within `delay` seconds.
+    """
+    global _next_cycle
+    _next_cycle = time.monotonic() + delay
+
+def get_liveness():
+    """
+    Checks whether the background loop of this process is still cycling.
+
+    Returns:
+        tuple: True if it is alive, and the details for /healthz.
+    """
+    if _next_cycle is None:
+        return True, {"status": "starting"}
+    overdue = time.monotonic() - _next_cycle
+    if overdue > LIVENESS_GRACE:
+        return False, {"status": "stalled", "overdue_seconds": round(overdue, 1)}
+    return True, {"status": "ok", "next_cycle_in_seconds": round(max(-overdue, 0.0), 1)}
+
+def get_data_age():
+    """
+    Returns the seconds since the IPs were last confirmed to be current, None if they never were.
+    """
+    verified_at = ip_fetch_and_store.last_verified
+    if shared_state:
+        verified_at = max(verified_at, shared_state.verified_at)  # Followers only learn it from the leader
+    return max(time.time() - verified_at, 0.0) if verified_at else None
+
+def get_readiness(snapshot):
+    """
+    Checks whether the IPs of a snapshot are known and not older than MAX_STALENESS seconds.
+
+    Args:
+        snapshot (IPSnapshot): The snapshot being served.
+
+    Returns:
+        tuple: True if the IPs may be served, and the details for /readyz.
+    """
+    age = get_data_age()
+    details = {
+        "data_age_seconds": None if age is None else round(age, 1),
+        "max_data_age_seconds": MAX_STALENESS,
+    }
+    if not snapshot.ipv4:
+        return False, {"status": "not_ready", "reason": "No IP address known yet", **details}
+    if age is None or age > MAX_STALENESS:
+        return False, {"status": "not_ready", "reason": "The IP addresses are stale", **details}
+    return True, {"status": "ready", **details}
+
+DATA_AGE_SECONDS = Gauge(
+    "wan_ip_data_age_seconds",
+    "Seconds since the IPs were last confirmed to be current, -1 if they never were.",
+    function=lambda: get_data_age() if get_data_age() is not None else -1,
+)
@@ -0,0 +1,33 @@
+import asyncio
+import httpx
+from .logger import logger
+
+# One shared client per event loop. httpx connection pools are bound to the loop they were created on,
+# so a new client is created transparently if the code runs on a different loop (e.g. a CLI invocation).
+_client = None
+_client_loop = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the shared async HTTP client for the running event loop, creating it on first use.
+
+    Returns:
+        httpx.AsyncClient: The shared client. Requests should pass their own timeout.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop or _client.is_closed:
+        logger.debug("Creating shared async HTTP client.")
+        _client = httpx.AsyncClient()
+        _client_loop = loop
+    return _client
+
+async def close_http_client():
+    """
+    Closes the shared async HTTP client, if one was created on the running event loop.
+    """
+    global _client, _client_loop
+    if _client is not None and _client_loop is asyncio.get_running_loop():
+        await _client.aclose()
+    _client = None
+    _client_loop = None
@@ -0,0 +1,48 @@
+import time
+import asyncio
+from .ip_snapshot import get_snapshot
+
+# All waiters share one event, which is set and replaced on every change.
+# An idle subscriber therefore costs one suspended coroutine, no queue or buffer.
+_change_event = None
+
+def notify_ip_change():
+    """
+    Wakes up everybody waiting for an IP change. Must be called on the event loop after a new snapshot was published.
+    """
+    global _change_event
+    event, _change_event = _change_event, None
+    if event is not None:
+        event.set()
+
+async def wait_for_ip_change(since_version, timeout):
+    """
+    Waits until the IP snapshot version differs from `since_version` or the timeout passed.
+
+    A version that differs in any direction counts as a change, so clients that still hold a version
+    from before a restart get the current IPs right away.
+
+    Args:
+        since_version (int): The snapshot version the caller already knows.
+        timeout (float): The maximum time to wait in seconds.
+
+    Returns:
+        IPSnapshot: The current snapshot, which has the same version as `since_version` if the timeout passed.
+    """
+    global _change_event
+    deadline = time.monotonic() + timeout
+    snapshot = get_snapshot()
+    while snapshot.version == since_version:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if _change_event is None:
+            _change_event = asyncio.Event()
+        try:
+            # asyncio.timeout avoids the extra task per waiter that asyncio.wait_for would create
+            async with asyncio.timeout(remaining):
+                await _change_event.wait()
+        except TimeoutError:
+            pass
+        snapshot = get_snapshot()
+    return snapshot
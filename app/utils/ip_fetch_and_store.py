@@ -1,94 +1,134 @@
-import os
 import time
-from .env_vars import USE_FALLBACK, IP_SOURCE
-from app.database.database import SessionLocal, IPAddress
-from .logger import logger
-from app.ip_fetcher.ip_fetcher_fritzbox import get_external_ip, parse_ip, SOAP_ACTIONS, SOAP_PAYLOADS
-from app.ip_fetcher.ip_fetcher_public import get_public_ip
+import asyncio
+from app.database.database import SessionLocal, IPAddress, IPHistory
+from app.database.ip_history import utcnow
+from .logger import logger, SAMPLED
+from .ip_snapshot import publish_snapshot, get_snapshot
+from .shared_state import shared_state
+from .ip_events import notify_ip_change
+from .webhooks import webhook_dispatcher
+from .metrics import Counter, Gauge, Histogram
+from app.ip_fetcher.ip_fetcher import fetch_ips
 
-def fetch_and_store_ips():
+# Unix timestamp of the last fetch that delivered IPs, changed or not
+last_successful_fetch = 0.0
+# Unix timestamp of when the stored IPs were last confirmed to be current, by a fetch or an unchanged connection
+last_verified = 0.0
+
+FETCH_CYCLES = Counter("wan_ip_fetch_cycles_total", "IP fetch cycles by result.", ["result"])
+DB_COMMIT_SECONDS = Histogram("wan_ip_db_commit_seconds", "Duration of the database commit when the IPs changed.")
+SECONDS_SINCE_LAST_FETCH = Gauge(
+    "wan_ip_seconds_since_last_successful_fetch",
+    "Seconds since the last successful IP fetch, -1 if there was none yet.",
+    function=lambda: time.time() - last_successful_fetch if last_successful_fetch else -1,
+)
+
+# Serializes the fetch cycles, so a refresh or a fetch requested by another worker never overlaps the fetch loop
+_fetch_lock = asyncio.Lock()
+
+def mark_verified():
+    """
+    Records that the stored IPs are current as of now. The other workers read the time from the shared state.
+    """
+    global last_verified
+    last_verified = time.time()
+    if shared_state:
+        shared_state.verified_at = last_verified
+
+async def fetch_and_store_ips():
     """
-    Fetches the current external IPv4 and IPv6 addresses based on the configured source,
-    and updates or inserts the values into the database. It handles IP fetching from FritzBox or 
-    public sources and updates the database with the latest IPs.
+    Runs one fetch cycle, waiting for a cycle that is already running to finish first.
+
+    Returns:
+        bool: True if the IPs were fetched and stored (changed or not), False if the cycle failed.
+    """
+    async with _fetch_lock:
+        return await _fetch_and_store_ips()
+
+async def _fetch_and_store_ips():
+    """
+    Fetches the current external IPv4 and IPv6 addresses based on the configured source (see `fetch_ips`),
+    and updates or inserts the values into the database.
+    After every successful commit the in-memory IP snapshot is republished.
+
+    The database work runs in a worker thread to keep the event loop responsive.
 
     Logs all steps for traceability and error handling.
     """
-    db = SessionLocal()  # Start a session for DB access
+    global last_successful_fetch
     try:
-        # Initialize variables for IPs
-        ipv4, ipv6 = None, None
-
-        # Log the IP source being used
-        logger.info(f"Fetching IPs from source: {IP_SOURCE}")
-
-        # If IP source is FritzBox
-        if IP_SOURCE == "fritzbox":
-            try:
-                logger.info("Fetching IPs from FritzBox...")
-
-                # Fetch current IPs from FritzBox
-                ipv4_response = get_external_ip(SOAP_ACTIONS["ipv4"], SOAP_PAYLOADS["ipv4"])
-                ipv6_response = get_external_ip(SOAP_ACTIONS["ipv6"], SOAP_PAYLOADS["ipv6"])
-
-                # Parse the responses for IPv4 and IPv6
-                ipv4 = parse_ip(ipv4_response, "NewExternalIPAddress")
-                ipv6 = parse_ip(ipv6_response, "NewExternalIPv6Address")
-
-                logger.info(f"Fetched IPs from FritzBox: IPv4={ipv4}, IPv6={ipv6}")
-            except Exception as e:
-                logger.error(f"Error fetching IPs from FritzBox: {e}")
-                # If FritzBox fetch fails and fallback is enabled, try fetching public IP
-                if USE_FALLBACK:
-                    logger.info("FritzBox fetch failed, falling back to public IP fetch.")
-                    ipv4, _ = get_public_ip()
-                    ipv6 = None  # set IPv6 to None if using public IP fetch
-                else:
-                    logger.error("FritzBox fetch failed, and no fallback is enabled. Exiting.")
-                    return
-        
-        # If IP source is public IP fetch
-        elif IP_SOURCE == "public":
-            ipv6 = None  # set IPv6 to None as public IP fetch doesn't provide IPv6
-            try:
-                logger.info("Fetching public IP...")
-                ipv4, _ = get_public_ip()
-                logger.info(f"Fetched public IP: IPv4={ipv4}")
-            except Exception as e:
-                logger.error(f"Public IP fetch failed: {e}")
-                return
+        try:
+            ipv4, ipv6 = await fetch_ips()
+        except Exception:
+            FETCH_CYCLES.inc("error")  # Logged by fetch_ips
+            return False
 
-        else:
-            logger.error(f"Invalid IP source configuration: {IP_SOURCE}")
-            return
+        # Store the IPs without blocking the event loop
+        changed = await asyncio.to_thread(store_ips, ipv4, ipv6)
+        last_successful_fetch = time.time()
+        mark_verified()
+        FETCH_CYCLES.inc("changed" if changed else "unchanged")
+        served = get_snapshot()
+        # The database may have the IPs already, e.g. stored by `python -m app fetch`, but the API still serves the old ones
+        if changed or (ipv4, ipv6) != (served.ipv4, served.ipv6):
+            snapshot = publish_snapshot(ipv4, ipv6)  # Serve the new IPs to the API without DB reads
+            if shared_state:
+                shared_state.write_snapshot(snapshot)  # The other workers pick it up from the shared file
+            notify_ip_change()  # Push the change to /ips/watch subscribers
+            webhook_dispatcher.enqueue(snapshot)  # Never blocks, delivery runs in the background
+        return True
+
+    except Exception as e:
+        logger.error("Error updating IPs: %s", e)
+        FETCH_CYCLES.inc("error")
+        return False
+
+def store_ips(ipv4, ipv6):
+    """
+    Updates or inserts the given IPs into the database.
+    Every change is also appended to the IP history in the same transaction.
 
+    Args:
+        ipv4 (str): The current IPv4 address.
+        ipv6 (str or None): The current IPv6 address.
+
+    Returns:
+        bool: True if the database was changed, False if the IPs have not changed.
+    """
+    db = SessionLocal()  # Start a session for DB access
+    try:
         # Fetch the existing entry from the database (if any)
         existing_entry = db.query(IPAddress).first()
 
         # Check if the IPs have changed
         if existing_entry:
-            logger.info("Checking for IP changes...")
+            logger.info("Checking for IP changes...", extra=SAMPLED)
 
             if existing_entry.ipv4 == ipv4 and existing_entry.ipv6 == ipv6:
                 # No changes in IP addresses, log and return
-                logger.info("IPs have not changed. No update required.")
-                return
+                logger.info("IPs have not changed. No update required.", extra=SAMPLED)
+                return False
 
             # Update the existing entry
             existing_entry.ipv4 = ipv4
             existing_entry.ipv6 = ipv6
+            db.add(IPHistory(changed_at=utcnow(), ipv4=ipv4, ipv6=ipv6))
+            start = time.perf_counter()
             db.commit()  # Commit changes to DB
-            logger.info(f"Updated IPs in database: IPv4={ipv4}, IPv6={ipv6}")
+            DB_COMMIT_SECONDS.observe(time.perf_counter() - start)
+            logger.info("Updated IPs in database: IPv4=%s, IPv6=%s", ipv4, ipv6)
 
         else:
             # If no entry exists, create a new one
             logger.info("No existing IP entry found, creating a new one.")
             ip_entry = IPAddress(ipv4=ipv4, ipv6=ipv6)
             db.add(ip_entry)
+            db.add(IPHistory(changed_at=utcnow(), ipv4=ipv4, ipv6=ipv6))
+            start = time.perf_counter()
             db.commit()  # Commit new entry to DB
-            logger.info(f"Added new IPs to database: IPv4={ipv4}, IPv6={ipv6}")
+            DB_COMMIT_SECONDS.observe(time.perf_counter() - start)
+            logger.info("Added new IPs to database: IPv4=%s, IPv6=%s", ipv4, ipv6)
 
-    except Exception as e:
-        logger.error(f"Error updating IPs: {e}")
+        return True
     finally:
         db.close()  # Ensure DB session is closed
@@ -0,0 +1,110 @@
+import threading
+import time
+from typing import NamedTuple, Optional
+from calendar import timegm
+from app.database.database import SessionLocal, IPAddress, IPHistory
+from .logger import logger
+
+class IPSnapshot(NamedTuple):
+    """
+    Immutable view of the current IPv4/IPv6 pair.
+
+    Attributes:
+        version (int): Monotonic counter, bumped on every publish. 0 means "loaded from the database".
+        ipv4 (str or None): The current IPv4 address.
+        ipv6 (str or None): The current IPv6 address.
+        updated_at (float): Unix timestamp of when the snapshot was published.
+    """
+    version: int
+    ipv4: Optional[str]
+    ipv6: Optional[str]
+    updated_at: float
+
+# The current snapshot. Readers grab the reference once and never see a half-updated pair,
+# because a new tuple is swapped in as a whole.
+_snapshot: Optional[IPSnapshot] = None
+_lock = threading.Lock()
+
+def publish_snapshot(ipv4: Optional[str], ipv6: Optional[str]) -> IPSnapshot:
+    """
+    Publishes a new snapshot of the current IPs. Must be called after the database commit succeeded.
+
+    Args:
+        ipv4 (str or None): The new IPv4 address.
+        ipv6 (str or None): The new IPv6 address.
+
+    Returns:
+        IPSnapshot: The newly published snapshot.
+    """
+    global _snapshot
+    with _lock:
+        version = _snapshot.version + 1 if _snapshot else 1
+        _snapshot = IPSnapshot(version, ipv4, ipv6, time.time())
+        logger.debug("Published IP snapshot version %s: IPv4=%s, IPv6=%s", version, ipv4, ipv6)
+        return _snapshot
+
+def adopt_snapshot(snapshot: IPSnapshot) -> None:
+    """
+    Replaces the current snapshot with one published by another process, keeping its version.
+
+    Args:
+        snapshot (IPSnapshot): The snapshot to serve from now on.
+    """
+    global _snapshot
+    with _lock:
+        _snapshot = snapshot
+        logger.debug("Adopted IP snapshot version %s: IPv4=%s, IPv6=%s", snapshot.version, snapshot.ipv4, snapshot.ipv6)
+
+def get_snapshot() -> IPSnapshot:
+    """
+    Returns the current IP snapshot without touching the database.
+    Until the stored IPs were loaded on startup (see `load_snapshot`) or published, the snapshot is empty.
+
+    Returns:
+        IPSnapshot: The current snapshot.
+    """
+    snapshot = _snapshot
+    if snapshot is None:
+        return IPSnapshot(0, None, None, 0.0)
+    return snapshot
+
+def read_db_snapshot() -> Optional[IPSnapshot]:
+    """
+    Reads the stored IPs from the database into a snapshot with version 0.
+
+    Returns:
+        IPSnapshot or None: The stored IPs, None if the database can't be read.
+    """
+    db = SessionLocal()
+    try:
+        entry = db.query(IPAddress).first()
+        last_change = db.query(IPHistory.changed_at).order_by(IPHistory.changed_at.desc()).first()
+    except Exception as e:
+        logger.error("Error loading IP snapshot from database: %s", e)
+        return None
+    finally:
+        db.close()
+
+    if not entry:
+        return IPSnapshot(0, None, None, 0.0)
+    # The time of the last recorded change, if the history has it
+    updated_at = timegm(last_change[0].timetuple()) if last_change else time.time()
+    return IPSnapshot(0, entry.ipv4, entry.ipv6, updated_at)
+
+def load_snapshot() -> IPSnapshot:
+    """
+    Loads the stored IPs from the database into the snapshot, unless one was published or adopted already
+    (e.g. from the warm start file). Called once on startup, off the event loop, so requests never query SQLite.
+    If the database can't be read, an empty snapshot is returned but not cached, the first fetch publishes one.
+    """
+    global _snapshot
+    with _lock:
+        if _snapshot is not None:  # Another thread loaded or published in the meantime
+            return _snapshot
+
+        snapshot = read_db_snapshot()
+        if snapshot is None:
+            return IPSnapshot(0, None, None, 0.0)
+        _snapshot = snapshot
+        logger.debug("Loaded IP snapshot from database: IPv4=%s, IPv6=%s", _snapshot.ipv4, _snapshot.ipv6)
+        return _snapshot
@@ -0,0 +1,153 @@
+import os
+import time
+import fcntl
+import asyncio
+from app.fritzbox.targets import targets, restore_targets
+from .env_vars import SNAPSHOT_POLL_INTERVAL
+from .health import expect_next_cycle
+from .ip_events import notify_ip_change
+from .ip_fetch_and_store import fetch_and_store_ips
+from .ip_snapshot import IPSnapshot, adopt_snapshot, get_snapshot, read_db_snapshot
+from .logger import logger
+from .shared_state import shared_state
+
+LEADER_LOCK_FILE = "./data/leader.lock"
+
+# Seconds between two reloads of the target IPs by the followers
+TARGET_SYNC_INTERVAL = 5
+
+class LeaderLock:
+    """
+    Exclusive lock on a file, held by the fetch leader among the API workers.
+
+    The kernel releases the lock when the process exits, even on a crash, so the next worker
+    trying to acquire it takes over.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.held = False
+        self._fd = None
+
+    def acquire(self):
+        """
+        Tries to take the lock without blocking.
+
+        Returns:
+            bool: True if this process holds the lock.
+        """
+        if self.held:
+            return True
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        self.held = True
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)  # Closing the file releases the lock
+            self._fd = None
+        self.held = False
+
+leader_lock = LeaderLock(LEADER_LOCK_FILE)
+
+def is_leader():
+    """
+    Returns True if this worker fetches the IPs, which is always the case with a single worker.
+    """
+    return shared_state is None or leader_lock.held
+
+def follow_snapshot():
+    """
+    Serves the snapshot the leader wrote to the shared file, if there is one.
+    """
+    snapshot = shared_state.read_snapshot()
+    if snapshot is not None:
+        adopt_snapshot(snapshot)
+        notify_ip_change()
+
+def take_over_snapshot():
+    """
+    Continues the snapshot versions of the previous leader, so clients of /ips/watch don't see a jump back.
+    The database is the source of truth: if the previous leader stopped between its commit and writing
+    the shared file, or the file is left from an older run, the stored IPs are published with a new version.
+    """
+    stored = read_db_snapshot() or get_snapshot()
+    shared = shared_state.read_snapshot()
+    if shared is None or (shared.ipv4, shared.ipv6) != (stored.ipv4, stored.ipv6):
+        version = max(shared.version if shared else 0, get_snapshot().version) + 1
+        shared = IPSnapshot(version, stored.ipv4, stored.ipv6, stored.updated_at)
+        shared_state.write_snapshot(shared)
+    adopt_snapshot(shared)
+
+async def lead_or_follow(start_leading):
+    """
+    Coordinates the API workers: the worker holding the leader lock fetches the IPs, all others follow.
+
+    A follower serves the snapshots the leader writes to the shared file and reloads the target IPs
+    from the database. It tries to take the lock on every poll, so if the leader exits or crashes,
+    a follower takes over within SNAPSHOT_POLL_INTERVAL seconds.
+
+    Args:
+        start_leading (callable): Starts the fetch tasks, called once when this worker becomes the leader.
+    """
+    seq = None
+    next_target_sync = 0.0
+    try:
+        while not leader_lock.acquire():
+            if shared_state.snapshot_seq != seq:
+                seq = shared_state.snapshot_seq
+                follow_snapshot()
+            if targets and time.monotonic() >= next_target_sync:
+                next_target_sync = time.monotonic() + TARGET_SYNC_INTERVAL
+                try:
+                    await asyncio.to_thread(restore_targets)
+                except Exception as e:
+                    logger.error("Error reloading the target IPs: %s", e)
+            expect_next_cycle(SNAPSHOT_POLL_INTERVAL)
+            await asyncio.sleep(SNAPSHOT_POLL_INTERVAL)
+
+        logger.info("Worker %s is the fetch leader.", os.getpid())
+        shared_state.reset_sequences()
+        version = get_snapshot().version
+        await asyncio.to_thread(take_over_snapshot)
+        if get_snapshot().version != version:
+            notify_ip_change()  # On the event loop, the take-over runs in a thread
+        start_leading()
+        await serve_fetch_requests()
+    finally:
+        leader_lock.release()
+
+async def serve_fetch_requests():
+    """
+    Runs a fetch cycle whenever a follower asked for one, see `fetch_via_leader`.
+    """
+    while True:
+        requested = shared_state.fetch_requested
+        if requested > shared_state.fetch_completed:
+            await fetch_and_store_ips()
+            shared_state.fetch_completed = requested
+        await asyncio.sleep(SNAPSHOT_POLL_INTERVAL)
+
+async def fetch_via_leader(timeout):
+    """
+    Asks the leader for a fetch cycle, waits until it ran and serves the resulting snapshot.
+
+    Args:
+        timeout (float): The maximum time to wait in seconds.
+
+    Returns:
+        bool: False if the leader did not run the fetch within `timeout` seconds.
+    """
+    request = shared_state.request_fetch()
+    deadline = time.monotonic() + timeout
+    while shared_state.fetch_completed < request:
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(SNAPSHOT_POLL_INTERVAL)
+    follow_snapshot()
+    return True
@@ -1,21 +1,107 @@
 import logging
+import logging.handlers
+import atexit
+import json
+import queue
 import sys
 import os
+import time
 
 # Cant use env_vars.py here due to circular dependencies...
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_SAMPLE_INTERVAL = float(os.getenv("LOG_SAMPLE_INTERVAL", 300))
+
+# Distinct messages tracked by the sampling filter before the expired ones are dropped
+MAX_SAMPLED_MESSAGES = 1000
+
+# Pass as `extra` to rate limit a message that is logged on every cycle, see SamplingFilter
+SAMPLED = {"sampled": True}
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as a single line JSON object, for log collectors.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry)
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets a repetitive message through at most once per `interval` seconds.
+
+    Only messages logged with `extra=SAMPLED` are sampled, e.g. the ones of every fetch cycle.
+    They are told apart by their format string, so "Fetched IPs from FritzBox: IPv4=%s" is one message,
+    whatever the IPs are. The next message that passes reports how many were suppressed in between.
+    """
+
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self._next = {}  # Format string -> (monotonic time until which it is suppressed, suppressed count)
+
+    def filter(self, record):
+        if self.interval <= 0 or not getattr(record, "sampled", False):
+            return True
+        now = time.monotonic()
+        if len(self._next) >= MAX_SAMPLED_MESSAGES:
+            self._next = {msg: state for msg, state in self._next.items() if state[0] > now}
+        until, suppressed = self._next.get(record.msg, (0.0, 0))
+        if now < until:
+            self._next[record.msg] = (until, suppressed + 1)
+            return False
+        self._next[record.msg] = (now + self.interval, 0)
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread without formatting them.
+
+    The standard QueueHandler merges the message with its arguments in the calling thread,
+    here that is left to the listener. Only a traceback is rendered right away, as it can't be pickled
+    and the exception may change afterwards.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
 # Create logger
 logger = logging.getLogger("app_logger")
 logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
 
+# The actual write to stdout happens in a background thread, so logging never blocks the event loop
 handler = logging.StreamHandler(sys.stdout)
 
 # Define log format
-formatter = logging.Formatter(
-    "%(levelname)s:     %(message)s - %(asctime)s"
-)
+if LOG_FORMAT == "json":
+    formatter = JsonFormatter()
+else:
+    formatter = logging.Formatter(
+        "%(levelname)s:     %(message)s - %(asctime)s"
+    )
 
 handler.setFormatter(formatter)
-logger.addHandler(handler)
+
+log_queue = queue.SimpleQueue()
+queue_handler = DeferredQueueHandler(log_queue)
+queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_INTERVAL))
+listener = logging.handlers.QueueListener(log_queue, handler)
+listener.start()
+atexit.register(listener.stop)  # Writes the records still in the queue
+
+logger.addHandler(queue_handler)
 logger.propagate = False
@@ -0,0 +1,176 @@
+import json
+import random
+import asyncio
+from datetime import datetime
+from sqlalchemy import func, insert
+from app.database.database import SessionLocal, IPAddress, IPHistory
+from .env_vars import UPSTREAM_URL, UPSTREAM_TIMEOUT
+from .health import expect_next_cycle
+from .http_client import get_http_client
+from .ip_fetch_and_store import mark_verified
+from .ip_events import notify_ip_change
+from .ip_snapshot import IPSnapshot, adopt_snapshot
+from .logger import logger
+from .metrics import Counter
+from .shared_state import shared_state
+from .warm_start import save_warm_start
+
+# Seconds the upstream holds a long poll open when the IPs don't change
+LONG_POLL_SECONDS = 30
+
+# Backoff after a failed sync, doubled on every failure up to the maximum
+RETRY_DELAY = 1
+MAX_RETRY_DELAY = 60
+
+# History rows inserted per transaction while catching up
+HISTORY_BATCH_SIZE = 1000
+
+UPSTREAM_SYNCS = Counter("wan_ip_upstream_syncs_total", "Syncs of a replica with its upstream instance by result.", ["result"])
+
+async def sync_from_upstream(upstream_url=UPSTREAM_URL):
+    """
+    Keeps the IPs and the IP history in sync with an upstream wan-ip-provider (replica mode).
+
+    The replica long-polls /ips/watch?since=<version> of the upstream, which answers as soon as the IPs
+    changed. On a change, the missing history rows are pulled from /ips/history/export and the snapshot is
+    adopted with the version of the upstream, so clients see the same versions on every instance.
+    Every answer of the upstream confirms the IPs, and the state is written to the warm start file.
+    Runs as a task on the API server's event loop until it is cancelled.
+
+    Args:
+        upstream_url (str): Base URL of the upstream instance, e.g. "http://wan-ip-provider:9090".
+    """
+    logger.info("Starting replica sync from upstream %s.", upstream_url)
+    upstream_url = upstream_url.rstrip("/")
+    version = None
+    delay = RETRY_DELAY
+    while True:
+        try:
+            # The first request returns the current IPs right away, the following ones wait for a change
+            params = {"since": version, "timeout": LONG_POLL_SECONDS} if version is not None else {"since": 0, "timeout": 0.001}
+            expect_next_cycle(LONG_POLL_SECONDS + UPSTREAM_TIMEOUT)
+            response = await get_http_client().get(
+                f"{upstream_url}/ips/watch", params=params, timeout=LONG_POLL_SECONDS + UPSTREAM_TIMEOUT
+            )
+            response.raise_for_status()
+            data = response.json()
+
+            if version is None or data["changed"]:
+                await pull_history(upstream_url)
+                snapshot = IPSnapshot(
+                    data["version"],
+                    data["ipv4"],
+                    None if data["ipv6"] == "N/A" else data["ipv6"],
+                    data["updated_at"],
+                )
+                await asyncio.to_thread(store_current_ips, snapshot.ipv4, snapshot.ipv6)
+                adopt_snapshot(snapshot)
+                if shared_state:
+                    shared_state.write_snapshot(snapshot)
+                notify_ip_change()
+                logger.info("Synced IPs version %s from upstream: IPv4=%s, IPv6=%s", snapshot.version, snapshot.ipv4, snapshot.ipv6)
+                UPSTREAM_SYNCS.inc("changed")
+            else:
+                UPSTREAM_SYNCS.inc("unchanged")
+            version = data["version"]
+            delay = RETRY_DELAY
+            mark_verified()
+            await asyncio.to_thread(save_warm_start)
+        except Exception as e:
+            UPSTREAM_SYNCS.inc("error")
+            logger.error("Error syncing from upstream %s, retrying in %s seconds: %s", upstream_url, delay, e)
+            # Jitter keeps many replicas from hitting a recovering upstream at the same moment
+            retry_in = delay * random.uniform(0.5, 1.5)
+            expect_next_cycle(retry_in)
+            await asyncio.sleep(retry_in)
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+
+async def pull_history(upstream_url):
+    """
+    Copies the history rows the replica doesn't have yet from the upstream.
+
+    Only the rows since the latest local change are requested, streamed as NDJSON and inserted in batches.
+
+    Returns:
+        int: The number of inserted rows.
+    """
+    latest = await asyncio.to_thread(get_latest_change)
+    params = {"format": "ndjson"}
+    if latest is not None:
+        params["since"] = latest.isoformat() + "Z"
+
+    inserted = 0
+    batch = []
+    async with get_http_client().stream(
+        "GET", f"{upstream_url}/ips/history/export", params=params, timeout=UPSTREAM_TIMEOUT
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line:
+                batch.append(json.loads(line))
+            if len(batch) >= HISTORY_BATCH_SIZE:
+                inserted += await asyncio.to_thread(store_history, batch, latest)
+                batch = []
+    if batch:
+        inserted += await asyncio.to_thread(store_history, batch, latest)
+    if inserted:
+        logger.info("Copied %s history rows from upstream.", inserted)
+    return inserted
+
+def get_latest_change():
+    db = SessionLocal()
+    try:
+        return db.query(func.max(IPHistory.changed_at)).scalar()
+    finally:
+        db.close()
+
+def store_history(entries, latest):
+    """
+    Inserts history rows of the upstream, skipping rows at `latest` that are already stored.
+
+    Args:
+        entries (list): History entries as returned by /ips/history/export.
+        latest (datetime or None): The latest local change before the sync started.
+
+    Returns:
+        int: The number of inserted rows.
+    """
+    db = SessionLocal()
+    try:
+        # `since` includes rows at the latest local change, which may be stored already
+        existing = set()
+        if latest is not None:
+            existing = set(db.query(IPHistory.ipv4, IPHistory.ipv6).filter(IPHistory.changed_at == latest))
+
+        rows = []
+        for entry in entries:
+            changed_at = datetime.fromisoformat(entry["changed_at"].removesuffix("Z"))
+            if changed_at == latest and (entry["ipv4"], entry["ipv6"]) in existing:
+                continue
+            rows.append({"changed_at": changed_at, "ipv4": entry["ipv4"], "ipv6": entry["ipv6"]})
+        if rows:
+            db.execute(insert(IPHistory), rows)  # One executemany instead of an ORM object per row
+            db.commit()
+        return len(rows)
+    finally:
+        db.close()
+
+def store_current_ips(ipv4, ipv6):
+    """
+    Stores the current IPs of the upstream. Unlike `store_ips`, no history row is added,
+    the history is copied from the upstream.
+    """
+    if ipv4 is None:  # The upstream has no IPs yet
+        return
+    db = SessionLocal()
+    try:
+        entry = db.query(IPAddress).first()
+        if entry is None:
+            db.add(IPAddress(ipv4=ipv4, ipv6=ipv6))
+        elif (entry.ipv4, entry.ipv6) == (ipv4, ipv6):
+            return
+        else:
+            entry.ipv4, entry.ipv6 = ipv4, ipv6
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,161 @@
+import time
+import heapq
+import random
+import asyncio
+from contextlib import suppress
+from app.fritzbox.get_wan_statistics import get_connection_status
+from . import ip_fetch_and_store
+from .health import expect_next_cycle
+from .env_vars import (
+    UPDATE_INTERVAL, MIN_UPDATE_INTERVAL, MAX_UPDATE_INTERVAL, MAX_STALENESS, IP_SOURCE, TARGET_CONCURRENCY
+)
+from .logger import logger
+from .metrics import Counter
+from .warm_start import save_warm_start
+
+# Seconds the connection start derived from the uptime may move before it counts as a reconnect
+UPTIME_TOLERANCE = 2
+
+STATUS_CHECKS = Counter(
+    "wan_ip_status_checks_total", "Checks of the FritzBox connection status by the fetch loop by result.", ["result"]
+)
+
+async def fetch_ips_periodically(
+    interval=UPDATE_INTERVAL, min_interval=MIN_UPDATE_INTERVAL, max_interval=MAX_UPDATE_INTERVAL, max_staleness=MAX_STALENESS
+):
+    """
+    Keeps the stored IPs up to date, running the full IP fetch only when it is likely to find a change.
+
+    With the FritzBox as IP source, a cycle only asks the FritzBox for its connection status and uptime,
+    a single cheap SOAP request. The IPs are fetched when the connection was re-established (the status
+    changed or the uptime started over), when the status check or the last fetch failed (and again on the
+    next successful check, as a reconnect in between went unnoticed), or when the last successful fetch
+    is older than `max_staleness` seconds, and always on the first cycle, as the IPs may have changed
+    while the service was down. While the connection is down, the status is checked every
+    `min_interval` seconds, so the new IPs are picked up right after the reconnect.
+    With the public IP source there is no cheap signal, so every cycle fetches the IPs.
+
+    After a failed cycle the interval doubles up to `max_interval`, with jitter so that many instances
+    don't retry in lockstep. After every cycle the state is written to the warm start file.
+    Runs as a task on the API server's event loop until it is cancelled.
+
+    Args:
+        interval (float): Seconds between two cycles while nothing changes.
+        min_interval (float): Seconds between two cycles while the connection is down.
+        max_interval (float): Upper bound of the interval when backing off after errors.
+        max_staleness (float): Maximum age in seconds of the IPs before they are fetched anyway.
+    """
+    logger.info(
+        "Starting IP fetch loop with an interval of %s seconds (min %s, max %s, max staleness %s).",
+        interval, min_interval, max_interval, max_staleness,
+    )
+    last_status = None
+    connected_since = None
+    failures = 0
+    fetched = False  # Whether a fetch of this process succeeded, the warm start state may be outdated
+    while True:
+        delay = interval
+        failed = False
+        fetch = not fetched or time.time() - ip_fetch_and_store.last_successful_fetch > max_staleness
+
+        if IP_SOURCE != "fritzbox":
+            fetch = True
+        else:
+            try:
+                status, uptime = await get_connection_status()
+            except Exception as e:
+                logger.warning("Checking the FritzBox connection status failed: %s", e)
+                STATUS_CHECKS.inc("error")
+                # Let the fetch decide, it falls back to the public IP if enabled
+                fetch = True
+                last_status = connected_since = None
+            else:
+                since = time.monotonic() - uptime
+                changed = last_status is not None and (
+                    status != last_status or since > connected_since + UPTIME_TOLERANCE
+                )
+                STATUS_CHECKS.inc("changed" if changed else "unchanged")
+                if changed:
+                    logger.info("FritzBox connection is %s since %s seconds, fetching the IPs.", status, uptime)
+                    fetch = True
+                elif last_status is None:
+                    # Nothing to compare with after a failed check or fetch, the router may have reconnected meanwhile
+                    fetch = True
+                last_status, connected_since = status, since
+                if status != "Connected":
+                    # The IPs are only known once the connection is up again
+                    fetch = False
+                    delay = min_interval
+                elif not fetch:
+                    # Still the connection the IPs were fetched for, so they are current
+                    ip_fetch_and_store.mark_verified()
+
+        if fetch:
+            # The cycle failed only if the fetch did, a failed status check is made up for by the fallback
+            if await ip_fetch_and_store.fetch_and_store_ips():
+                fetched = True
+            else:
+                failed = True
+                last_status = connected_since = None  # The IPs of the current connection are not known
+
+        if failed:
+            failures += 1
+            # Jitter keeps many instances from hitting a recovering FritzBox or IP service at the same moment
+            delay = min(max(interval * 2 ** failures * random.uniform(0.5, 1.5), min_interval), max_interval)
+            logger.warning("IP fetch cycle failed %s times in a row, next attempt in %.1f seconds.", failures, delay)
+        else:
+            failures = 0
+        await asyncio.to_thread(save_warm_start)
+        expect_next_cycle(delay)
+        await asyncio.sleep(delay)
+
+async def fetch_targets_periodically(targets, fetch, concurrency=TARGET_CONCURRENCY):
+    """
+    Fetches every target in its own interval, with at most `concurrency` fetches at the same time.
+
+    The due times are kept in a heap and a fixed set of workers takes the due targets from a queue,
+    so the number of tasks does not grow with the number of targets. A target is scheduled again
+    only after its fetch finished, so a slow target is never fetched twice at the same time.
+    The first fetches are spread over one interval to avoid a burst of requests on startup.
+
+    Args:
+        targets (iterable): The targets, each with an `interval` in seconds.
+        fetch (callable): Coroutine function fetching a single target.
+        concurrency (int): The maximum number of fetches in flight.
+    """
+    order = iter(range(2**63))  # Tie breaker, so the heap never compares targets
+    now = time.monotonic()
+    due = [(now + random.uniform(0, target.interval), next(order), target) for target in targets]
+    heapq.heapify(due)
+    queue = asyncio.Queue()
+    rescheduled = asyncio.Event()
+
+    async def worker():
+        while True:
+            target = await queue.get()
+            started = time.monotonic()
+            try:
+                await fetch(target)
+            except Exception as e:
+                logger.error("Error fetching target %s: %s", target.id, e)
+            finally:
+                # Keep the cadence from the start of the fetch, but never schedule into the past
+                heapq.heappush(due, (max(started + target.interval, time.monotonic()), next(order), target))
+                rescheduled.set()
+
+    logger.info("Starting target fetch loop for %s targets with %s workers.", len(due), concurrency)
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        while True:
+            # Hand all due targets to the workers, then sleep until the next one is due or a target was rescheduled
+            while due and due[0][0] <= time.monotonic():
+                queue.put_nowait(heapq.heappop(due)[2])
+            rescheduled.clear()
+            delay = due[0][0] - time.monotonic() if due else None
+            with suppress(TimeoutError):
+                async with asyncio.timeout(delay):
+                    await rescheduled.wait()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,160 @@
+import os
+import mmap
+import time
+import struct
+from .env_vars import WORKERS, WAN_HISTORY_SIZE
+from .ip_snapshot import IPSnapshot
+from .logger import logger
+
+# File shared by the API workers in multi-worker mode
+SHARED_STATE_FILE = "./data/shared-state"
+
+# Layout of the file, all values little endian:
+#   0  snapshot sequence number (odd while the snapshot is written)
+#   8  snapshot: version, updated_at, length of the IPv4 and IPv6 address, both addresses
+# 120  number of fetches requested by the workers
+# 128  number of fetch requests served by the leader
+# 136  number of samples the WAN history was laid out for
+# 144  Unix timestamp of when the leader last confirmed the IPs to be current
+# 152  WAN history buffer, see WanHistory.nbytes
+SEQ = struct.Struct("<Q")
+TIMESTAMP = struct.Struct("<d")
+SNAPSHOT = struct.Struct("<QdHH46s46s")  # 45 characters is the longest text form of an IPv6 address
+SNAPSHOT_OFFSET = 8
+FETCH_REQUESTED_OFFSET = 120
+FETCH_COMPLETED_OFFSET = 128
+WAN_SIZE_OFFSET = 136
+VERIFIED_AT_OFFSET = 144
+WAN_HISTORY_OFFSET = 152
+
+# Seconds a reader waits for a write to finish. A write takes microseconds, a sequence number that
+# stays odd longer was left by a writer that died while writing, until the next leader resets it.
+READ_TIMEOUT = 0.1
+
+class SharedState:
+    """
+    State the fetch leader shares with the other API workers through a memory-mapped file.
+
+    The leader writes the current IP snapshot and the WAN history, the workers read them straight from
+    the page cache, without a database query or a message between the processes. Every write is
+    guarded by a sequence number (a seqlock): it is odd while a write is in progress, and a reader
+    that sees it change while reading discards what it read and tries again.
+    """
+
+    def __init__(self, path, wan_history_size):
+        # 8 bytes per counter and value, see WanHistory.nbytes
+        self.wan_history_nbytes = 24 + 32 * wan_history_size
+        size = WAN_HISTORY_OFFSET + self.wan_history_nbytes
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            grown = os.fstat(fd).st_size < size
+            if grown:
+                os.ftruncate(fd, size)  # New files are filled with zeros, which is "nothing written yet"
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)  # The mapping stays valid
+
+        # A WAN history laid out for another size, or by an older version of the file layout, is unusable, start over
+        if grown or self._get(WAN_SIZE_OFFSET) != wan_history_size:
+            self._map[WAN_HISTORY_OFFSET:size] = bytes(self.wan_history_nbytes)
+            self._set(WAN_SIZE_OFFSET, wan_history_size)
+
+    def reset_sequences(self):
+        """
+        Makes the sequence numbers even again if a writer died while writing, so readers don't wait for it.
+        Must only be called by the leader right after taking the leader lock, no other process writes then.
+        A snapshot that was only partly written is replaced by `take_over_snapshot`, as it differs from the database.
+        """
+        for offset in (0, WAN_HISTORY_OFFSET):
+            seq = self._get(offset)
+            if seq & 1:
+                logger.warning("The previous leader died while writing the shared state, resetting it.")
+                self._set(offset, seq + 1)
+
+    def _get(self, offset):
+        return SEQ.unpack_from(self._map, offset)[0]
+
+    def _set(self, offset, value):
+        SEQ.pack_into(self._map, offset, value)
+
+    @property
+    def snapshot_seq(self):
+        """
+        Changes with every written snapshot, cheap to poll.
+        """
+        return self._get(0)
+
+    def write_snapshot(self, snapshot):
+        """
+        Publishes an IP snapshot to all workers. Must only be called by the leader.
+        """
+        ipv4 = (snapshot.ipv4 or "").encode("ascii")
+        ipv6 = (snapshot.ipv6 or "").encode("ascii")
+        seq = self._get(0)
+        self._set(0, seq + 1)
+        SNAPSHOT.pack_into(self._map, SNAPSHOT_OFFSET, snapshot.version, snapshot.updated_at, len(ipv4), len(ipv6), ipv4, ipv6)
+        self._set(0, seq + 2)
+
+    def read_snapshot(self):
+        """
+        Returns the last written IPSnapshot, or None if no snapshot was written yet or it could not be read
+        within READ_TIMEOUT seconds (the worker keeps serving its last snapshot then).
+        """
+        deadline = time.monotonic() + READ_TIMEOUT
+        while True:
+            seq = self._get(0)
+            if seq == 0:
+                return None
+            if not seq & 1:
+                version, updated_at, ipv4_length, ipv6_length, ipv4, ipv6 = SNAPSHOT.unpack_from(self._map, SNAPSHOT_OFFSET)
+                if self._get(0) == seq:
+                    break
+            if time.monotonic() >= deadline:
+                logger.warning("The shared IP snapshot is still being written, the leader may have died while writing.")
+                return None
+            time.sleep(0)  # The leader is writing, let it finish
+
+        ipv4 = ipv4[:ipv4_length].decode("ascii") or None
+        ipv6 = ipv6[:ipv6_length].decode("ascii") or None
+        return IPSnapshot(version, ipv4, ipv6, updated_at)
+
+    @property
+    def fetch_requested(self):
+        return self._get(FETCH_REQUESTED_OFFSET)
+
+    def request_fetch(self):
+        """
+        Asks the leader to fetch the IPs right away.
+
+        Returns:
+            int: The request number, the fetch is done once `fetch_completed` reached it.
+        """
+        # Two workers requesting at the same time may get the same number, one fetch serves both
+        requested = self._get(FETCH_REQUESTED_OFFSET) + 1
+        self._set(FETCH_REQUESTED_OFFSET, requested)
+        return requested
+
+    @property
+    def fetch_completed(self):
+        return self._get(FETCH_COMPLETED_OFFSET)
+
+    @fetch_completed.setter
+    def fetch_completed(self, value):
+        self._set(FETCH_COMPLETED_OFFSET, value)
+
+    @property
+    def verified_at(self):
+        return TIMESTAMP.unpack_from(self._map, VERIFIED_AT_OFFSET)[0]
+
+    @verified_at.setter
+    def verified_at(self, value):
+        TIMESTAMP.pack_into(self._map, VERIFIED_AT_OFFSET, value)
+
+    def wan_history_buffer(self):
+        """
+        Returns the shared memory of the WAN history, to be passed to WanHistory.
+        """
+        return memoryview(self._map)[WAN_HISTORY_OFFSET:WAN_HISTORY_OFFSET + self.wan_history_nbytes]
+
+# The shared state of this worker, None if the API runs in a single process
+shared_state = SharedState(SHARED_STATE_FILE, WAN_HISTORY_SIZE) if WORKERS > 1 else None
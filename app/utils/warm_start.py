@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import threading
+from .logger import logger
+
+WARM_START_FILE = "./data/warm-start.json"
+
+# Bumped when the content of the file changes incompatibly, older files are ignored
+WARM_START_VERSION = 1
+
+# Serializes the writes of the fetch loop and the shutdown
+_lock = threading.Lock()
+
+def save_warm_start(path=WARM_START_FILE):
+    """
+    Writes the last known state (IPs, fetch and verification time, WAN sample and public IP service scores)
+    to the warm start file, so a restarted instance can serve it right away.
+
+    The file is replaced atomically, a crash while writing leaves the previous one intact.
+    Errors are logged, the service keeps running without a warm start file.
+    """
+    # The state is imported here, so `read_warm_start` works without the database (`python -m app get --no-db`)
+    from app.fritzbox.get_wan_statistics import wan_stats_cache
+    from app.ip_fetcher.service_scoreboard import scoreboard
+    from . import ip_fetch_and_store
+    from .ip_snapshot import get_snapshot
+
+    snapshot = get_snapshot()
+    state = {
+        "version": WARM_START_VERSION,
+        "snapshot": snapshot._asdict(),
+        "fetched_at": ip_fetch_and_store.last_successful_fetch,
+        "verified_at": ip_fetch_and_store.last_verified,
+        "wan_sample": wan_stats_cache.sample,
+        "wan_sampled_at": wan_stats_cache.sampled_at,
+        "scores": scoreboard.get_stats(),
+    }
+    data = json.dumps(state, separators=(",", ":"))
+    temporary = f"{path}.tmp"
+    try:
+        with _lock:
+            with open(temporary, "w") as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, path)
+    except OSError as e:
+        logger.error("Error writing the warm start file: %s", e)
+
+def read_warm_start(path=WARM_START_FILE):
+    """
+    Reads the warm start file.
+
+    Returns:
+        dict or None: The state written by `save_warm_start`, None if there is no usable warm start file.
+    """
+    try:
+        with open(path) as file:
+            state = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.error("Error reading the warm start file: %s", e)
+        return None
+    if not isinstance(state, dict) or state.get("version") != WARM_START_VERSION:
+        logger.warning("Ignoring warm start file of an unknown version.")
+        return None
+    return state
+
+def load_warm_start(path=WARM_START_FILE):
+    """
+    Restores the state written by `save_warm_start`, called on startup before the API serves requests.
+
+    The database stays the source of truth for the IPs: if they differ from the file, e.g. because the
+    previous run stopped between its commit and writing the file, the stored IPs are served instead.
+
+    Returns:
+        bool: True if the state was restored, False if there is no usable warm start file.
+    """
+    from app.fritzbox.get_wan_statistics import wan_stats_cache
+    from app.ip_fetcher.service_scoreboard import ServiceStats, restore_scoreboard
+    from . import ip_fetch_and_store
+    from .ip_snapshot import IPSnapshot, adopt_snapshot, read_db_snapshot
+
+    state = read_warm_start(path)
+    if state is None:
+        return False
+    # Everything is checked before the first value is restored, an incomplete file means a cold start
+    try:
+        snapshot = IPSnapshot(**state["snapshot"])
+        fetched_at = float(state["fetched_at"])
+        verified_at = float(state["verified_at"])
+        wan_sample = state["wan_sample"]
+        if wan_sample is not None:
+            wan_sampled_at = float(state["wan_sampled_at"])
+            if not isinstance(wan_sample, dict):
+                raise TypeError("the WAN sample is not an object")
+        scores = state["scores"]
+        for values in scores.values():
+            ServiceStats(**values)
+    except (TypeError, KeyError, ValueError, AttributeError) as e:
+        logger.error("Error reading the warm start file, starting without it: %r", e)
+        return False
+
+    stored = read_db_snapshot()
+    if stored is not None and (stored.ipv4, stored.ipv6) != (snapshot.ipv4, snapshot.ipv6):
+        logger.warning("The warm start file is older than the database, serving the stored IPs.")
+        snapshot = IPSnapshot(snapshot.version + 1, stored.ipv4, stored.ipv6, stored.updated_at)
+    adopt_snapshot(snapshot)
+
+    ip_fetch_and_store.last_successful_fetch = fetched_at
+    ip_fetch_and_store.last_verified = verified_at
+    if wan_sample is not None:
+        wan_stats_cache.restore(wan_sample, wan_sampled_at)
+    restore_scoreboard(scores)
+    logger.info(
+        "Warm start: serving IPv4=%s, IPv6=%s, last confirmed %.0f seconds ago.",
+        snapshot.ipv4, snapshot.ipv6, max(time.time() - verified_at, 0) if verified_at else -1,
+    )
+    return True
@@ -0,0 +1,127 @@
+import random
+import asyncio
+import httpx
+from .env_vars import WEBHOOK_URLS, WEBHOOK_CONCURRENCY, WEBHOOK_MAX_RETRIES, WEBHOOK_TIMEOUT, WEBHOOK_QUEUE_SIZE
+from .http_client import get_http_client
+from .logger import logger
+
+# Delay before the first retry, doubled with every further attempt up to MAX_RETRY_DELAY
+BASE_RETRY_DELAY = 1
+MAX_RETRY_DELAY = 60
+
+class WebhookTarget:
+    """
+    A webhook URL with its own delivery worker. Only the latest pending snapshot is kept per target.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.pending = None
+        self.wakeup = asyncio.Event()
+        self.delivered_version = None
+
+class WebhookDispatcher:
+    """
+    Delivers IP changes to the configured webhook URLs.
+
+    Changes are put into a bounded queue without ever blocking the fetch loop. Each target has its own worker
+    with retries and exponential backoff, and the number of requests in flight is capped by a semaphore.
+    If the IP changes again while a delivery is still pending or retrying, only the latest IP is delivered.
+    """
+
+    def __init__(self, urls=WEBHOOK_URLS, concurrency=WEBHOOK_CONCURRENCY, max_retries=WEBHOOK_MAX_RETRIES,
+                 timeout=WEBHOOK_TIMEOUT, queue_size=WEBHOOK_QUEUE_SIZE):
+        self.targets = [WebhookTarget(url) for url in urls]
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks = []
+
+    def enqueue(self, snapshot):
+        """
+        Queues an IP change for delivery. Never blocks: if the queue is full, the oldest change is dropped,
+        since only the latest IP matters.
+        """
+        if not self.targets:
+            return
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(snapshot)
+
+    def start(self):
+        """
+        Starts the dispatcher and one delivery worker per target on the running event loop.
+        """
+        if not self.targets:
+            return
+        logger.info("Starting webhook dispatcher for %s target(s).", len(self.targets))
+        self._tasks = [asyncio.create_task(self._dispatch())]
+        self._tasks += [asyncio.create_task(self._deliver_loop(target)) for target in self.targets]
+
+    async def stop(self):
+        """
+        Stops the dispatcher and all delivery workers.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _dispatch(self):
+        while True:
+            snapshot = await self._queue.get()
+            # Coalesce a flap into its final state
+            while not self._queue.empty():
+                snapshot = self._queue.get_nowait()
+            for target in self.targets:
+                target.pending = snapshot
+                target.wakeup.set()
+
+    async def _deliver_loop(self, target):
+        while True:
+            await target.wakeup.wait()
+            target.wakeup.clear()
+            snapshot, target.pending = target.pending, None
+            if snapshot is not None:
+                await self._deliver(target, snapshot)
+
+    async def _deliver(self, target, snapshot):
+        """
+        Sends one snapshot to a target, retrying with exponential backoff.
+        Gives up early if a newer snapshot is waiting for this target, the worker then delivers that one instead.
+        """
+        payload = {
+            "event": "ip_changed",
+            "version": snapshot.version,
+            "ipv4": snapshot.ipv4,
+            "ipv6": snapshot.ipv6,
+            "timestamp": snapshot.updated_at,
+        }
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    response = await get_http_client().post(target.url, json=payload, timeout=self.timeout)
+                response.raise_for_status()
+                target.delivered_version = snapshot.version
+                logger.info("Delivered IP change (version %s) to webhook %s", snapshot.version, target.url)
+                return
+            except httpx.HTTPError as e:
+                logger.warning("Webhook delivery to %s failed (attempt %s): %s", target.url, attempt + 1, e)
+
+            if attempt == self.max_retries:
+                break
+            delay = min(BASE_RETRY_DELAY * 2 ** attempt, MAX_RETRY_DELAY) * random.uniform(0.5, 1.0)
+            try:
+                # Wake up early if a newer IP arrives, it supersedes this delivery
+                async with asyncio.timeout(delay):
+                    await target.wakeup.wait()
+                logger.info("Skipping outdated webhook delivery (version %s) to %s", snapshot.version, target.url)
+                return
+            except TimeoutError:
+                pass
+
+        logger.error("Giving up webhook delivery (version %s) to %s", snapshot.version, target.url)
+
+# The dispatcher for the configured webhook URLs
+webhook_dispatcher = WebhookDispatcher()
@@ -0,0 +1,42 @@
+"""
+Drives requests straight through an ASGI app, without a server or sockets in between,
+so the benchmarks measure the app itself.
+"""
+import asyncio
+import time
+
+async def call(asgi_app, path):
+    """
+    Performs a single GET request against an ASGI app and returns the status code.
+    """
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    status = None
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await asgi_app(scope, receive, send)
+    return status
+
+async def measure(asgi_app, path, requests, concurrency=32):
+    """
+    Sends `requests` GET requests with the given concurrency and returns requests per second.
+    """
+    per_worker = requests // concurrency
+
+    async def worker():
+        for _ in range(per_worker):
+            assert await call(asgi_app, path) == 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return per_worker * concurrency / (time.perf_counter() - start)
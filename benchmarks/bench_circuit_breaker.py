@@ -0,0 +1,122 @@
+"""
+Benchmark of the FritzBox circuit breaker with an unreachable router.
+
+Points the FritzBox client to a socket that accepts connections but never answers, so every request
+runs into the timeout, and lets the public IP fallback query the fake IP services (see fakes.py).
+Runs fetch cycles and /wan-stats requests with the breaker disabled (the behaviour before) and enabled,
+and reports their latency. With the breaker, /wan-stats serves the last known sample marked as stale.
+Finally checks that a half-open probe answered with an undecodable response closes the breaker,
+instead of leaving the probe in flight and rejecting every later request.
+
+Usage:
+    python benchmarks/bench_circuit_breaker.py [--cycles 10] [--timeout 1]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import time
+
+import httpx
+
+# The database lives in ./data relative to the working directory, so run in a scratch directory
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(tempfile.mkdtemp(prefix="wan-ip-bench-"))
+os.makedirs("data", exist_ok=True)
+os.environ.setdefault("LOG_LEVEL", "CRITICAL")  # Every failed request would be logged
+os.environ["FRITZBOX_HOST"] = "127.0.0.2"  # The fakes listen on 127.0.0.1 only
+os.environ["IP_SOURCE"] = "fritzbox"
+os.environ["USE_FALLBACK"] = "True"
+
+from app.database.database import init_db  # noqa: E402
+from app.fritzbox.circuit_breaker import CLOSED, HALF_OPEN  # noqa: E402
+from app.fritzbox.client import FritzBoxClient, fritzbox_client  # noqa: E402
+from app.fritzbox.get_wan_statistics import get_wan_statistics, wan_stats_cache  # noqa: E402
+from app.ip_fetcher import ip_fetcher_public  # noqa: E402
+from app.utils.ip_fetch_and_store import fetch_and_store_ips  # noqa: E402
+from fakes import fake_ip_services, start_fakes  # noqa: E402
+from harness import percentile  # noqa: E402
+
+LAST_SAMPLE = {
+    "max_downstream_speed_bytes": 250000000, "max_upstream_speed_bytes": 40000000,
+    "uptime_seconds": 3600, "bytes_sent": 1000, "bytes_received": 5000,
+}
+
+def blackhole():
+    """
+    Listens on the FritzBox port without ever accepting, the kernel completes the handshakes and the requests time out.
+    """
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(("127.0.0.2", 49000))
+    server.listen(1024)
+    return server
+
+async def measure(operation, count):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        result = await operation()
+        latencies.append(time.perf_counter() - start)
+    return sorted(latencies), result
+
+async def check_probe_decoding_error():
+    """
+    Sends the half-open probe to a FritzBox answering with a body that can't be decoded.
+    """
+    def broken_gzip(request):
+        return httpx.Response(200, headers={"Content-Encoding": "gzip"}, content=b"not gzip")
+
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(broken_gzip))
+    client = FritzBoxClient("127.0.0.3", http_client=lambda: http_client)
+    client.breaker.failure_threshold = 1
+    client.breaker.record_failure(httpx.ConnectError("unreachable"))
+    client.breaker.reset_timeout = 0
+    client.breaker._retry_at = 0
+    try:
+        await client.call("ipv4")
+    except httpx.DecodingError:
+        pass
+    assert client.breaker.state != HALF_OPEN, "half-open probe left in flight"
+    assert client.breaker.state == CLOSED
+    await http_client.aclose()
+    print("half-open probe with an undecodable response: breaker closed")
+
+async def main(cycles, timeout):
+    init_db()
+    ip_fetcher_public.IP_SERVICES[:] = fake_ip_services(5)
+    fritzbox_client.timeout = timeout
+    threshold = fritzbox_client.breaker.failure_threshold
+
+    print(f"{'scenario':<26} {'p50 ms':>10} {'max ms':>10} {'total s':>8}  result")
+    for name, failure_threshold in (("without breaker", float("inf")), ("with breaker", threshold)):
+        fritzbox_client.breaker.failure_threshold = failure_threshold
+
+        latencies, ok = await measure(fetch_and_store_ips, cycles)
+        print(f"{'fetch, ' + name:<26} {percentile(latencies, 0.5) * 1000:>10.3f} {latencies[-1] * 1000:>10.3f} {sum(latencies):>8.2f}  ok={ok}")
+
+        wan_stats_cache.ttl = 0  # Expire the last known sample right away
+        wan_stats_cache.store(LAST_SAMPLE)
+        latencies, stats = await measure(get_wan_statistics, cycles)
+        print(f"{'wan-stats, ' + name:<26} {percentile(latencies, 0.5) * 1000:>10.3f} {latencies[-1] * 1000:>10.3f} {sum(latencies):>8.2f}  stale={stats.get('stale', False)}")
+    print(f"breaker: {fritzbox_client.breaker.state}, {fritzbox_client.breaker.rejected} requests rejected")
+    await fritzbox_client.aclose()
+    await check_probe_decoding_error()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cycles", type=int, default=10, help="Fetch cycles and /wan-stats requests per scenario")
+    parser.add_argument("--timeout", type=float, default=1, help="FRITZBOX_TIMEOUT in seconds")
+    args = parser.parse_args()
+
+    server = blackhole()
+    fakes = start_fakes(services=5)
+    try:
+        asyncio.run(main(args.cycles, args.timeout))
+    finally:
+        fakes.terminate()
+        fakes.wait()
+        server.close()
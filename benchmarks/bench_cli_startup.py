@@ -0,0 +1,90 @@
+"""
+Benchmark of the start-up time of the command line interface (python -m app).
+
+Runs every command several times against the fake FritzBox (see fakes.py), with `python -X importtime`,
+and reports the median wall time and the time spent importing modules, on top of a bare interpreter.
+For comparison, the same is measured for importing the API server (app.main), which is what a one-shot
+script had to import before. Exits with status 1 if the import time of a command without the database
+exceeds --max-import-ms, so a change that pulls a heavy dependency into the CLI shows up.
+
+Usage:
+    python benchmarks/bench_cli_startup.py [--runs 7] [--max-import-ms 400]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from fakes import start_fakes
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (arguments of the interpreter, whether it must stay under --max-import-ms)
+SCENARIOS = {
+    "get --no-db": (["-m", "app", "get", "--no-db"], True),
+    "fetch --no-db": (["-m", "app", "fetch", "--no-db"], True),
+    "stats": (["-m", "app", "stats"], True),
+    "get": (["-m", "app", "get"], False),
+    "fetch": (["-m", "app", "fetch"], False),
+    "import app.main (server)": (["-c", "import app.main"], False),
+}
+
+# A top level entry of -X importtime: "import time: <self us> | <cumulative us> | <module>"
+TOP_LEVEL_IMPORT = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \| (\S+)$", re.MULTILINE)
+
+def run(arguments, directory, env):
+    """
+    Runs the interpreter once, returns the wall time and the summed import time in seconds.
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *arguments], cwd=directory, env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(arguments)} failed: {result.stderr.strip()[-500:]}")
+    imports = sum(int(cumulative) for cumulative, _ in TOP_LEVEL_IMPORT.findall(result.stderr)) / 1e6
+    return wall, imports
+
+def measure(arguments, directory, env, runs):
+    results = [run(arguments, directory, env) for _ in range(runs)]
+    return statistics.median(wall for wall, _ in results), statistics.median(imports for _, imports in results)
+
+def main(runs, max_import_ms):
+    directory = tempfile.mkdtemp(prefix="wan-ip-bench-")
+    os.makedirs(os.path.join(directory, "data"))
+    env = {**os.environ, "PYTHONPATH": REPO_ROOT, "FRITZBOX_HOST": "127.0.0.1", "IP_SOURCE": "fritzbox"}
+    fakes = start_fakes()
+    try:
+        # The database and the warm start file read by `get`
+        run(["-m", "app", "fetch"], directory, env)
+        run(["-c", "from app.utils.warm_start import save_warm_start; save_warm_start()"], directory, env)
+
+        base_wall, base_imports = measure(["-c", "pass"], directory, env, runs)
+        print(f"{'command':<26} {'wall ms':>9} {'import ms':>10}")
+        exceeded = []
+        for name, (arguments, limited) in SCENARIOS.items():
+            wall, imports = measure(arguments, directory, env, runs)
+            imports -= base_imports
+            print(f"{name:<26} {wall * 1000:>9.0f} {imports * 1000:>10.0f}")
+            if limited and imports * 1000 > max_import_ms:
+                exceeded.append(name)
+        print(f"bare interpreter: {base_wall * 1000:.0f} ms wall, {base_imports * 1000:.0f} ms imports (subtracted)")
+    finally:
+        fakes.terminate()
+        fakes.wait()
+
+    if exceeded:
+        print(f"import time above {max_import_ms} ms: {', '.join(exceeded)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=7, help="Runs per command, the median is reported")
+    parser.add_argument("--max-import-ms", type=float, default=400, help="Import time budget of the commands without database")
+    args = parser.parse_args()
+    main(args.runs, args.max_import_ms)
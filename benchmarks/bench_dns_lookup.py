@@ -0,0 +1,120 @@
+"""
+Benchmark of the public IP lookups over DNS vs. the HTTPS public IP services.
+
+Serves the fake IP services over HTTPS with a throwaway certificate (generated with the openssl command
+line tool) next to fake name servers (see fakes.py), all behind an emulated network round trip time.
+Reports the latency of a single request to an HTTPS service, on a new connection and on a pooled one,
+and of a single DNS lookup. Then races whole `get_public_ip` calls over the HTTPS services only, the
+DNS services only and both, with a fresh scoreboard per race set, and counts which services completed
+the quorum. The HTTP client is closed after every call: with the default UPDATE_INTERVAL the pooled
+connections expire between two fetch cycles.
+
+Usage:
+    python benchmarks/bench_dns_lookup.py [--rtt 0.03] [--latency 0.002] [--services 4] [--count 50]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+# The database lives in ./data relative to the working directory, so run in a scratch directory
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(tempfile.mkdtemp(prefix="wan-ip-bench-"))
+os.makedirs("data", exist_ok=True)
+os.environ.setdefault("LOG_LEVEL", "CRITICAL")
+os.environ["SSL_CERT_FILE"] = os.path.abspath("cert.pem")  # httpx trusts the throwaway certificate only
+
+import httpx  # noqa: E402
+from app.database.database import init_db  # noqa: E402
+from app.ip_fetcher import ip_fetcher_public  # noqa: E402
+from app.ip_fetcher.ip_fetcher_dns import lookup_ip  # noqa: E402
+from app.ip_fetcher.service_scoreboard import restore_scoreboard  # noqa: E402
+from app.utils.http_client import close_http_client  # noqa: E402
+from fakes import fake_dns_services, fake_ip_services, start_fakes  # noqa: E402
+from harness import percentile  # noqa: E402
+
+def create_certificate():
+    subprocess.run([
+        "openssl", "req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1", "-nodes",
+        "-keyout", "key.pem", "-out", "cert.pem", "-days", "1", "-subj", "/CN=127.0.0.1",
+        "-addext", "subjectAltName=IP:127.0.0.1",
+    ], check=True, capture_output=True)
+    return os.path.abspath("cert.pem"), os.path.abspath("key.pem")
+
+async def measure(operation, count):
+    latencies = []
+    results = Counter()
+    for _ in range(count):
+        start = time.perf_counter()
+        results[await operation()] += 1
+        latencies.append(time.perf_counter() - start)
+    return sorted(latencies), results
+
+def report(name, latencies, results):
+    print(
+        f"{name:<28} {percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f}  "
+        + ", ".join(f"{result}: {count}" for result, count in results.most_common())
+    )
+
+async def main(services, count):
+    init_db()
+    https_services = fake_ip_services(services, tls=True)
+    dns_services = fake_dns_services(services)
+
+    print(f"{'single request':<28} {'p50 ms':>8} {'p99 ms':>8}  result")
+    url = https_services[0]["url"]
+
+    async def https_new_connection():
+        async with httpx.AsyncClient() as client:
+            return (await client.get(url)).text.strip()
+
+    report("HTTPS, new connection", *await measure(https_new_connection, count))
+    async with httpx.AsyncClient() as client:
+        await client.get(url)
+
+        async def https_pooled():
+            return (await client.get(url)).text.strip()
+
+        report("HTTPS, pooled connection", *await measure(https_pooled, count))
+    report("DNS lookup", *await measure(lambda: lookup_ip(dns_services[0]["dns"], 5), count))
+
+    print(f"\n{'get_public_ip':<28} {'p50 ms':>8} {'p99 ms':>8}  quorum completed by")
+    for name, race in (
+        ("HTTPS services", https_services),
+        ("DNS services", dns_services),
+        ("HTTPS and DNS services", https_services + dns_services),
+    ):
+        restore_scoreboard({})
+        ip_fetcher_public._latencies.clear()
+
+        async def fetch():
+            try:
+                _, service = await ip_fetcher_public.get_public_ip(race)
+                return service
+            finally:
+                await close_http_client()
+
+        report(name, *await measure(fetch, count))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rtt", type=float, default=0.03, help="Emulated round trip time to the services in seconds")
+    parser.add_argument("--latency", type=float, default=0.002, help="Processing time of the first service, grows per service")
+    parser.add_argument("--services", type=int, default=4, help="Number of HTTPS services and of name servers")
+    parser.add_argument("--count", type=int, default=50, help="Calls per scenario")
+    args = parser.parse_args()
+
+    cert, key = create_certificate()
+    fakes = start_fakes(
+        latency=args.latency, services=args.services, dns_services=args.services, rtt=args.rtt, tls_cert=cert, tls_key=key,
+    )
+    try:
+        asyncio.run(main(args.services, args.count))
+    finally:
+        fakes.terminate()
+        fakes.wait()
@@ -0,0 +1,72 @@
+"""
+Benchmark for the IP read endpoints (/ipv4, /ipv6, /ips).
+
+Compares the previous implementation (one SQLite session and query per request)
+with the in-memory IP snapshot. Requests are driven straight through the ASGI app,
+so routing, validation and JSON serialization are included in the numbers.
+
+Usage:
+    python benchmarks/bench_ip_endpoints.py [--requests 20000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+# The database lives in ./data relative to the working directory, so run in a scratch directory
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(tempfile.mkdtemp(prefix="wan-ip-bench-"))
+os.makedirs("data", exist_ok=True)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from fastapi import Depends, FastAPI  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+from app.api.api import app, get_db  # noqa: E402
+from app.database.database import SessionLocal, IPAddress, init_db  # noqa: E402
+from app.utils.ip_snapshot import publish_snapshot  # noqa: E402
+from asgi_driver import measure  # noqa: E402
+
+# The endpoints as they were implemented before the snapshot cache
+legacy_app = FastAPI()
+
+@legacy_app.get("/ipv4")
+def legacy_get_ipv4(db: Session = Depends(get_db)):
+    entry = db.query(IPAddress).first()
+    if entry and entry.ipv4:
+        return {"ipv4": entry.ipv4}
+    return {"error": "IPv4 address not found"}
+
+@legacy_app.get("/ipv6")
+def legacy_get_ipv6(db: Session = Depends(get_db)):
+    entry = db.query(IPAddress).first()
+    if entry and entry.ipv6:
+        return {"ipv6": entry.ipv6}
+    return {"error": "IPv6 address not found"}
+
+@legacy_app.get("/ips")
+def legacy_get_ips(db: Session = Depends(get_db)):
+    ips = db.query(IPAddress.ipv4, IPAddress.ipv6).all()
+    if not ips:
+        return {"message": "No IP addresses found", "data": []}
+    return [{"ipv4": ipv4, "ipv6": ipv6 if ipv6 else "N/A"} for ipv4, ipv6 in ips]
+
+async def main(requests):
+    init_db()
+    db = SessionLocal()
+    db.add(IPAddress(ipv4="203.0.113.7", ipv6="2001:db8::7"))
+    db.commit()
+    db.close()
+    publish_snapshot("203.0.113.7", "2001:db8::7")
+
+    print(f"{'endpoint':<8} {'sqlite req/s':>14} {'snapshot req/s':>16} {'speedup':>9}")
+    for path in ("/ipv4", "/ipv6", "/ips"):
+        before = await measure(legacy_app, path, requests)
+        after = await measure(app, path, requests)
+        print(f"{path:<8} {before:>14.0f} {after:>16.0f} {after / before:>8.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000, help="Requests per endpoint and variant")
+    asyncio.run(main(parser.parse_args().requests))
@@ -0,0 +1,100 @@
+"""
+Benchmark for the IP history at millions of rows.
+
+Fills a scratch database with synthetic IP changes, then measures the latency of the first
+page, a deep page (via cursor) and a time range page of /ips/history, and the throughput and
+peak Python memory of a full NDJSON export.
+
+Usage:
+    python benchmarks/bench_ip_history.py [--rows 1000000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# The database lives in ./data relative to the working directory, so run in a scratch directory
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(tempfile.mkdtemp(prefix="wan-ip-bench-"))
+os.makedirs("data", exist_ok=True)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app.api.api import export_history_ndjson  # noqa: E402
+from app.database.database import SessionLocal, engine, init_db  # noqa: E402
+from app.database.ip_history import get_history_page  # noqa: E402
+
+START = datetime(2020, 1, 1)
+
+def fill(rows, batch_size=50000):
+    """
+    Inserts `rows` history entries, one IP change per minute starting at START.
+    """
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for offset in range(0, rows, batch_size):
+            cursor.executemany(
+                "INSERT INTO ip_history (changed_at, ipv4, ipv6) VALUES (?, ?, ?)",
+                [
+                    (
+                        (START + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S.%f"),  # SQLAlchemy's format
+                        f"198.51.{i // 256 % 256}.{i % 256}",
+                        f"2001:db8::{i:x}",
+                    )
+                    for i in range(offset, min(offset + batch_size, rows))
+                ],
+            )
+        connection.commit()
+    finally:
+        connection.close()
+
+def timed(function, repeat=20):
+    """
+    Returns the median duration of `function` in milliseconds.
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+    return sorted(durations)[len(durations) // 2]
+
+def main(rows):
+    init_db()
+    start = time.perf_counter()
+    fill(rows)
+    print(f"Inserted {rows} rows in {time.perf_counter() - start:.1f}s")
+
+    db = SessionLocal()
+    try:
+        _, cursor = get_history_page(db, limit=100)
+        middle = START + timedelta(minutes=rows // 2)
+        _, deep_cursor = get_history_page(db, until=middle, limit=100)
+
+        print(f"first page (100 rows):      {timed(lambda: get_history_page(db, limit=100)):8.2f} ms")
+        print(f"second page via cursor:     {timed(lambda: get_history_page(db, cursor=cursor, limit=100)):8.2f} ms")
+        print(f"deep page via cursor:       {timed(lambda: get_history_page(db, cursor=deep_cursor, limit=100)):8.2f} ms")
+        print(f"time range page (1 day):    {timed(lambda: get_history_page(db, since=middle, until=middle + timedelta(days=1), limit=100)):8.2f} ms")
+    finally:
+        db.close()
+
+    start = time.perf_counter()
+    exported = sum(chunk.count("\n") for chunk in export_history_ndjson(None, None))
+    duration = time.perf_counter() - start
+
+    # Separate run for the memory measurement, tracemalloc slows down the export considerably
+    tracemalloc.start()
+    for _ in export_history_ndjson(None, None):
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"NDJSON export:              {exported / duration:8.0f} rows/s, peak memory {peak / 1024 / 1024:.1f} MiB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of history rows")
+    main(parser.parse_args().rows)
@@ -0,0 +1,109 @@
+"""
+Micro-benchmark of the logging done in one fetch cycle.
+
+Replays the log calls of a cycle with unchanged IPs (a status check, the IPv4 and IPv6 requests to the
+FritzBox and the database check) at LOG_LEVEL=INFO, once the way they were written before (f-strings,
+the SOAP response serialized again for a debug message, a synchronous StreamHandler) and once with the
+app logger (%-style arguments, queue handler, sampling of the messages of every cycle).
+Both write to /dev/null. Reports the CPU time per cycle of the calling thread, which is the event loop
+in the service, and of the whole process including the log writer thread.
+
+Usage:
+    python benchmarks/bench_logging.py [--cycles 20000]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.environ["LOG_LEVEL"] = "INFO"
+
+from app.utils import logger as app_logging  # noqa: E402
+from app.utils.logger import logger, SAMPLED  # noqa: E402
+
+URL = "http://fritz.box:49000/igdupnp/control/WANIPConn1"
+IPV4 = "198.51.100.7"
+IPV6 = "2001:db8::7"
+STATUS_RESPONSE = (
+    '<?xml version="1.0"?><s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '
+    's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body>'
+    '<u:GetStatusInfoResponse xmlns:u="urn:schemas-upnp-org:service:WANIPConnection:1">'
+    "<NewConnectionStatus>Connected</NewConnectionStatus><NewLastConnectionError>ERROR_NONE</NewLastConnectionError>"
+    "<NewUptime>86400</NewUptime></u:GetStatusInfoResponse></s:Body></s:Envelope>"
+)
+
+def old_cycle(log, response_xml):
+    log.debug(f"Sending SOAP request to {URL} with action status_info")
+    log.debug(f"SOAP response received: {ET.tostring(response_xml, 'unicode')}")
+    log.info(f"Fetching IPs from source: {'fritzbox'}")
+    log.info("Fetching IPs from FritzBox...")
+    for version, ip in (("ipv4", IPV4), ("ipv6", IPV6)):
+        log.debug(f"Requesting external {version} address from FritzBox")
+        log.debug(f"Sending SOAP request to {URL} with action {version}")
+        log.debug(f"Received response from FritzBox for {version}")
+        log.debug(f"Found IP address: {ip}")
+    log.info(f"Fetched IPs from FritzBox: IPv4={IPV4}, IPv6={IPV6}")
+    log.info("Checking for IP changes...")
+    log.info("IPs have not changed. No update required.")
+
+def new_cycle(log, response):
+    log.debug("Sending SOAP request to %s with action %s", URL, "status_info")
+    log.debug("SOAP response received: %s", response)
+    log.info("Fetching IPs from source: %s", "fritzbox", extra=SAMPLED)
+    log.info("Fetching IPs from FritzBox...", extra=SAMPLED)
+    for version, ip in (("ipv4", IPV4), ("ipv6", IPV6)):
+        log.debug("Requesting external %s address from FritzBox", version)
+        log.debug("Sending SOAP request to %s with action %s", URL, version)
+        log.debug("Received response from FritzBox for %s", version)
+        log.debug("Found IP address: %s", ip)
+    log.info("Fetched IPs from FritzBox: IPv4=%s, IPv6=%s", IPV4, IPV6, extra=SAMPLED)
+    log.info("Checking for IP changes...", extra=SAMPLED)
+    log.info("IPs have not changed. No update required.", extra=SAMPLED)
+
+def measure(cycle, log, argument, cycles, flush):
+    thread_start, process_start = time.thread_time(), time.process_time()
+    for _ in range(cycles):
+        cycle(log, argument)
+    thread = time.thread_time() - thread_start
+    flush()
+    process = time.process_time() - process_start
+    return thread / cycles * 1e6, process / cycles * 1e6
+
+def main(cycles):
+    devnull = open(os.devnull, "w")
+
+    # The logger as it was configured before: formatting and writing in the calling thread
+    old_logger = logging.getLogger("bench_old_logger")
+    old_logger.setLevel(logging.INFO)
+    old_handler = logging.StreamHandler(devnull)
+    old_handler.setFormatter(logging.Formatter("%(levelname)s:     %(message)s - %(asctime)s"))
+    old_logger.addHandler(old_handler)
+    old_logger.propagate = False
+
+    app_logging.handler.setStream(devnull)
+
+    def flush_queue():
+        # Stopping the listener writes the records still in the queue
+        app_logging.listener.stop()
+        app_logging.listener.start()
+
+    old = measure(old_cycle, old_logger, ET.fromstring(STATUS_RESPONSE), cycles, lambda: None)
+    new = measure(new_cycle, logger, STATUS_RESPONSE, cycles, flush_queue)
+    app_logging.queue_handler.filters[0].interval = 0  # LOG_SAMPLE_INTERVAL=0
+    unsampled = measure(new_cycle, logger, STATUS_RESPONSE, cycles, flush_queue)
+
+    print(f"{'logging':<22} {'caller CPU us/cycle':>20} {'process CPU us/cycle':>21}")
+    print(f"{'before':<22} {old[0]:>20.2f} {old[1]:>21.2f}")
+    print(f"{'after':<22} {new[0]:>20.2f} {new[1]:>21.2f}")
+    print(f"{'after, no sampling':<22} {unsampled[0]:>20.2f} {unsampled[1]:>21.2f}")
+    print(f"saved per cycle on the event loop: {old[0] - new[0]:.2f} us ({(1 - new[0] / old[0]) * 100:.0f}%)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cycles", type=int, default=20000, help="Number of replayed fetch cycles per variant")
+    args = parser.parse_args()
+    main(args.cycles)
@@ -0,0 +1,69 @@
+"""
+Benchmark for the cost of the metrics instrumentation.
+
+Measures the per-call cost of Counter.inc, Histogram.observe and rendering /metrics, and the
+throughput of /ipv4 through the ASGI app with and without the request latency middleware.
+
+Usage:
+    python benchmarks/bench_metrics_overhead.py [--requests 20000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import timeit
+
+# The database lives in ./data relative to the working directory, so run in a scratch directory
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(tempfile.mkdtemp(prefix="wan-ip-bench-"))
+os.makedirs("data", exist_ok=True)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app.api.api import app  # noqa: E402
+from app.database.database import init_db  # noqa: E402
+from app.utils.ip_snapshot import publish_snapshot  # noqa: E402
+from app.utils.metrics import REGISTRY, Counter, Histogram, Registry  # noqa: E402
+from asgi_driver import measure  # noqa: E402
+
+def per_call_ns(statement, number=200000):
+    """
+    Returns the best per-call duration of `statement` in nanoseconds.
+    """
+    return min(timeit.repeat(statement, number=number, repeat=5)) / number * 1e9
+
+def bare_app(asgi_app):
+    """
+    Returns the innermost ASGI app, i.e. the middleware stack without the metrics middleware.
+    """
+    asgi_app.middleware_stack = None
+    asgi_app.user_middleware = [m for m in asgi_app.user_middleware if m.cls.__name__ != "MetricsMiddleware"]
+    return asgi_app
+
+async def main(requests):
+    init_db()
+    publish_snapshot("203.0.113.7", "2001:db8::7")
+
+    registry = Registry()
+    counter = Counter("bench_total", "Benchmark counter.", ["result"], registry=registry)
+    histogram = Histogram("bench_seconds", "Benchmark histogram.", ["action"], registry=registry)
+    print(f"Counter.inc:                {per_call_ns(lambda: counter.inc('success')):8.0f} ns")
+    print(f"Histogram.observe:          {per_call_ns(lambda: histogram.observe(0.042, 'ipv4')):8.0f} ns")
+    print(f"time.perf_counter pair:     {per_call_ns(lambda: time.perf_counter() - time.perf_counter()):8.0f} ns")
+
+    # Warm up the app so every route has a histogram, then render the full registry
+    await measure(app, "/ipv4", 1000)
+    print(f"render /metrics:            {per_call_ns(REGISTRY.render, number=2000) / 1000:8.1f} us")
+
+    with_metrics = await measure(app, "/ipv4", requests)
+    without_metrics = await measure(bare_app(app), "/ipv4", requests)
+    overhead = (1 / with_metrics - 1 / without_metrics) * 1e6
+    print(f"/ipv4 with middleware:      {with_metrics:8.0f} req/s")
+    print(f"/ipv4 without middleware:   {without_metrics:8.0f} req/s ({overhead:.1f} us per request)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000, help="Requests per variant")
+    asyncio.run(main(parser.parse_args().requests))
@@ -0,0 +1,106 @@
+"""
+Benchmark of the replica mode.
+
+Starts an upstream instance against the fake FritzBox (see fakes.py), optionally fills its history with
+old rows, then starts replicas with UPSTREAM_URL pointing to it. Reports how long a replica takes to copy
+the history on startup, and how long an IP change takes from the upstream to the replicas, measured by
+polling /ipv4 of all instances every few milliseconds.
+
+Usage:
+    python benchmarks/bench_replica.py [--replicas 3] [--history 100000] [--duration 20] [--ip-change-every 3]
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from fakes import start_fakes
+from harness import percentile
+from service import start_service
+
+UPSTREAM_PORT = 9390
+POLL_INTERVAL = 0.005
+
+def fill_history(directory, rows):
+    """
+    Inserts `rows` old history entries into the database of the instance in `directory`.
+    """
+    start = datetime(2020, 1, 1)
+    connection = sqlite3.connect(os.path.join(directory, "data", "wan-ip-provider.db"), timeout=30)
+    try:
+        connection.executemany(
+            "INSERT INTO ip_history (changed_at, ipv4, ipv6) VALUES (?, ?, ?)",
+            (((start + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S.%f"), f"203.0.113.{i % 256}", None) for i in range(rows)),
+        )
+        connection.commit()
+    finally:
+        connection.close()
+
+async def watch(ports, duration):
+    """
+    Polls /ipv4 of all instances and returns the time each IPv4 address was first seen per port.
+    """
+    first_seen = {port: {} for port in ports}
+    async with httpx.AsyncClient() as client:
+        async def poll(port):
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                ipv4 = (await client.get(f"http://127.0.0.1:{port}/ipv4")).json().get("ipv4")
+                first_seen[port].setdefault(ipv4, time.monotonic())
+                await asyncio.sleep(POLL_INTERVAL)
+        await asyncio.gather(*(poll(port) for port in ports))
+    return first_seen
+
+def main(replicas, history, duration):
+    upstream, directory = start_service(UPSTREAM_PORT, {"UPDATE_INTERVAL": "1", "WAN_SAMPLE_INTERVAL": "0"})
+    processes = [upstream]
+    try:
+        if history:
+            fill_history(directory, history)
+
+        ports = [UPSTREAM_PORT + 1 + index for index in range(replicas)]
+        for port in ports:
+            start = time.perf_counter()
+            process, _ = start_service(port, {"UPSTREAM_URL": f"http://127.0.0.1:{UPSTREAM_PORT}"})
+            processes.append(process)
+            print(f"replica :{port} started and copied the history in {time.perf_counter() - start:.2f}s")
+
+        first_seen = asyncio.run(watch([UPSTREAM_PORT] + ports, duration))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    # Lag of every replica behind the upstream for every IP change, the IP seen first was no change
+    upstream_seen = first_seen[UPSTREAM_PORT]
+    initial = next(iter(upstream_seen))
+    lags = sorted(
+        seen - upstream_seen[ipv4]
+        for port in ports
+        for ipv4, seen in first_seen[port].items()
+        if ipv4 != initial and ipv4 in upstream_seen
+    )
+    print(f"IP changes on the upstream: {len(upstream_seen) - 1} in {duration:.0f}s")
+    if lags:
+        print(
+            f"replica lag: p50 {percentile(lags, 0.5) * 1000:.1f} ms, p99 {percentile(lags, 0.99) * 1000:.1f} ms, "
+            f"max {lags[-1] * 1000:.1f} ms (polled every {POLL_INTERVAL * 1000:.0f} ms)"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replicas", type=int, default=3, help="Number of replicas")
+    parser.add_argument("--history", type=int, default=100000, help="Old history rows of the upstream copied on startup")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds to watch for IP changes")
+    parser.add_argument("--ip-change-every", type=int, default=3, help="Change the IP every N fetches of the upstream")
+    args = parser.parse_args()
+
+    fakes = start_fakes(ip_change_every=args.ip_change_every, services=0)
+    try:
+        main(args.replicas, args.history, args.duration)
+    finally:
+        fakes.terminate()
+        fakes.wait()
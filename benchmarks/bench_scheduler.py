@@ -0,0 +1,104 @@
+"""
+Benchmark of the IP fetch loop: fixed vs. adaptive schedule.
+
+Runs the fetch loop against the fake FritzBox (see fakes.py) and forces a reconnect (a new IP) at random
+times. Compares the former fixed loop, which fetches IPv4 and IPv6 every interval, with the adaptive
+scheduler, which only checks the connection status and fetches on a change. Reports the requests sent
+to the FritzBox per minute and the time from the reconnect until the new IP is served.
+
+Usage:
+    python benchmarks/bench_scheduler.py [--interval 10] [--fast-interval 5] [--duration 60] [--reconnect-every 15]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import suppress
+
+# The database lives in ./data relative to the working directory, so run in a scratch directory
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(tempfile.mkdtemp(prefix="wan-ip-bench-"))
+os.makedirs("data", exist_ok=True)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["FRITZBOX_HOST"] = "127.0.0.1"
+os.environ["IP_SOURCE"] = "fritzbox"
+
+from app.database.database import init_db  # noqa: E402
+from app.fritzbox.client import fritzbox_client  # noqa: E402
+from app.utils.ip_fetch_and_store import fetch_and_store_ips  # noqa: E402
+from app.utils.ip_snapshot import get_snapshot  # noqa: E402
+from app.utils.scheduler import fetch_ips_periodically  # noqa: E402
+from fakes import start_fakes  # noqa: E402
+from harness import percentile  # noqa: E402
+
+POLL_INTERVAL = 0.01
+
+async def fixed_loop(interval):
+    """
+    The fetch loop before the adaptive scheduler.
+    """
+    while True:
+        await fetch_and_store_ips()
+        await asyncio.sleep(interval)
+
+def router_requests():
+    return sum(stats["count"] for name, stats in fritzbox_client.get_latency_stats().items() if name != "force_termination")
+
+async def run(loop, duration, reconnect_every):
+    """
+    Runs `loop` for `duration` seconds with random reconnects, returns the requests per minute and the detection latencies.
+    """
+    await fetch_and_store_ips()  # Start with known IPs, like after the first cycle
+    task = asyncio.create_task(loop)
+    requests = router_requests()
+    latencies = []
+    deadline = time.monotonic() + duration
+    try:
+        while time.monotonic() < deadline:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * reconnect_every)
+            ipv4 = get_snapshot().ipv4
+            reconnected = time.monotonic()
+            await fritzbox_client.call("force_termination")
+            while get_snapshot().ipv4 == ipv4 and time.monotonic() - reconnected < 4 * reconnect_every:
+                await asyncio.sleep(POLL_INTERVAL)
+            latencies.append(time.monotonic() - reconnected)
+    finally:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    return (router_requests() - requests) * 60 / (time.monotonic() - deadline + duration), sorted(latencies)
+
+async def main(interval, fast_interval, duration, reconnect_every):
+    init_db()
+    scenarios = [
+        (f"fixed, {interval}s", lambda: fixed_loop(interval)),
+        (f"adaptive, {interval}s", lambda: fetch_ips_periodically(interval, min_interval=0.5)),
+        (f"adaptive, {fast_interval}s", lambda: fetch_ips_periodically(fast_interval, min_interval=0.5)),
+    ]
+    print(f"{'schedule':<16} {'requests/min':>12} {'changes':>8} {'detect p50 s':>13} {'detect max s':>13}")
+    for name, loop in scenarios:
+        per_minute, latencies = await run(loop(), duration, reconnect_every)
+        print(
+            f"{name:<16} {per_minute:>12.1f} {len(latencies):>8} "
+            f"{percentile(latencies, 0.5):>13.2f} {latencies[-1]:>13.2f}"
+        )
+    await fritzbox_client.aclose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interval", type=float, default=10, help="UPDATE_INTERVAL of the fixed and the adaptive loop")
+    parser.add_argument("--fast-interval", type=float, default=5, help="UPDATE_INTERVAL of a second, faster adaptive loop")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds per schedule")
+    parser.add_argument("--reconnect-every", type=float, default=15, help="Average seconds between forced reconnects")
+    args = parser.parse_args()
+
+    fakes = start_fakes(services=0)
+    try:
+        asyncio.run(main(args.interval, args.fast_interval, args.duration, args.reconnect_every))
+    finally:
+        fakes.terminate()
+        fakes.wait()
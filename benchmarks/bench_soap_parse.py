@@ -0,0 +1,65 @@
+"""
+Benchmark of parsing FritzBox SOAP responses.
+
+Parses the responses of the fake FritzBox (see fakes.py) for the IP and WAN statistics actions, once the way
+it was done before (ElementTree of the whole document, searched with ".//" XPath) and once with
+`app.fritzbox.soap.extract`, which stops the expat parser as soon as the requested fields are found.
+Both parse the same response bodies as bytes.
+
+Usage:
+    python benchmarks/bench_soap_parse.py [--iterations 50000]
+"""
+import argparse
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app.fritzbox.soap import SOAP_ACTIONS, extract  # noqa: E402
+from fakes import SOAP_RESPONSE, FakeFritzBox  # noqa: E402
+
+# The output arguments read per action
+FIELDS = {
+    "ipv4": ("NewExternalIPAddress",),
+    "ipv6": ("NewExternalIPv6Address",),
+    "status_info": ("NewConnectionStatus", "NewUptime"),
+    "link_properties": ("NewLayer1DownstreamMaxBitRate", "NewLayer1UpstreamMaxBitRate"),
+    "total_bytes_sent": ("NewTotalBytesSent",),
+}
+
+def response_body(fritzbox, name):
+    _, service_type, action = SOAP_ACTIONS[name]
+    return SOAP_RESPONSE.format(action=action, service_type=service_type, fields=fritzbox.fields(action)).encode()
+
+def tree_parse(body, fields):
+    """
+    The former parsing: a tree of the whole document, then one XPath search per field.
+    """
+    root = ET.fromstring(body)
+    return {field: root.find(f".//{field}").text for field in fields}
+
+def measure(parse, body, fields, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        parse(body, fields)
+    return iterations / (time.perf_counter() - start)
+
+def main(iterations):
+    fritzbox = FakeFritzBox()
+    print(f"{'action':<18} {'bytes':>6} {'tree parses/s':>14} {'codec parses/s':>15} {'speedup':>8}")
+    for name, fields in FIELDS.items():
+        body = response_body(fritzbox, name)
+        assert tree_parse(body, fields) == extract(body, fields)
+        tree = measure(tree_parse, body, fields, iterations)
+        codec = measure(extract, body, fields, iterations)
+        print(f"{name:<18} {len(body):>6} {tree:>14.0f} {codec:>15.0f} {codec / tree:>7.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50000, help="Parses per action and approach")
+    args = parser.parse_args()
+    main(args.iterations)
@@ -0,0 +1,119 @@
+"""
+Benchmark of concurrent API reads while the fetch loop writes to SQLite.
+
+Runs /ips/history requests with many concurrent clients while a writer thread stores alternating
+IPs (an IP change and a history row per write, like fetch_and_store_ips) at a fixed rate. Compares
+a default SQLite engine (rollback journal, default pool) with the tuned engine of the app
+(WAL, synchronous=NORMAL, mmap, larger cache and pool).
+
+Usage:
+    python benchmarks/bench_sqlite_concurrency.py [--requests 3000] [--concurrency 8] [--rows 100000] [--write-rate 50]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+# The database lives in ./data relative to the working directory, so run in a scratch directory
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(tempfile.mkdtemp(prefix="wan-ip-bench-"))
+os.makedirs("data", exist_ok=True)
+os.environ.setdefault("LOG_LEVEL", "CRITICAL")  # The default engine logs "database is locked" errors
+
+from sqlalchemy import create_engine  # noqa: E402
+from app.api.api import app  # noqa: E402
+from app.database.database import Base, SessionLocal, engine  # noqa: E402
+from app.utils.ip_fetch_and_store import store_ips  # noqa: E402
+from asgi_driver import call  # noqa: E402
+from harness import percentile, run_scenario  # noqa: E402
+
+def fill(bind, rows, batch_size=50000):
+    """
+    Inserts `rows` history entries, one IP change per minute.
+    """
+    start = datetime(2020, 1, 1)
+    connection = bind.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for offset in range(0, rows, batch_size):
+            cursor.executemany(
+                "INSERT INTO ip_history (changed_at, ipv4, ipv6) VALUES (?, ?, ?)",
+                [
+                    ((start + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S.%f"), f"198.51.100.{i % 256}", None)
+                    for i in range(offset, min(offset + batch_size, rows))
+                ],
+            )
+        connection.commit()
+    finally:
+        connection.close()
+
+class Writer(threading.Thread):
+    """
+    Stores alternating IPs `rate` times per second, so every write is an IP change with a history row.
+    """
+
+    def __init__(self, rate):
+        super().__init__(daemon=True)
+        self.interval = 1 / rate
+        self.writes = 0
+        self.errors = 0
+        self.latencies = []
+        self.running = True
+
+    def run(self):
+        next_write = time.perf_counter()
+        while self.running:
+            start = time.perf_counter()
+            # store_ips logs and swallows database errors, a False result on a change means it failed
+            if store_ips(f"203.0.113.{(self.writes + self.errors) % 2}", None):
+                self.writes += 1
+            else:
+                self.errors += 1
+            self.latencies.append(time.perf_counter() - start)
+            next_write += self.interval
+            time.sleep(max(0.0, next_write - time.perf_counter()))
+
+async def read_history():
+    return await call(app, "/ips/history") == 200
+
+async def run(bind, requests, concurrency, rows, write_rate):
+    SessionLocal.configure(bind=bind)
+    Base.metadata.create_all(bind=bind)
+    fill(bind, rows)
+
+    writer = Writer(write_rate)
+    writer.start()
+    result = await run_scenario(read_history, requests, concurrency)
+    writer.running = False
+    writer.join()
+
+    writer.latencies.sort()
+    result["write_p99_ms"] = round(percentile(writer.latencies, 0.99) * 1000, 3)
+    result["write_errors"] = writer.errors
+    return result
+
+async def main(requests, concurrency, rows, write_rate):
+    # The engine as it was configured before the tuning, on a separate file
+    default_engine = create_engine("sqlite:///./data/default.db", connect_args={"check_same_thread": False})
+
+    print(f"{'engine':<8} {'reads/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'read errors':>12} {'write p99 ms':>13} {'write errors':>13}")
+    for name, bind in (("default", default_engine), ("tuned", engine)):
+        result = await run(bind, requests, concurrency, rows, write_rate)
+        print(
+            f"{name:<8} {result['throughput_rps']:>9.0f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['max_ms']:>8.2f} "
+            f"{result['errors']:>12} {result['write_p99_ms']:>13.2f} {result['write_errors']:>13}"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=3000, help="Number of /ips/history requests per engine")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent API clients")
+    parser.add_argument("--rows", type=int, default=100000, help="Number of history rows")
+    parser.add_argument("--write-rate", type=float, default=50, help="IP changes written per second")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.rows, args.write_rate))
@@ -0,0 +1,84 @@
+"""
+Benchmark of the multi-target fetch loop.
+
+Configures many targets pointing to the fake FritzBox (see fakes.py), runs the target scheduler
+for a while and reports the fetch throughput, how late the fetches ran compared to their interval,
+and the memory per target.
+
+Usage:
+    python benchmarks/bench_targets.py [--targets 500] [--interval 5] [--duration 20] [--latency 0.02]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import suppress
+
+# The database lives in ./data relative to the working directory, so run in a scratch directory
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(tempfile.mkdtemp(prefix="wan-ip-bench-"))
+os.makedirs("data", exist_ok=True)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app.database.database import init_db  # noqa: E402
+from app.fritzbox.targets import targets, init_targets, fetch_target  # noqa: E402
+from app.utils.env_vars import TARGET_CONCURRENCY  # noqa: E402
+from app.utils.scheduler import fetch_targets_periodically  # noqa: E402
+from fakes import start_fakes  # noqa: E402
+from harness import max_rss_mib, percentile  # noqa: E402
+
+async def main(count, interval, duration):
+    with open("targets.json", "w") as file:
+        json.dump([{"id": f"site-{i}", "host": "127.0.0.1", "interval": interval} for i in range(count)], file)
+
+    init_db()
+    tracemalloc.start()
+    init_targets("targets.json")
+    per_target = tracemalloc.get_traced_memory()[0] / count
+    tracemalloc.stop()  # Slows down the fetches considerably
+
+    # Measure the gap between two fetches of the same target, it should stay close to the interval
+    last_fetch = {}
+    gaps = []
+
+    async def fetch(target):
+        now = time.monotonic()
+        if target.id in last_fetch:
+            gaps.append(now - last_fetch[target.id])
+        last_fetch[target.id] = now
+        return await fetch_target(target)
+
+    task = asyncio.create_task(fetch_targets_periodically(list(targets.values()), fetch))
+    await asyncio.sleep(duration)
+    task.cancel()
+    with suppress(asyncio.CancelledError):
+        await task
+
+    fetches = len(gaps) + len(last_fetch)
+    errors = sum(1 for target in targets.values() if target.last_error)
+    gaps.sort()
+    print(f"targets: {count}, interval: {interval}s, workers: {TARGET_CONCURRENCY}")
+    print(f"fetches:              {fetches} ({fetches / duration:.1f}/s, expected {count / interval:.1f}/s)")
+    print(f"gap between fetches:  p50 {percentile(gaps, 0.5):.2f}s, p99 {percentile(gaps, 0.99):.2f}s")
+    print(f"targets with errors:  {errors}")
+    print(f"memory per target:    {per_target / 1024:.1f} KiB, max RSS {max_rss_mib():.1f} MiB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", type=int, default=500, help="Number of targets")
+    parser.add_argument("--interval", type=float, default=5, help="Fetch interval per target in seconds")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds to run the fetch loop")
+    parser.add_argument("--latency", type=float, default=0.02, help="Response delay of the fake FritzBox in seconds")
+    args = parser.parse_args()
+
+    fakes = start_fakes(args.latency, services=0)
+    try:
+        asyncio.run(main(args.targets, args.interval, args.duration))
+    finally:
+        fakes.terminate()
+        fakes.wait()
@@ -0,0 +1,81 @@
+"""
+Benchmark of restarting the service with and without the warm start file.
+
+Runs the service once against the fake FritzBox (see fakes.py) to fill its database and warm start file,
+then restarts it in the same directory, once after deleting the warm start file (a cold start, like before)
+and once with it. Reports the time from starting the process until /ipv4 serves an address, until /readyz
+answers 200 and until /wan-stats returns statistics. The restarts are repeated with the FritzBox unreachable,
+where a cold start can't confirm the stored IPs at all.
+
+Usage:
+    python benchmarks/bench_warm_start.py [--latency 0.5] [--deadline 15]
+"""
+import argparse
+import os
+import time
+
+import httpx
+from fakes import start_fakes
+from service import start_service
+
+PORT = 9490
+POLL_INTERVAL = 0.01
+
+def wait_for(url, check, start, deadline):
+    """
+    Polls `url` until `check(response)` is true, returns the seconds since `start` or None after `deadline` seconds.
+    """
+    while time.monotonic() - start < deadline:
+        try:
+            if check(httpx.get(url, timeout=deadline)):
+                return time.monotonic() - start
+        except httpx.HTTPError:
+            pass
+        time.sleep(POLL_INTERVAL)
+    return None
+
+def restart(directory, env, deadline):
+    start = time.monotonic()
+    process, _ = start_service(PORT, env, timeout=deadline, directory=directory)
+    try:
+        ipv4 = time.monotonic() - start
+        ready = wait_for(f"http://127.0.0.1:{PORT}/readyz", lambda r: r.status_code == 200, start, deadline)
+        wan_stats = wait_for(f"http://127.0.0.1:{PORT}/wan-stats", lambda r: "error" not in r.json(), start, deadline)
+        stale = httpx.get(f"http://127.0.0.1:{PORT}/ipv4").headers.get("X-Data-Stale")
+    finally:
+        process.terminate()  # A graceful shutdown, which writes the warm start file
+        process.wait()
+    return ipv4, ready, wan_stats, stale
+
+def main(latency, deadline):
+    fakes = start_fakes(latency=latency)
+    try:
+        env = {"WAN_SAMPLE_INTERVAL": "5", "USE_FALLBACK": "False"}
+        process, directory = start_service(PORT, env)
+        time.sleep(2 * latency + 1)  # Let the first fetch cycle and WAN sample finish
+        process.terminate()
+        process.wait()
+        warm_start_file = os.path.join(directory, "data", "warm-start.json")
+
+        def fmt(seconds):
+            return f"{seconds:>9.2f}" if seconds is not None else f"{'>' + str(deadline):>9}"
+
+        print(f"{'restart':<30} {'/ipv4 s':>9} {'/readyz s':>9} {'/wan-stats s':>12}  X-Data-Stale")
+        for fritzbox, host in (("reachable", "127.0.0.1"), ("unreachable", "127.0.0.2")):
+            for name in ("cold", "warm"):
+                if name == "cold" and os.path.exists(warm_start_file):
+                    os.rename(warm_start_file, warm_start_file + ".saved")
+                elif name == "warm" and os.path.exists(warm_start_file + ".saved"):
+                    os.rename(warm_start_file + ".saved", warm_start_file)
+                ipv4, ready, wan_stats, stale = restart(directory, {**env, "FRITZBOX_HOST": host}, deadline)
+                print(f"{name + ', FritzBox ' + fritzbox:<30} {fmt(ipv4)} {fmt(ready)} {fmt(wan_stats):>12}  {stale}")
+    finally:
+        fakes.terminate()
+        fakes.wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.5, help="Latency of the fake FritzBox per request in seconds")
+    parser.add_argument("--deadline", type=float, default=15, help="Seconds to wait for each endpoint after a restart")
+    args = parser.parse_args()
+    main(args.latency, args.deadline)
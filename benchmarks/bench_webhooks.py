@@ -0,0 +1,142 @@
+"""
+Benchmark and check of the webhook dispatcher against the fake webhook receiver (see fakes.py).
+
+Retry and coalescing: the receiver fails the first deliveries, and the IP changes four more times while
+the first change is waiting for its retry. Checks that only the latest version is delivered, and reports
+the delivery attempts and the time until it arrived.
+
+Full queue: runs fetch cycles against the fake FritzBox with a new IP on every cycle, without webhooks,
+with a receiver that fails every delivery, and with a queue of WEBHOOK_QUEUE_SIZE changes nobody takes
+from. Reports the latency of the fetch cycles, which must not grow, and checks that the full queue kept
+the latest change and delivers only that one once the dispatcher runs.
+
+Usage:
+    python benchmarks/bench_webhooks.py [--cycles 200] [--queue-size 4] [--retry-delay 0.5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# The database lives in ./data relative to the working directory, so run in a scratch directory
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(tempfile.mkdtemp(prefix="wan-ip-bench-"))
+os.makedirs("data", exist_ok=True)
+os.environ.setdefault("LOG_LEVEL", "CRITICAL")  # Every failed delivery would be logged
+os.environ["FRITZBOX_HOST"] = "127.0.0.1"
+os.environ["IP_SOURCE"] = "fritzbox"
+
+import httpx  # noqa: E402
+from app.database.database import init_db  # noqa: E402
+from app.utils import ip_fetch_and_store, webhooks  # noqa: E402
+from app.utils.ip_snapshot import IPSnapshot  # noqa: E402
+from app.utils.webhooks import WebhookDispatcher  # noqa: E402
+from fakes import WEBHOOK_PORT, start_fakes  # noqa: E402
+from harness import percentile  # noqa: E402
+
+RECEIVER_URL = f"http://127.0.0.1:{WEBHOOK_PORT}/"
+
+async def reset_receiver(fail):
+    async with httpx.AsyncClient() as client:
+        await client.delete(RECEIVER_URL, params={"fail": fail})
+
+async def receiver_state():
+    async with httpx.AsyncClient() as client:
+        return (await client.get(RECEIVER_URL)).json()
+
+async def wait_for_delivery(target, version, timeout=30):
+    start = time.perf_counter()
+    while target.delivered_version != version:
+        if time.perf_counter() - start > timeout:
+            raise AssertionError(f"version {version} not delivered within {timeout} seconds")
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - start
+
+async def check_retry_and_coalescing(failures):
+    await reset_receiver(failures)
+    dispatcher = WebhookDispatcher([RECEIVER_URL], max_retries=10, timeout=2)
+    dispatcher.start()
+    try:
+        dispatcher.enqueue(IPSnapshot(1, "198.51.100.1", None, time.time()))
+        await asyncio.sleep(0.1)  # The first delivery failed and waits for its retry
+        for version in range(2, 6):
+            dispatcher.enqueue(IPSnapshot(version, f"198.51.100.{version}", None, time.time()))
+        seconds = await wait_for_delivery(dispatcher.targets[0], 5)
+    finally:
+        await dispatcher.stop()
+    state = await receiver_state()
+    assert state["delivered"] == [5], f"expected only version 5 to be delivered, got {state['delivered']}"
+    print(
+        f"retry and coalescing: versions 1-5 with {failures} failed deliveries, delivered {state['delivered']} "
+        f"after {seconds:.2f} s and {state['attempts']} attempts"
+    )
+
+async def measure_cycles(cycles):
+    latencies = []
+    for _ in range(cycles):
+        start = time.perf_counter()
+        assert await ip_fetch_and_store.fetch_and_store_ips()
+        latencies.append(time.perf_counter() - start)
+    return sorted(latencies)
+
+async def check_full_queue(cycles, queue_size):
+    print(f"\n{'fetch cycles, new IP every cycle':<40} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+
+    def report(name, latencies):
+        print(
+            f"{name:<40} {percentile(latencies, 0.5) * 1000:>8.2f} {percentile(latencies, 0.99) * 1000:>8.2f} "
+            f"{latencies[-1] * 1000:>8.2f}"
+        )
+
+    ip_fetch_and_store.webhook_dispatcher = WebhookDispatcher([])
+    report("without webhooks", await measure_cycles(cycles))
+
+    await reset_receiver(10 ** 9)
+    dispatcher = WebhookDispatcher([RECEIVER_URL], max_retries=10, timeout=2, queue_size=queue_size)
+    ip_fetch_and_store.webhook_dispatcher = dispatcher
+    dispatcher.start()
+    try:
+        report("webhooks, every delivery fails", await measure_cycles(cycles))
+    finally:
+        await dispatcher.stop()
+
+    dispatcher = WebhookDispatcher([RECEIVER_URL], max_retries=10, timeout=2, queue_size=queue_size)
+    ip_fetch_and_store.webhook_dispatcher = dispatcher
+    report(f"webhooks, full queue of {queue_size}", await measure_cycles(cycles))
+    latest = ip_fetch_and_store.get_snapshot().version
+    assert dispatcher._queue.full(), "the queue should be full without a dispatcher"
+
+    await reset_receiver(0)
+    dispatcher.start()
+    try:
+        await wait_for_delivery(dispatcher.targets[0], latest)
+        await asyncio.sleep(0.2)  # Let a delivery of an older change show up, if there was one
+    finally:
+        await dispatcher.stop()
+    state = await receiver_state()
+    assert state["delivered"] == [latest], f"expected only version {latest} to be delivered, got {state['delivered']}"
+    print(f"full queue: delivered only the latest version {latest} once the dispatcher ran")
+
+async def main(cycles, queue_size, failures):
+    init_db()
+    await check_retry_and_coalescing(failures)
+    await check_full_queue(cycles, queue_size)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cycles", type=int, default=200, help="Fetch cycles per scenario")
+    parser.add_argument("--queue-size", type=int, default=4, help="WEBHOOK_QUEUE_SIZE of the dispatchers")
+    parser.add_argument("--failures", type=int, default=3, help="Failed deliveries before the receiver accepts")
+    parser.add_argument("--retry-delay", type=float, default=0.5, help="Delay before the first retry in seconds")
+    args = parser.parse_args()
+    webhooks.BASE_RETRY_DELAY = args.retry_delay
+
+    fakes = start_fakes(ip_change_every=1, webhook=True)
+    try:
+        asyncio.run(main(args.cycles, args.queue_size, args.failures))
+    finally:
+        fakes.terminate()
+        fakes.wait()
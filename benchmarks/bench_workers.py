@@ -0,0 +1,68 @@
+"""
+Benchmark of the API throughput with one and with several uvicorn workers.
+
+Starts the service (python -m app.main) against the fake FritzBox (see fakes.py) with WORKERS set
+to each of the given counts, and drives /ipv4 over HTTP from several client processes. Only the
+fetch leader queries the FritzBox, the other workers serve the snapshot from the shared file.
+The clients compete with the workers for the CPU, so run it on a machine with more cores than
+workers plus clients to see the scaling.
+
+Usage:
+    python benchmarks/bench_workers.py [--workers 1,2,4] [--clients 4] [--requests 5000] [--concurrency 16]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+
+import httpx
+from fakes import start_fakes
+from harness import run_scenario
+from service import start_service
+
+PORT = 9290
+
+def drive(requests, concurrency):
+    """
+    Runs one client process, returns its run_scenario result.
+    """
+    async def main():
+        limits = httpx.Limits(max_connections=concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", limits=limits) as client:
+            async def get_ipv4():
+                return (await client.get("/ipv4")).status_code == 200
+            return await run_scenario(get_ipv4, requests, concurrency)
+    return asyncio.run(main())
+
+def main(worker_counts, clients, requests, concurrency):
+    print(f"{'workers':>7} {'requests/s':>11} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for workers in worker_counts:
+        server, _ = start_service(PORT, {"WORKERS": str(workers)})
+        try:
+            time.sleep(1)  # Let all workers finish their startup
+            with multiprocessing.Pool(clients) as pool:
+                results = pool.starmap(drive, [(requests // clients, concurrency)] * clients)
+        finally:
+            server.terminate()
+            server.wait()
+
+        # The clients ran at the same time, so their throughputs add up
+        print(
+            f"{workers:>7} {sum(r['throughput_rps'] for r in results):>11.0f} {max(r['p50_ms'] for r in results):>8.2f} "
+            f"{max(r['p99_ms'] for r in results):>8.2f} {sum(r['errors'] for r in results):>7}"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="Comma separated worker counts to compare")
+    parser.add_argument("--clients", type=int, default=4, help="Client processes sending requests")
+    parser.add_argument("--requests", type=int, default=5000, help="Number of /ipv4 requests per worker count")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent requests per client process")
+    args = parser.parse_args()
+
+    fakes = start_fakes(services=0)
+    try:
+        main([int(count) for count in args.workers.split(",")], args.clients, args.requests, args.concurrency)
+    finally:
+        fakes.terminate()
+        fakes.wait()
@@ -0,0 +1,377 @@
+"""
+Local stand-ins for the FritzBox and the public IP services.
+
+The fake FritzBox answers the SOAP actions used by the app on :49000/igdupnp/control/*, the fake
+IP services answer plain text IPs on consecutive ports, optionally over TLS, and the fake name servers
+answer A, AAAA and TXT queries with the IP over UDP on consecutive ports. Latency, error rate and IP
+changes are configurable, so the benchmarks run without a router or internet access. --rtt adds the
+round trip time of a network path to the IP services: once per request, once for the TCP handshake of
+a new connection and once more for the TLS handshake.
+
+With --webhook a webhook receiver listens on :48300. It answers the first --webhook-failures POSTs
+with 503 and accepts the others. GET / returns the number of POSTs and the versions of the accepted
+deliveries, DELETE /?fail=N clears them and fails the next N POSTs.
+
+Usage:
+    python benchmarks/fakes.py [--latency 0.005] [--error-rate 0] [--ip-change-every 0] [--services 5]
+                               [--dns-services 0] [--rtt 0] [--tls-cert cert.pem --tls-key key.pem]
+                               [--webhook] [--webhook-failures 0]
+"""
+import argparse
+import json
+import random
+import socket
+import socketserver
+import ssl
+import struct
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FRITZBOX_PORT = 49000
+SERVICES_BASE_PORT = 48100
+DNS_BASE_PORT = 48200
+WEBHOOK_PORT = 48300
+
+SOAP_RESPONSE = (
+    '<?xml version="1.0"?>\n'
+    '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">'
+    '<s:Body><u:{action}Response xmlns:u="{service_type}">{fields}</u:{action}Response></s:Body>'
+    '</s:Envelope>'
+)
+
+SOAP_FAULT = (
+    '<?xml version="1.0"?>\n'
+    '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">'
+    '<s:Body><s:Fault><faultcode>s:Client</faultcode><faultstring>UPnPError</faultstring>'
+    '<detail><UPnPError xmlns="urn:schemas-upnp-org:control-1-0"><errorCode>501</errorCode>'
+    '<errorDescription>Action Failed</errorDescription></UPnPError></detail></s:Fault></s:Body>'
+    '</s:Envelope>'
+)
+
+class FakeFritzBox:
+    """
+    State of the fake FritzBox: the current IP, the connection time and the byte counters.
+    """
+
+    def __init__(self, latency=0.005, error_rate=0.0, ip_change_every=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.ip_change_every = ip_change_every
+        self.ip_requests = 0
+        self.ip_index = 1
+        self.connected_at = time.time() - 3600
+        self.reconnecting = False
+        self.lock = threading.Lock()
+
+    def fields(self, action):
+        """
+        Returns the response fields of a SOAP action.
+        """
+        now = time.time()
+        with self.lock:
+            if action == "GetExternalIPAddress":
+                self.ip_requests += 1
+                if self.ip_change_every and self.ip_requests % self.ip_change_every == 0:
+                    self.ip_index += 1
+            elif action == "ForceTermination":
+                self.connected_at = now + 2  # Reconnects after two seconds
+                self.reconnecting = True
+            if self.reconnecting and now >= self.connected_at:
+                self.reconnecting = False
+                self.ip_index += 1  # The new IP is known once the connection is up again
+            ip_index = self.ip_index
+            uptime = now - self.connected_at
+
+        if action == "GetExternalIPAddress":
+            return f"<NewExternalIPAddress>198.51.{ip_index // 256 % 256}.{ip_index % 256}</NewExternalIPAddress>"
+        if action == "X_AVM_DE_GetExternalIPv6Address":
+            return (
+                f"<NewExternalIPv6Address>2001:db8::{ip_index:x}</NewExternalIPv6Address>"
+                "<NewPrefixLength>64</NewPrefixLength><NewValidLifetime>7200</NewValidLifetime>"
+            )
+        if action == "GetStatusInfo":
+            status = "Connected" if uptime >= 0 else "Connecting"
+            return (
+                f"<NewConnectionStatus>{status}</NewConnectionStatus>"
+                f"<NewLastConnectionError>ERROR_NONE</NewLastConnectionError><NewUptime>{max(0, int(uptime))}</NewUptime>"
+            )
+        if action == "GetCommonLinkProperties":
+            return (
+                "<NewWANAccessType>DSL</NewWANAccessType><NewLayer1UpstreamMaxBitRate>40000000</NewLayer1UpstreamMaxBitRate>"
+                "<NewLayer1DownstreamMaxBitRate>250000000</NewLayer1DownstreamMaxBitRate><NewPhysicalLinkStatus>Up</NewPhysicalLinkStatus>"
+            )
+        if action == "GetTotalBytesSent":
+            return f"<NewTotalBytesSent>{int(now * 100000) % 2**32}</NewTotalBytesSent>"
+        if action == "GetTotalBytesReceived":
+            return f"<NewTotalBytesReceived>{int(now * 500000) % 2**32}</NewTotalBytesReceived>"
+        return ""
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    rtt = 0.0  # Emulated round trip time of the TCP (and TLS) handshake
+    ssl_context = None
+
+    def finish_request(self, request, client_address):
+        time.sleep(self.rtt)
+        if self.ssl_context is None:
+            return super().finish_request(request, client_address)
+        # Wrapping detaches the plain socket, the TLS socket is closed here
+        with self.ssl_context.wrap_socket(request, server_side=True) as tls_request:
+            time.sleep(self.rtt)
+            super().finish_request(tls_request, client_address)
+
+    def handle_error(self, request, client_address):
+        # Clients cancel requests on purpose (hedging, quorum reached), a closed connection is not an error
+        if not isinstance(sys.exc_info()[1], (ConnectionError, ssl.SSLError)):
+            super().handle_error(request, client_address)
+
+class FakeNameServer(socketserver.ThreadingUDPServer):
+    daemon_threads = True
+
+def fritzbox_handler(fritzbox):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # Headers and body are written separately
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            service_type, _, action = self.headers.get("SOAPAction", "").strip('"').partition("#")
+            time.sleep(fritzbox.latency)
+
+            if random.random() < fritzbox.error_rate:
+                self.reply(500, SOAP_FAULT)
+            else:
+                self.reply(200, SOAP_RESPONSE.format(action=action, service_type=service_type, fields=fritzbox.fields(action)))
+
+        def reply(self, status, body):
+            body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", 'text/xml; charset="utf-8"')
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def ip_service_handler(fritzbox, latency, error_rate):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # Headers and body are written separately
+
+        def do_GET(self):
+            time.sleep(latency)
+            if random.random() < error_rate:
+                status, body = 503, b"Service Unavailable"
+            else:
+                ip_index = fritzbox.ip_index
+                status, body = 200, f"198.51.{ip_index // 256 % 256}.{ip_index % 256}\n".encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def name_server_handler(fritzbox, latency, error_rate):
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            data, sock = self.request
+            query_id, _, questions = struct.unpack_from("!HHH", data)
+            end = 12
+            while data[end]:
+                end += 1 + data[end]
+            record_type, record_class = struct.unpack_from("!HH", data, end + 1)
+            question = data[12:end + 5]
+            time.sleep(latency)
+
+            ip_index = fritzbox.ip_index
+            if record_type == 1:
+                rdata = socket.inet_aton(f"198.51.{ip_index // 256 % 256}.{ip_index % 256}")
+            elif record_type == 28:
+                rdata = socket.inet_pton(socket.AF_INET6, f"2001:db8::{ip_index:x}")
+            else:
+                text = f"198.51.{ip_index // 256 % 256}.{ip_index % 256}".encode()
+                rdata = bytes([len(text)]) + text
+            if random.random() < error_rate:
+                answer, answers, rcode = b"", 0, 2  # SERVFAIL
+            else:
+                # The name is a pointer to the question, right after the 12 byte header
+                answer = struct.pack("!HHHIH", 0xC00C, record_type, record_class, 0, len(rdata)) + rdata
+                answers, rcode = 1, 0
+            flags = 0x8400 | rcode  # Response, authoritative
+            sock.sendto(struct.pack("!HHHHHH", query_id, flags, questions, answers, 0, 0) + question + answer, self.client_address)
+
+    return Handler
+
+def webhook_handler(latency, failures):
+    state = {"attempts": 0, "delivered": [], "fail": failures}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # Headers and body are written separately
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            time.sleep(latency)
+            with lock:
+                state["attempts"] += 1
+                failed = state["fail"] > 0
+                if failed:
+                    state["fail"] -= 1
+                else:
+                    state["delivered"].append(payload["version"])
+            self.reply(503 if failed else 204)
+
+        def do_GET(self):
+            with lock:
+                body = json.dumps({"attempts": state["attempts"], "delivered": state["delivered"]}).encode()
+            self.reply(200, body)
+
+        def do_DELETE(self):
+            fail = int(parse_qs(urlsplit(self.path).query).get("fail", ["0"])[0])
+            with lock:
+                state.update(attempts=0, delivered=[], fail=fail)
+            self.reply(204)
+
+        def reply(self, status, body=b""):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def serve(
+    latency, error_rate, ip_change_every, services, dns_services=0, rtt=0.0, tls_cert=None, tls_key=None,
+    webhook=False, webhook_failures=0,
+):
+    """
+    Runs the fake FritzBox, `services` fake IP services and `dns_services` fake name servers until interrupted.
+    The IP services and name servers report the same IP as the FritzBox, with increasing latency per service.
+    """
+    fritzbox = FakeFritzBox(latency, error_rate, ip_change_every)
+    # The name servers are bound first, start_fakes can only wait for the TCP ports
+    servers = [
+        FakeNameServer(("127.0.0.1", DNS_BASE_PORT + index), name_server_handler(fritzbox, latency * (index + 1) + rtt, error_rate))
+        for index in range(dns_services)
+    ]
+    servers.append(FakeServer(("127.0.0.1", FRITZBOX_PORT), fritzbox_handler(fritzbox)))
+    ssl_context = None
+    if tls_cert:
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(tls_cert, tls_key)
+    for index in range(services):
+        handler = ip_service_handler(fritzbox, latency * (index + 1) + rtt, error_rate)
+        server = FakeServer(("127.0.0.1", SERVICES_BASE_PORT + index), handler)
+        server.rtt = rtt
+        server.ssl_context = ssl_context
+        servers.append(server)
+    if webhook:
+        servers.append(FakeServer(("127.0.0.1", WEBHOOK_PORT), webhook_handler(latency, webhook_failures)))
+
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(
+        f"Fake FritzBox on :{FRITZBOX_PORT}, {services} fake IP services on :{SERVICES_BASE_PORT}+, "
+        f"{dns_services} fake name servers on :{DNS_BASE_PORT}+",
+        flush=True,
+    )
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+def fake_ip_services(services, tls=False):
+    """
+    Returns IP_SERVICES entries pointing to the fake IP services, over HTTPS if they were started with a certificate.
+    """
+    scheme = "https" if tls else "http"
+    return [
+        {"name": f"fake-{index}", "url": f"{scheme}://127.0.0.1:{SERVICES_BASE_PORT + index}/"}
+        for index in range(services)
+    ]
+
+def fake_dns_services(services, record_type="A"):
+    """
+    Returns DNS_SERVICES entries pointing to the fake name servers.
+    """
+    return [
+        {
+            "name": f"fake-dns-{index}",
+            "dns": {"query": "myip.example", "type": record_type, "server": "127.0.0.1", "port": DNS_BASE_PORT + index},
+        }
+        for index in range(services)
+    ]
+
+def start_fakes(
+    latency=0.005, error_rate=0.0, ip_change_every=0, services=5, timeout=10,
+    dns_services=0, rtt=0.0, tls_cert=None, tls_key=None, webhook=False, webhook_failures=0,
+):
+    """
+    Starts the fake servers in a separate process, so they don't compete with the benchmark for the GIL.
+
+    Returns:
+        subprocess.Popen: The server process, terminate it when done.
+
+    Raises:
+        RuntimeError: If the servers don't accept connections within `timeout` seconds.
+    """
+    arguments = [
+        sys.executable, __file__,
+        "--latency", str(latency), "--error-rate", str(error_rate),
+        "--ip-change-every", str(ip_change_every), "--services", str(services),
+        "--dns-services", str(dns_services), "--rtt", str(rtt),
+    ]
+    if tls_cert:
+        arguments += ["--tls-cert", tls_cert, "--tls-key", tls_key]
+    if webhook:
+        arguments += ["--webhook", "--webhook-failures", str(webhook_failures)]
+    process = subprocess.Popen(arguments, stdout=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + timeout
+    ports = [FRITZBOX_PORT] + [SERVICES_BASE_PORT + index for index in range(services)] + ([WEBHOOK_PORT] if webhook else [])
+    while ports:
+        try:
+            socket.create_connection(("127.0.0.1", ports[0]), timeout=0.1).close()
+            ports.pop(0)
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.terminate()
+                raise RuntimeError(f"Fake servers did not start (is port {ports[0]} in use?)")
+            time.sleep(0.05)
+    return process
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.005, help="Response delay of the FritzBox in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with an error (0-1)")
+    parser.add_argument("--ip-change-every", type=int, default=0, help="Change the IP every N IPv4 requests (0 = never)")
+    parser.add_argument("--services", type=int, default=5, help="Number of fake IP services")
+    parser.add_argument("--dns-services", type=int, default=0, help="Number of fake name servers")
+    parser.add_argument("--rtt", type=float, default=0.0, help="Emulated round trip time to the IP services in seconds")
+    parser.add_argument("--tls-cert", help="Certificate (PEM) to serve the IP services over HTTPS")
+    parser.add_argument("--tls-key", help="Private key (PEM) of the certificate")
+    parser.add_argument("--webhook", action="store_true", help="Start the fake webhook receiver")
+    parser.add_argument("--webhook-failures", type=int, default=0, help="Answer the first N webhook deliveries with 503")
+    args = parser.parse_args()
+    serve(
+        args.latency, args.error_rate, args.ip_change_every, args.services,
+        args.dns_services, args.rtt, args.tls_cert, args.tls_key, args.webhook, args.webhook_failures,
+    )
@@ -0,0 +1,59 @@
+"""
+Helpers to run an operation under concurrent load and summarize the latencies.
+"""
+import asyncio
+import resource
+import sys
+import time
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def max_rss_mib():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+async def run_scenario(operation, requests, concurrency):
+    """
+    Runs `operation` `requests` times with the given concurrency.
+
+    Args:
+        operation (callable): Coroutine function, returns False (or raises) if the call failed.
+        requests (int): The total number of calls.
+        concurrency (int): The number of concurrent callers.
+
+    Returns:
+        dict: Throughput, latency percentiles in milliseconds, error count and peak RSS.
+    """
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                ok = await operation()
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if ok is False:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(requests / duration, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "max_rss_mib": round(max_rss_mib(), 1),
+    }
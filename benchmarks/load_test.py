@@ -0,0 +1,126 @@
+"""
+Load test of the fetch paths and the API against local fake servers.
+
+Starts the fake FritzBox and IP services (see fakes.py), then drives fetch_and_store_ips,
+get_public_ip, get_wan_statistics and the FastAPI endpoints with concurrent requests and
+reports throughput, p50/p99 latency and memory per scenario.
+
+Use --json to store the results and --compare to print the change against a stored run:
+    python benchmarks/load_test.py --json before.json
+    python benchmarks/load_test.py --compare before.json
+
+Usage:
+    python benchmarks/load_test.py [--requests 2000] [--concurrency 32] [--latency 0.005]
+                                   [--error-rate 0] [--ip-change-every 10] [--json FILE] [--compare FILE]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+# The database lives in ./data relative to the working directory, so run in a scratch directory
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+WORKING_DIR = os.getcwd()  # --json and --compare paths are relative to where the script was started
+os.chdir(tempfile.mkdtemp(prefix="wan-ip-bench-"))
+os.makedirs("data", exist_ok=True)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["FRITZBOX_HOST"] = "127.0.0.1"
+os.environ["IP_SOURCE"] = "fritzbox"
+
+from app.api.api import app  # noqa: E402
+from app.database.database import init_db  # noqa: E402
+from app.fritzbox.get_wan_statistics import get_wan_statistics  # noqa: E402
+from app.ip_fetcher import ip_fetcher_public  # noqa: E402
+from app.ip_fetcher.ip_fetcher_public import get_public_ip  # noqa: E402
+from app.utils.ip_fetch_and_store import fetch_and_store_ips  # noqa: E402
+from asgi_driver import call  # noqa: E402
+from fakes import fake_ip_services, start_fakes  # noqa: E402
+from harness import run_scenario  # noqa: E402
+
+def endpoint(path):
+    async def operation():
+        return await call(app, path) == 200
+    return operation
+
+async def public_ip():
+    ip, _ = await get_public_ip()
+    return ip is not None
+
+async def wan_statistics():
+    return "error" not in await get_wan_statistics()
+
+# Name -> (operation, share of the requests). The fetch paths hit the fake servers and are run less often.
+SCENARIOS = {
+    "fetch_and_store_ips": (fetch_and_store_ips, 0.25),
+    "get_public_ip": (public_ip, 0.25),
+    "get_wan_statistics": (wan_statistics, 1),
+    "GET /ips": (endpoint("/ips"), 1),
+    "GET /ipv4": (endpoint("/ipv4"), 1),
+    "GET /ips/history": (endpoint("/ips/history"), 1),
+    "GET /wan-stats": (endpoint("/wan-stats"), 1),
+    "GET /metrics": (endpoint("/metrics"), 0.25),
+}
+
+async def main(requests, concurrency):
+    init_db()
+    ip_fetcher_public.IP_SERVICES[:] = fake_ip_services(5)
+
+    results = {}
+    for name, (operation, share) in SCENARIOS.items():
+        results[name] = await run_scenario(operation, max(concurrency, int(requests * share)), concurrency)
+        result = results[name]
+        print(
+            f"{name:<22} {result['throughput_rps']:>10.0f} req/s   p50 {result['p50_ms']:>8.2f} ms   "
+            f"p99 {result['p99_ms']:>8.2f} ms   errors {result['errors']:>5}   max RSS {result['max_rss_mib']:>6.1f} MiB"
+        )
+    return results
+
+def compare(results, baseline):
+    """
+    Prints the change of throughput and p99 latency against a previous run.
+    """
+    print(f"\n{'scenario':<22} {'throughput':>12} {'p99':>10}")
+    for name, result in results.items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        throughput = (result["throughput_rps"] / before["throughput_rps"] - 1) * 100
+        p99 = (result["p99_ms"] / before["p99_ms"] - 1) * 100 if before["p99_ms"] else 0.0
+        print(f"{name:<22} {throughput:>+11.1f}% {p99:>+9.1f}%")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per API scenario")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent callers")
+    parser.add_argument("--latency", type=float, default=0.005, help="Response delay of the fake FritzBox in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of failing fake responses (0-1)")
+    parser.add_argument("--ip-change-every", type=int, default=10, help="Change the IP every N IPv4 requests (0 = never)")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Compare the results with a previous --json file")
+    args = parser.parse_args()
+
+    fakes = start_fakes(args.latency, args.error_rate, args.ip_change_every)
+    try:
+        results = asyncio.run(main(args.requests, args.concurrency))
+    finally:
+        fakes.terminate()
+        fakes.wait()
+
+    output = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": vars(args),
+        "scenarios": results,
+    }
+    if args.json:
+        with open(os.path.join(WORKING_DIR, args.json), "w") as file:
+            json.dump(output, file, indent=2)
+    if args.compare:
+        with open(os.path.join(WORKING_DIR, args.compare)) as file:
+            compare(results, json.load(file))
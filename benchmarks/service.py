@@ -0,0 +1,59 @@
+"""
+Runs the service itself (python -m app.main) in a subprocess, for the benchmarks that need a real HTTP server.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def start_service(port, env=None, timeout=60, directory=None):
+    """
+    Starts the service on 127.0.0.1:`port` in a scratch directory, against the fake FritzBox (see fakes.py),
+    and waits until it serves an IPv4 address.
+
+    Args:
+        port (int): The API port.
+        env (dict): Additional environment variables, e.g. {"WORKERS": "2"}.
+        timeout (float): Seconds to wait for the first IPv4 address.
+        directory (str): Working directory of a previous run to restart in, a new one by default.
+
+    Returns:
+        tuple: The server process (terminate it when done) and its working directory.
+
+    Raises:
+        RuntimeError: If the service does not serve an IPv4 address within `timeout` seconds.
+    """
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix="wan-ip-bench-")
+        os.makedirs(os.path.join(directory, "data"))
+    env = {
+        **os.environ,
+        "PYTHONPATH": REPO_ROOT,
+        "API_HOST": "127.0.0.1",
+        "API_PORT": str(port),
+        "FRITZBOX_HOST": "127.0.0.1",
+        "IP_SOURCE": "fritzbox",
+        "LOG_LEVEL": "WARNING",
+        **(env or {}),
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "app.main"], cwd=directory, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if "ipv4" in httpx.get(f"http://127.0.0.1:{port}/ipv4").json():
+                return process, directory
+        except httpx.HTTPError:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError(f"The service did not start (is port {port} in use?)")